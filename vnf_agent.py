@@ -1,10 +1,29 @@
 import os
+import hashlib
 import json
 import re
-from typing import List, Dict, Any
-from openai import OpenAI
+import sys
+import asyncio
+import threading
+from datetime import datetime, timezone
+from functools import partial
+from typing import List, Dict, Any, Tuple
 from dotenv import load_dotenv
 
+from vnf_archive import ARCHIVE_READERS, ArchiveError
+from vnf_cache import llm_cache_key, open_llm_cache, open_tool_cache, open_tool_stats, tool_cache_key
+from vnf_executor import ToolExecutor, load_timeouts
+from vnf_http import PRECONNECT, apreconnect, async_http_client, http_client, preconnect
+from vnf_log import log
+from vnf_manifest import verify_manifest
+from vnf_package import ARTIFACTS, PackageContext, artifact_closure
+from vnf_endpoints import EndpointPool
+from vnf_ratelimit import estimate_tokens
+from vnf_resilience import CircuitOpenError, LLMGuard
+from vnf_secrets import scan_archive
+from vnf_trust import trust_store
+from vnf_vnfd import VnfdError
+
 # --- 1. SETUP: Point the client to the local Ollama server ---
 load_dotenv()
 
@@ -13,57 +32,491 @@ MODEL_NAME = os.getenv("VNF_AGENT_MODEL", "phi3")
 
 # OpenAI (public) defaults
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 
 # Azure OpenAI
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 
+# Directory searched for package files named in goals (besides the path as given)
+PACKAGE_DIR = os.getenv("VNF_PACKAGE_DIR", ".")
+# Verify the per-file digests listed in the SOL004 manifest during the structure check
+VERIFY_DIGESTS = os.getenv("VNF_AGENT_VERIFY_DIGESTS", "1").lower() not in {"0", "off", "false", "no"}
+# Reject packages whose manifest is not signed by a certificate chaining to VNF_AGENT_TRUST_ANCHORS
+REQUIRE_SIGNATURE = os.getenv("VNF_AGENT_REQUIRE_SIGNATURE", "0").lower() in {"1", "on", "true", "yes"}
+# Known vulnerabilities at or above this severity (low, moderate, high, critical) fail check_vulnerabilities
+CVE_FAIL_SEVERITY = os.getenv("VNF_AGENT_CVE_FAIL_SEVERITY", "high").lower()
+# Total size of VM images a package may carry
+MAX_IMAGE_GB = float(os.getenv("VNF_AGENT_MAX_IMAGE_GB", "200"))
+IMAGE_SUFFIXES = (".qcow2", ".img", ".vmdk", ".vhd", ".vhdx", ".iso", ".raw", ".ova")
+
 # Ollama
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
 OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "ollama")  # dummy key
 
-if PROVIDER == 'openai':
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY not set for provider=openai")
-    client = OpenAI(api_key=OPENAI_API_KEY)
-elif PROVIDER == 'azure':
-    if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY):
-        raise RuntimeError("AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY must be set for provider=azure")
-    client = OpenAI(
-        api_key=AZURE_OPENAI_API_KEY,
-        base_url=f"{AZURE_OPENAI_ENDPOINT.rstrip('/')}/openai/deployments"
-    )
-elif PROVIDER == 'ollama':
-    client = OpenAI(base_url=OLLAMA_BASE_URL, api_key=OLLAMA_API_KEY)
-else:
+
+def _split(value: str | None) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def _with_keys(provider: str, urls: List[str], keys: List[str]) -> List[Dict[str, Any]]:
+    """Pair endpoint URLs with API keys: one key for all of them, or one key per URL."""
+    if len(keys) == 1:
+        keys = keys * len(urls)
+    if len(keys) != len(urls):
+        raise RuntimeError(f"Give one API key, or one per endpoint ({len(urls)}), for provider={provider}")
+    return [{"api_key": key, "base_url": url} for url, key in zip(urls, keys)]
+
+
+def _endpoint_settings() -> List[Dict[str, Any]]:
+    """OpenAI client settings for each endpoint of PROVIDER (several, comma-separated, form a load-balanced pool).
+
+    Raises RuntimeError if PROVIDER is unknown or incompletely configured.
+    """
+    if PROVIDER == 'openai':
+        if not OPENAI_API_KEY:
+            raise RuntimeError("OPENAI_API_KEY not set for provider=openai")
+        return _with_keys(PROVIDER, _split(OPENAI_BASE_URL), _split(OPENAI_API_KEY))
+    if PROVIDER == 'azure':
+        if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY):
+            raise RuntimeError("AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY must be set for provider=azure")
+        return _with_keys(PROVIDER, [f"{endpoint.rstrip('/')}/openai/deployments"
+                                     for endpoint in _split(AZURE_OPENAI_ENDPOINT)], _split(AZURE_OPENAI_API_KEY))
+    if PROVIDER == 'ollama':
+        return _with_keys(PROVIDER, _split(OLLAMA_BASE_URL), [OLLAMA_API_KEY])
     raise RuntimeError(f"Unsupported PROVIDER={PROVIDER}")
 
+
+def _client_kwargs(base_url: str | None = None) -> Dict[str, Any]:
+    """OpenAI client settings for the endpoint at ``base_url`` (default: the first one)."""
+    for kwargs in _endpoint_settings():
+        if base_url is None or kwargs["base_url"] == base_url:
+            return kwargs
+    raise RuntimeError(f"{base_url} is not an endpoint of provider={PROVIDER}")
+
+
+# Built on first use: runs that never reach the LLM (rule-based plans, template reports, worker
+# processes) neither import the openai SDK nor need provider credentials. Every client sends its
+# requests through the pooled connections of vnf_http.
+_clients: Dict[Tuple[str, str, Any], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(kind: str, base_url: str | None = None):
+    # An async client's connections belong to the event loop that opened them, so each loop gets its own
+    loop = None
+    if kind == "async":
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+    if base_url is None:
+        base_url = _client_kwargs()["base_url"]
+    client = _clients.get((kind, base_url, loop))
+    if client is None:
+        with _clients_lock:
+            client = _clients.get((kind, base_url, loop))
+            if client is None:
+                # No retries inside the SDK: the endpoint's limiter has to see every 429/503 to adapt to them
+                kwargs = dict(_client_kwargs(base_url), max_retries=0)
+                import openai
+                if kind == "async":
+                    for stale in [k for k in _clients if k[2] is not None and k[2].is_closed()]:
+                        del _clients[stale]
+                    client = openai.AsyncOpenAI(**kwargs, http_client=async_http_client(kwargs["base_url"]))
+                else:
+                    client = openai.OpenAI(**kwargs, http_client=http_client(kwargs["base_url"]))
+                _clients[(kind, base_url, loop)] = client
+    return client
+
+
+def get_client(base_url: str | None = None):
+    """The shared OpenAI client for the PROVIDER endpoint at ``base_url`` (default: the first)."""
+    return _get_client("sync", base_url)
+
+
+def get_async_client(base_url: str | None = None):
+    """The AsyncOpenAI client for the PROVIDER endpoint at ``base_url`` on the running event loop."""
+    return _get_client("async", base_url)
+
+
+def _uses_llm(plan_strategy: str, summary_mode: str) -> bool:
+    return plan_strategy != "rules" or summary_mode != "template"
+
+
+def _preconnect_llm() -> None:
+    """Open connections to the LLM endpoints in the background, while the first tools run.
+
+    The SDK is imported here, before the thread starts: imported concurrently with the main thread's
+    cache lookups (which load openai.types.chat), a half-initialized package fails those lookups.
+    """
+    if PRECONNECT <= 0:
+        return
+    try:
+        settings = _endpoint_settings()
+    except RuntimeError as e:
+        log(f"WARN: Not pre-connecting to the LLM: {e}")
+        return
+    get_client()
+    import openai.types.chat  # noqa: F401 (what _cached_response loads)
+
+    def run():
+        for kwargs in settings:
+            preconnect(kwargs["base_url"])
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+async def _apreconnect_llm() -> None:
+    """Async counterpart of _preconnect_llm, for the running event loop's connections."""
+    if PRECONNECT <= 0:
+        return
+    try:
+        settings = _endpoint_settings()
+    except RuntimeError as e:
+        log(f"WARN: Not pre-connecting to the LLM: {e}")
+        return
+    await asyncio.gather(*(apreconnect(kwargs["base_url"]) for kwargs in settings))
+
+
+# Opened on first use, so importing the module (as every tool worker process does) creates no files:
+# llm_cache answers identical planning/summary prompts (CI retries, re-submitted packages) from disk,
+# tool_cache holds tool outputs keyed by (tool, tool version, package content hash and name), and
+# tool_stats the measured duration and rejection rate of each tool, which set the fail-fast order
+STORES = {"llm_cache": open_llm_cache, "tool_cache": open_tool_cache, "tool_stats": open_tool_stats}
+_stores: Dict[str, Any] = {}
+_stores_lock = threading.Lock()
+
+
+def _store(name: str) -> Any:
+    """The named entry of STORES, opened on first use; None when disabled."""
+    if name not in _stores:
+        with _stores_lock:
+            if name not in _stores:
+                _stores[name] = STORES[name]()
+    return _stores[name]
+
+
+# Raised for a configured data file (zone limits, NFVI inventory, trust store, CVE index) that is missing
+# or malformed; the checks reading it report the error as a failure rather than crash the run
+CONFIG_ERRORS = (OSError, ValueError)
+
+
+def _config_error(setting: str, e: Exception) -> str:
+    """Reason a check gives when the file named in the ``setting`` environment variable cannot be loaded."""
+    detail = e.strerror if isinstance(e, OSError) and e.strerror else e
+    return f"{setting} file '{os.getenv(setting)}' cannot be loaded ({detail}); check not performed."
+
+
+# Per-zone VDU/flavour limits (JSON file named in VNF_AGENT_ZONE_LIMITS, see vnf_resources.zone_limits)
+_zone_limits: Dict[str, Any] = {}
+
+
+def get_zone_limits():
+    """The configured ZoneLimits, read on first use. Raises one of CONFIG_ERRORS for an unreadable file."""
+    if "limits" not in _zone_limits:
+        from vnf_resources import load_zone_limits
+        _zone_limits["limits"] = load_zone_limits()
+    return _zone_limits["limits"]
+
+
+def __getattr__(name: str) -> Any:
+    # ``client`` and ``async_client`` used to be module attributes built at import time, as were the stores
+    if name == "client":
+        return get_client()
+    if name == "async_client":
+        return get_async_client()
+    if name in STORES:
+        return _store(name)
+    if name == "ZONE_LIMITS":
+        return get_zone_limits()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# The provider's endpoints, each with its own limits on requests/tokens per minute and requests in flight
+llm_endpoints = EndpointPool.from_env(PROVIDER, lambda: [kwargs["base_url"] for kwargs in _endpoint_settings()])
+# Retries, hedging and the circuit breaker in front of llm_endpoints; every LLM call goes through it
+llm_guard = LLMGuard.from_env(llm_endpoints)
+
 # --- 2. DEFINE THE AGENT'S TOOLS (No changes here) ---
-def check_vnf_package_structure(file_name: str):
-    """Tool 1: Checks VNF package name and extension (.zip)."""
-    print(f"--- TOOL LOG: Running check_vnf_package_structure on '{file_name}'...")
-    if not file_name.endswith(".zip"):
-        return json.dumps({"is_valid": False, "reason": "Invalid file extension. Expected .zip."})
-    if len(file_name.removesuffix(".zip").split('_')) < 3:
-        return json.dumps({"is_valid": False, "reason": "Naming convention violation. Expected: vendor_name_version.zip."})
-    return json.dumps({"is_valid": True, "reason": "Package structure and naming are valid."})
-
-def check_security_compliance(file_name: str):
-    """Tool 2: Simulates a security check for trusted vendors."""
-    print(f"--- TOOL LOG: Running check_security_compliance for '{file_name}'...")
-    vendor = file_name.split('_')[0]
-    trusted_vendors = ["cisco", "juniper", "paloalto"]
-    if vendor.lower() in trusted_vendors:
-        return json.dumps({"is_compliant": True, "reason": f"Vendor '{vendor}' is trusted."})
-    return json.dumps({"is_compliant": False, "reason": f"Vendor '{vendor}' is not trusted."})
-
-def check_resource_requirements(file_name: str):
-    """Tool 3: Simulates checking resource limits from the package."""
-    print(f"--- TOOL LOG: Running check_resource_requirements for '{file_name}'...")
-    if "highcpu" in file_name.lower():
-        return json.dumps({"is_within_limits": False, "reason": "VNF requires high CPU (32 cores), exceeding standard limit."})
+def _context(file_name: str) -> PackageContext:
+    return PackageContext(file_name, PACKAGE_DIR, digest_store=_store("tool_cache"), artifacts=PACKAGE_ARTIFACTS)
+
+
+def check_vnf_package_structure(file_name: str, ctx: PackageContext | None = None):
+    """Tool 1: Checks VNF package name and archive format and, if the archive is available, its ETSI SOL004 layout."""
+    log(f"--- TOOL LOG: Running check_vnf_package_structure on '{file_name}'...")
+    ctx = ctx or _context(file_name)
+    suffix = ctx.suffix
+    if suffix is None:
+        return json.dumps({"is_valid": False, "reason": f"Invalid file extension. Expected one of: {', '.join(ARCHIVE_READERS)}."})
+    if len(ctx.name_parts) < 3:
+        return json.dumps({"is_valid": False, "reason": f"Naming convention violation. Expected: vendor_name_version{suffix}."})
+    try:
+        reader = ctx.archive
+    except ArchiveError as e:
+        return json.dumps({"is_valid": False, "reason": f"Unreadable package archive: {e}", "layout_inspected": False})
+    if reader is None:
+        return json.dumps({"is_valid": True, "reason": "Package structure and naming are valid.", "layout_inspected": False})
+    layout = ctx.layout
+    if layout["problems"]:
+        return json.dumps({"is_valid": False, "reason": "SOL004 layout violation: " + " ".join(layout["problems"]),
+                           "layout_inspected": True, "layout": layout})
+    digests = ctx.artifact("digests")
+    if digests is None:
+        return json.dumps({"is_valid": True, "reason": "Package naming and SOL004 layout are valid.",
+                           "layout_inspected": True, "layout": layout})
+    if digests["failures"]:
+        failed = ", ".join(f"{f['source']} ({f['status']})" for f in digests["failures"][:5])
+        return json.dumps({"is_valid": False, "reason": f"Manifest digest verification failed: {failed}.",
+                           "layout_inspected": True, "layout": layout, "digests": digests})
+    return json.dumps({"is_valid": True, "reason": "Package naming, SOL004 layout and manifest digests are valid.",
+                       "layout_inspected": True, "layout": layout, "digests": digests})
+
+def check_security_compliance(file_name: str, ctx: PackageContext | None = None):
+    """Tool 2: Checks that the package vendor is trusted, matches the manifest provider and signed the manifest."""
+    log(f"--- TOOL LOG: Running check_security_compliance for '{file_name}'...")
+    ctx = ctx or _context(file_name)
+    vendor = ctx.vendor
+    try:
+        store = trust_store()
+    except CONFIG_ERRORS as e:
+        return json.dumps({"is_compliant": False, "reason": _config_error("VNF_AGENT_TRUST_STORE", e)})
+    decision = store.check(vendor, ctx.product)
+    if not decision.trusted:
+        return json.dumps({"is_compliant": False, "reason": decision.reason})
+    try:
+        manifest = ctx.manifest
+        signature = ctx.artifact("signature")
+    except ArchiveError as e:
+        return json.dumps({"is_compliant": False, "reason": f"Unreadable package archive: {e}"})
+    if manifest:
+        metadata = manifest["metadata"]
+        provider = metadata.get("vnf_provider_id") or metadata.get("vnfd_provider")
+        if provider and not store.same_vendor(vendor, provider):
+            return json.dumps({"is_compliant": False,
+                               "reason": f"File name claims vendor '{vendor}' but the manifest declares provider '{provider}'."})
+    if signature["status"] == "invalid" or (REQUIRE_SIGNATURE and signature["status"] != "verified"):
+        return json.dumps({"is_compliant": False, "reason": signature["reason"], "signature": signature})
+    signer = signature.get("organization")
+    if signature["status"] == "verified" and signer and not store.same_vendor(vendor, signer):
+        return json.dumps({"is_compliant": False, "signature": signature,
+                           "reason": f"File name claims vendor '{vendor}' but the manifest is signed by '{signer}'."})
+    return json.dumps({"is_compliant": True, "reason": f"{decision.reason} {signature['reason']}", "signature": signature})
+
+def _manifest_digests(ctx: PackageContext) -> Dict[str, Any] | None:
+    """verify_manifest report, or None unless VERIFY_DIGESTS is on and the package name and layout are valid."""
+    layout = ctx.layout
+    if not VERIFY_DIGESTS or ctx.suffix is None or len(ctx.name_parts) < 3 or not layout or layout["problems"]:
+        return None
+
+    def progress(done, total, res):
+        log(f"--- TOOL LOG: [{done}/{total}] {res['source']}: {res['status']}")
+
+    return verify_manifest(ctx.archive, ctx.manifest, progress=progress)
+
+def _package_signature(ctx: PackageContext) -> Dict[str, Any]:
+    """Result of verify_manifest_signature for the package's manifest. Raises ArchiveError."""
+    from vnf_signature import chain_validator, verify_manifest_signature
+    layout = ctx.layout
+    if not layout or not layout.get("manifest"):
+        return {"status": "unsigned", "reason": "No manifest to verify."}
+    reader = ctx.archive
+    certificate = reader.read(layout["certificate"]) if layout.get("certificate") else b""
+    return verify_manifest_signature(reader.read(layout["manifest"]), certificate, chain_validator())
+
+# vnf_package.ARTIFACTS plus the artifacts computed with the agent's configuration: name -> (inputs, producer)
+PACKAGE_ARTIFACTS = dict(ARTIFACTS, digests=(("layout", "manifest"), _manifest_digests),
+                         signature=(("layout",), _package_signature))
+
+def _image_bytes(reader) -> int:
+    return sum(m.size for m in reader.members.values() if m.name.lower().endswith(IMAGE_SUFFIXES))
+
+def _resource_violations(flavours: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Limits the VDUs and flavours exceed in every zone of get_zone_limits(); none if the package fits one zone.
+
+    Evaluated like evaluate_resource_batch, so both give the same verdict.
+    """
+    from vnf_resources import RESOURCES, evaluate_batch, pack_vdus
+    limits = get_zone_limits()
+    batch = pack_vdus({"": flavours})
+    verdict = evaluate_batch(batch, limits)
+    if not batch.packages or verdict["package_ok"][0].any():
+        return []
+    violations = []
+    for z, zone in enumerate(limits.zones):
+        where = f"Zone '{zone}': " if len(limits.zones) > 1 else ""
+        for (_, flavour_id, vdu), over in zip(batch.vdus, verdict["vdu_over"][:, z]):
+            for r in over.nonzero()[0]:
+                needs = flavours[flavour_id]["vdus"][vdu][RESOURCES[r]]
+                violations.append(f"{where}VDU '{vdu}' (flavour '{flavour_id}') needs {needs:g} {RESOURCES[r]}, "
+                                  f"limit {limits.vdu[z, r]:g}.")
+        for (_, flavour_id), total, over in zip(batch.flavours, verdict["totals"], verdict["flavour_over"][:, z]):
+            for r in over.nonzero()[0]:
+                violations.append(f"{where}Flavour '{flavour_id}' needs {total[r]:g} {RESOURCES[r]} in total, "
+                                  f"limit {limits.flavour[z, r]:g}.")
+    return violations
+
+def _check_capacity(inventory, flavours: Dict[str, Dict[str, Any]], totals: Dict[str, Any]) -> str:
+    """Within limits only if some flavour's initial deployment fits the free NFVI capacity."""
+    from vnf_capacity import simulate_placement
+    placements = {flavour_id: simulate_placement(inventory, flavour) for flavour_id, flavour in flavours.items()}
+    report = {flavour_id: {k: v for k, v in p.items() if k != "placement"} for flavour_id, p in placements.items()}
+    fitting = [f for f, p in placements.items() if p["verdict"] == "fits"]
+    if fitting:
+        reason = f"Flavour '{fitting[0]}' fits the free capacity of NFVI zone(s): {', '.join(placements[fitting[0]]['zones'])}."
+        return json.dumps({"is_within_limits": True, "reason": reason, "flavours": totals, "capacity": report})
+    scaled = [f for f, p in placements.items() if p["verdict"] == "fits_at_level"]
+    if scaled:
+        p = placements[scaled[0]]
+        reason = (f"Initial deployment does not fit the free NFVI capacity; flavour '{scaled[0]}' fits only at "
+                  f"instantiation level '{p['level']}' (zone {p['zones'][0]}).")
+    else:
+        reason = "VNF does not fit the free capacity of any NFVI zone."
+    return json.dumps({"is_within_limits": False, "reason": reason, "flavours": totals, "capacity": report})
+
+def check_resource_requirements(file_name: str, ctx: PackageContext | None = None):
+    """Tool 3: Checks that the VNFD's per-VDU and per-flavour needs fit the limits of some NFVI zone and the VM image size is within limits."""
+    log(f"--- TOOL LOG: Running check_resource_requirements for '{file_name}'...")
+    from vnf_capacity import load_inventory
+    for setting, load in (("VNF_AGENT_ZONE_LIMITS", get_zone_limits), ("VNF_AGENT_NFVI_INVENTORY", load_inventory)):
+        try:
+            load()
+        except CONFIG_ERRORS as e:
+            return json.dumps({"is_within_limits": False, "reason": _config_error(setting, e)})
+    ctx = ctx or _context(file_name)
+    try:
+        reader = ctx.archive
+        flavours = ctx.resources if reader is not None else None
+    except (ArchiveError, VnfdError) as e:
+        return json.dumps({"is_within_limits": False, "reason": f"Unreadable package: {e}"})
+    if flavours is None:
+        # No descriptor to read: fall back to the naming hint
+        if "highcpu" in file_name.lower():
+            return json.dumps({"is_within_limits": False, "reason": "VNF requires high CPU (32 cores), exceeding standard limit."})
+    else:
+        violations = _resource_violations(flavours)
+        totals = {flavour_id: f["totals"] for flavour_id, f in flavours.items()}
+        if violations:
+            return json.dumps({"is_within_limits": False, "reason": " ".join(violations[:5]), "flavours": totals})
+    if reader is not None:
+        image_bytes = _image_bytes(reader)
+        if image_bytes > MAX_IMAGE_GB * 1024 ** 3:
+            return json.dumps({"is_within_limits": False,
+                               "reason": f"VM images total {image_bytes / 1024 ** 3:.1f} GB, exceeding the {MAX_IMAGE_GB:g} GB limit."})
+    inventory = load_inventory()
+    if flavours and inventory is not None:
+        return _check_capacity(inventory, flavours, totals)
+    if flavours:
+        return json.dumps({"is_within_limits": True,
+                           "reason": f"VNFD resource requirements of {len(flavours)} flavour(s) are within standard limits.",
+                           "flavours": totals})
     return json.dumps({"is_within_limits": True, "reason": "Resource requirements are within standard limits."})
 
+def evaluate_resource_batch(file_names: List[str], limits=None) -> Dict[str, Dict[str, Any]]:
+    """Resource verdicts for many packages in one vectorized pass, per NFVI zone (see vnf_resources).
+
+    A package is within limits if it fits at least one zone and, with an NFVI inventory configured,
+    the free capacity (see _check_capacity); ``zones`` lists the zones it fits. Packages without a
+    readable VNFD, and all packages when the zone limits or the inventory cannot be loaded, get the
+    result of check_resource_requirements.
+    """
+    import numpy as np
+    from vnf_capacity import load_inventory
+    from vnf_resources import evaluate_batch, pack_vdus
+    try:
+        limits = limits or get_zone_limits()
+        inventory = load_inventory()
+    except CONFIG_ERRORS:
+        return {name: json.loads(check_resource_requirements(name)) for name in file_names}
+    results: Dict[str, Dict[str, Any]] = {}
+    resources, image_bytes = {}, {}
+    for name in dict.fromkeys(file_names):
+        ctx = _context(name)
+        try:
+            reader = ctx.archive
+            flavours = ctx.resources if reader is not None else None
+        except (ArchiveError, VnfdError):
+            flavours = None
+        if flavours:
+            resources[name], image_bytes[name] = flavours, _image_bytes(reader)
+        else:
+            results[name] = json.loads(check_resource_requirements(name, ctx))
+
+    batch = pack_vdus(resources)
+    verdict = evaluate_batch(batch, limits)
+    images_ok = np.array([image_bytes[p] for p in batch.packages], dtype=np.float64) <= MAX_IMAGE_GB * 1024 ** 3
+    fits = verdict["package_ok"] & images_ok[:, None]
+    log(f"--- TOOL LOG: Evaluated {len(batch.vdus)} VDUs of {len(batch.packages)} packages against {len(limits.zones)} zone(s).")
+    for i, name in enumerate(batch.packages):
+        zones = [zone for zone, ok in zip(limits.zones, fits[i]) if ok]
+        if zones:
+            reason = f"Within limits in zone(s): {', '.join(zones)}."
+        elif not images_ok[i]:
+            reason = f"VM images total {image_bytes[name] / 1024 ** 3:.1f} GB, exceeding the {MAX_IMAGE_GB:g} GB limit."
+        else:
+            reason = "VDU or flavour resource needs exceed the limits of every zone."
+        results[name] = {"is_within_limits": bool(zones), "reason": reason, "zones": zones}
+        if zones and inventory is not None:
+            totals = {flavour_id: f["totals"] for flavour_id, f in resources[name].items()}
+            results[name] = dict(json.loads(_check_capacity(inventory, resources[name], totals)), zones=zones)
+    return {name: results[name] for name in file_names}
+
+def check_embedded_secrets(file_name: str, ctx: PackageContext | None = None):
+    """Tool 4: Scans the package's text members for embedded private keys, default passwords and cloud tokens."""
+    log(f"--- TOOL LOG: Running check_embedded_secrets for '{file_name}'...")
+    ctx = ctx or _context(file_name)
+    try:
+        reader = ctx.archive
+        if reader is None:
+            # Nothing scanned is not a clean scan
+            return json.dumps({"is_compliant": False, "reason": "Package not found on disk; cannot scan it for secrets.", "scanned": False})
+        report = scan_archive(reader)
+    except ArchiveError as e:
+        return json.dumps({"is_compliant": False, "reason": f"Unreadable package archive: {e}"})
+    findings = [{k: v for k, v in f.items() if k != "end"} for f in report["findings"]]
+    log(f"--- TOOL LOG: Scanned {report['scanned']} members ({report['bytes']} bytes), skipped {report['skipped']} binary members.")
+    if findings:
+        shown = ", ".join(f"{f['detector']} in '{f['member']}' line {f['line']}" for f in findings[:5])
+        return json.dumps({"is_compliant": False, "reason": f"Found {len(findings)} embedded secret(s): {shown}.",
+                           "findings": findings, "scanned": True})
+    return json.dumps({"is_compliant": True, "scanned": True,
+                       "reason": f"No embedded secrets found in {report['scanned']} scanned members."})
+
+def check_vulnerabilities(file_name: str, ctx: PackageContext | None = None):
+    """Tool 5: Matches the package's software components (SBOMs, package-manager metadata) against the local CVE database."""
+    log(f"--- TOOL LOG: Running check_vulnerabilities for '{file_name}'...")
+    from vnf_cve import SEVERITIES, load_cve_index
+    ctx = ctx or _context(file_name)
+    try:
+        index = load_cve_index()
+    except CONFIG_ERRORS as e:
+        return json.dumps({"is_compliant": False, "checked": False, "reason": _config_error("VNF_AGENT_CVE_INDEX", e)})
+    if index is None:
+        return json.dumps({"is_compliant": True, "checked": False,
+                           "reason": "No CVE database configured (VNF_AGENT_CVE_INDEX); vulnerabilities not checked."})
+    try:
+        reader = ctx.archive
+        if reader is None:
+            return json.dumps({"is_compliant": True, "checked": False, "reason": "Package not found on disk; no components to check."})
+        components, errors = ctx.components
+    except ArchiveError as e:
+        return json.dumps({"is_compliant": False, "reason": f"Unreadable package archive: {e}"})
+    for error in errors:
+        log(f"WARN: Cannot read component inventory {error}")
+    if not components:
+        return json.dumps({"is_compliant": True, "checked": True, "components": 0,
+                           "reason": "No SBOM or package-manager metadata found in the package."})
+    findings = sorted(index.match(components), key=lambda f: -SEVERITIES.index(f["severity"]))
+    blocking = [f for f in findings if SEVERITIES.index(f["severity"]) >= SEVERITIES.index(CVE_FAIL_SEVERITY)]
+    result = {"checked": True, "components": len(components), "findings": findings}
+    if blocking:
+        shown = ", ".join(f"{f['advisory']} in {f['name']} {f['version']} ({f['severity']})" for f in blocking[:5])
+        return json.dumps(dict(result, is_compliant=False,
+                               reason=f"{len(blocking)} known vulnerabilities of severity {CVE_FAIL_SEVERITY} or higher: {shown}."))
+    return json.dumps(dict(result, is_compliant=True,
+                           reason=f"No known vulnerabilities of severity {CVE_FAIL_SEVERITY} or higher in {len(components)} components "
+                                  f"({len(findings)} lower-severity findings)."))
+
 # --- 3. THE AGENT'S CORE LOGIC ---
 def _build_tools_schema(available_tools: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Return OpenAI-style tool (function) schema with parameters for each tool."""
@@ -91,7 +544,7 @@ def _build_tools_schema(available_tools: Dict[str, Any]) -> List[Dict[str, Any]]
 
 def _extract_file_name(user_goal: str) -> str | None:
     """Heuristic extraction of a file name from free-form user goal if LLM declines tool usage."""
-    match = re.search(r"([\w.-]+\.(zip|rar|tar\.gz))", user_goal, re.IGNORECASE)
+    match = re.search(r"([\w.-]+\.(zip|csar|rar|tar\.gz|tgz|tar))", user_goal, re.IGNORECASE)
     return match.group(1) if match else None
 
 
@@ -99,54 +552,265 @@ def _safe_json_loads(s: str) -> Dict[str, Any]:
     try:
         return json.loads(s) if s else {}
     except Exception as e:
-        print(f"WARN: Failed to parse tool arguments JSON: {e}. Raw: {s}")
+        log(f"WARN: Failed to parse tool arguments JSON: {e}. Raw: {s}")
         return {}
 
 
-def _call_llm(messages: List[Dict[str, str]], tools=None, tool_choice="auto"):
-    return client.chat.completions.create(
+def _cached_response(messages, tools, tool_choice):
+    """Return (cache_key, cached ChatCompletion or None); the key is None when caching is off."""
+    llm_cache = _store("llm_cache")
+    if llm_cache is None:
+        return None, None
+    key = llm_cache_key(MODEL_NAME, PROVIDER, messages, tools, tool_choice)
+    cached = llm_cache.get(key)
+    if cached is None:
+        return key, None
+    from openai.types.chat import ChatCompletion
+    return key, ChatCompletion.model_validate_json(cached)
+
+
+def _store_response(key: str | None, response) -> None:
+    if key is not None:
+        _store("llm_cache").set(key, response.model_dump_json())
+
+
+def _call_llm(messages: List[Dict[str, str]], tools=None, tool_choice="auto", kind: str | None = None):
+    """One chat completion, from the cache or through llm_guard. ``kind`` groups latencies for hedging."""
+    key, cached = _cached_response(messages, tools, tool_choice)
+    if cached is not None:
+        return cached
+    response = llm_guard.call(lambda base_url: get_client(base_url).chat.completions.create(
         model=MODEL_NAME,
         messages=messages,
         tools=tools,
         tool_choice=tool_choice,
-    )
+    ), estimate_tokens([messages, tools]), kind or ("plan" if tools else "summary"))
+    _store_response(key, response)
+    return response
 
 
-def run_agent(user_goal: str):
-    print(f"\n==================================================")
-    print(f"AGENT: Received New Goal: '{user_goal}'")
-    print(f"MODEL: {MODEL_NAME}  |  PROVIDER: {PROVIDER}")
-    print(f"==================================================")
+async def _acall_llm(messages: List[Dict[str, str]], tools=None, tool_choice="auto", kind: str | None = None):
+    """Async counterpart of _call_llm."""
+    key, cached = _cached_response(messages, tools, tool_choice)
+    if cached is not None:
+        return cached
+    response = await llm_guard.acall(lambda base_url: get_async_client(base_url).chat.completions.create(
+        model=MODEL_NAME,
+        messages=messages,
+        tools=tools,
+        tool_choice=tool_choice,
+    ), estimate_tokens([messages, tools]), kind or ("plan" if tools else "summary"))
+    _store_response(key, response)
+    return response
+
 
-    available_tools = {
-        "check_vnf_package_structure": check_vnf_package_structure,
-        "check_security_compliance": check_security_compliance,
-        "check_resource_requirements": check_resource_requirements,
-    }
+AVAILABLE_TOOLS = {
+    "check_vnf_package_structure": check_vnf_package_structure,
+    "check_security_compliance": check_security_compliance,
+    "check_resource_requirements": check_resource_requirements,
+    "check_embedded_secrets": check_embedded_secrets,
+    "check_vulnerabilities": check_vulnerabilities,
+}
+
+# Bump a tool's version whenever its logic changes so cached results from the old logic are not reused
+TOOL_VERSIONS = {
+    "check_vnf_package_structure": "4",
+    "check_security_compliance": "6",
+    "check_resource_requirements": "5",
+    "check_embedded_secrets": "3",
+    "check_vulnerabilities": "1",
+}
+
+def _resource_limits_fingerprint() -> str | None:
+    from vnf_capacity import load_inventory
+    try:
+        inventory = load_inventory()
+        limits = get_zone_limits()
+    except CONFIG_ERRORS:
+        return None
+    zones = hashlib.sha256(json.dumps(limits.zones).encode() + limits.vdu.tobytes() + limits.flavour.tobytes())
+    return f"{inventory.fingerprint[:16] if inventory is not None else ''}.{zones.hexdigest()[:16]}.{MAX_IMAGE_GB:g}"
+
+def _trust_store_fingerprint() -> str | None:
+    from vnf_signature import chain_validator
+    try:
+        store = trust_store()
+    except CONFIG_ERRORS:
+        return None
+    validator = chain_validator()
+    anchors = validator.fingerprint[:16] if validator is not None else ""
+    return f"{store.fingerprint[:16]}.{anchors}.{int(REQUIRE_SIGNATURE)}"
+
+def _digests_fingerprint() -> str:
+    return f"digests={int(VERIFY_DIGESTS)}"
+
+def _cve_index_fingerprint() -> str | None:
+    from vnf_cve import load_cve_index
+    try:
+        index = load_cve_index()
+    except CONFIG_ERRORS:
+        return None
+    return f"{index.fingerprint[:16]}.{CVE_FAIL_SEVERITY}" if index is not None else ""
+
+# External data and settings a tool reads besides the package; their fingerprint is part of the cache key.
+# None means the data cannot be loaded: the tool reports that, and its result is not cached.
+TOOL_DATA_FINGERPRINTS = {
+    "check_vnf_package_structure": _digests_fingerprint,
+    "check_security_compliance": _trust_store_fingerprint,
+    "check_resource_requirements": _resource_limits_fingerprint,
+    "check_vulnerabilities": _cve_index_fingerprint,
+}
+
+def _tool_version(tool_name: str) -> str | None:
+    version = TOOL_VERSIONS.get(tool_name, "0")
+    fingerprint = TOOL_DATA_FINGERPRINTS[tool_name]() if tool_name in TOOL_DATA_FINGERPRINTS else ""
+    if fingerprint is None:
+        return None
+    return f"{version}+{fingerprint}" if fingerprint else version
+
+def _outlived(output: str) -> bool:
+    """Whether a cached result rests on a signature whose certificate chain has expired since."""
+    if '"valid_until"' not in output:
+        return False
+    valid_until = (json.loads(output).get("signature") or {}).get("valid_until")
+    return valid_until is not None and datetime.fromisoformat(valid_until) <= datetime.now(timezone.utc)
+
+# Package artifacts each tool reads. The scheduler computes them before the tool starts, each once per package,
+# concurrently where they do not depend on each other (see PACKAGE_ARTIFACTS for what each is computed from)
+TOOL_INPUTS = {
+    "check_vnf_package_structure": ("layout", "digests"),
+    "check_security_compliance": ("manifest", "signature"),
+    "check_resource_requirements": ("resources",),
+    "check_embedded_secrets": ("archive",),
+    "check_vulnerabilities": ("components",),
+}
+
+# Seconds a tool may run before it is cancelled and recorded as timed out (override: VNF_AGENT_TOOL_TIMEOUTS)
+TOOL_TIMEOUTS = load_timeouts({
+    "check_vnf_package_structure": 900,  # hashes every member, VM images included
+    "check_security_compliance": 60,
+    "check_resource_requirements": 60,
+    "check_embedded_secrets": 600,
+    "check_vulnerabilities": 120,
+})
+# A package's remaining checks are skipped once one fails, unless the full report is asked for (--full-report)
+FULL_REPORT = os.getenv("VNF_AGENT_FULL_REPORT", "0").lower() in {"1", "on", "true", "yes"}
+# Under fail-fast, checks measured to take longer than this wait for the checks ranked before them to pass
+FAIL_FAST_GATE_SECONDS = float(os.getenv("VNF_AGENT_FAIL_FAST_GATE_SECONDS", "1"))
+# Tools run in worker processes instead of threads, because their work is pure Python and holds the GIL
+PROCESS_TOOLS = tuple(t.strip() for t in os.getenv("VNF_AGENT_PROCESS_TOOLS", "check_embedded_secrets").split(",") if t.strip())
+
+PLANNING_SYSTEM_PROMPT = (
+    "You are a pre-validation agent for Virtual Network Function (VNF) packages. "
+    "Decide which tools to invoke based ONLY on the user goal. Always provide tool calls when a file name is present. "
+    "If the package is not a .zip still validate structure, security, resource requirements, embedded secrets and vulnerabilities."
+)
+SUMMARY_SYSTEM_PROMPT = "Summarize the validation results concisely with pass/fail per check and an overall decision."
+BATCH_SUMMARY_SYSTEM_PROMPT = (
+    "You summarize VNF package validation results for many packages at once. "
+    "For every package give pass/fail per check and an overall APPROVE or REJECT decision. "
+    "Respond ONLY with a JSON object mapping each package id to its summary string."
+)
+SUMMARY_BATCH_SIZE = int(os.getenv("VNF_AGENT_SUMMARY_BATCH_SIZE", "25"))
+# Summary of the batch record for a goal that names no package
+NO_FILE_SUMMARY = "No file detected; nothing to validate."
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("VNF_AGENT_MAX_IN_FLIGHT", "16"))
+
+# 'rules' never calls the LLM to plan, 'llm' always does, 'rules_then_llm' only for ambiguous goals
+PLAN_STRATEGIES = ("rules", "llm", "rules_then_llm")
+PLAN_STRATEGY = os.getenv("VNF_AGENT_PLAN_STRATEGY", "rules_then_llm").lower()
+
+# 'llm' always asks the model, 'template' renders locally, 'hybrid' asks the model only for REJECT verdicts
+SUMMARY_MODES = ("llm", "template", "hybrid")
+SUMMARY_MODE = os.getenv("VNF_AGENT_SUMMARY_MODE", "llm").lower()
+
+# Boolean pass/fail field reported by each tool
+VERDICT_FIELDS = ("is_valid", "is_compliant", "is_within_limits")
+
+# Words that point a goal at one particular check, used by the rule-based planner
+TOOL_KEYWORDS = {
+    "check_vnf_package_structure": ("structure", "naming", "extension", "layout"),
+    "check_security_compliance": ("security", "secure", "vendor", "trust", "compliance", "compliant"),
+    "check_resource_requirements": ("resource", "cpu", "memory", "ram", "disk", "capacity", "limit"),
+    "check_embedded_secrets": ("secret", "credential", "password", "token", "private key"),
+    "check_vulnerabilities": ("vulnerab", "cve", "sbom", "component"),
+}
+
+
+def _supports_tools() -> bool:
+    return PROVIDER in {"openai", "azure"}  # naive capability flag
+
+
+def _planning_messages(user_goal: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": PLANNING_SYSTEM_PROMPT},
+        {"role": "user", "content": f"User goal: {user_goal}"},
+    ]
 
+
+def _rule_based_plan(user_goal: str, available_tools: Dict[str, Any]):
+    """Build tool calls locally for goals matching known patterns; None when the goal is ambiguous.
+
+    A goal naming a package runs every tool, or only the tools whose keywords
+    follow "only"/"just". Goals without a file name, with exclusions, or with a
+    restriction we cannot map to tools are left to the LLM.
+    """
+    file_name = _extract_file_name(user_goal)
+    if not file_name:
+        return None
+    text = user_goal.replace(file_name, " ").lower()
+    if re.search(r"\b(skip|without|except|exclude|excluding|ignore)\b", text):
+        return None
+    restriction = re.search(r"\b(only|just)\b", text)
+    if not restriction:
+        return _heuristic_tool_calls(file_name, available_tools.keys())
+    selected = [
+        name for name in available_tools
+        if any(re.search(rf"\b{k}", text) for k in TOOL_KEYWORDS.get(name, ()))
+    ]
+    return _heuristic_tool_calls(file_name, selected) if selected else None
+
+
+def _rules_first(user_goal: str, available_tools: Dict[str, Any], plan_strategy: str):
+    """Apply the rule-based planner per plan_strategy. None means "ask the LLM"."""
+    if plan_strategy not in PLAN_STRATEGIES:
+        raise ValueError(f"Unsupported plan_strategy={plan_strategy!r}; expected one of {PLAN_STRATEGIES}")
+    if plan_strategy == "llm":
+        return None
+    tool_calls = _rule_based_plan(user_goal, available_tools)
+    if tool_calls:
+        log("AGENT: Rule-based plan matched; skipping LLM planning.")
+        return tool_calls
+    if plan_strategy == "rules":
+        return []
+    log("AGENT: Goal is ambiguous for the rule-based planner; escalating to LLM.")
+    return None
+
+
+def _plan(user_goal: str, available_tools: Dict[str, Any], plan_strategy: str = "llm"):
+    """Step 1: plan tool calls by rules and/or LLM. Returns (tool_calls, planning_message)."""
+    tool_calls = _rules_first(user_goal, available_tools, plan_strategy)
+    if tool_calls is not None:
+        return tool_calls, None
     tools_definitions = _build_tools_schema(available_tools)
-    system_prompt = (
-        "You are a pre-validation agent for Virtual Network Function (VNF) packages. "
-        "Decide which tools to invoke based ONLY on the user goal. Always provide tool calls when a file name is present. "
-        "If the package is not a .zip still validate structure, security and resource requirements."
-    )
-    user_prompt = f"User goal: {user_goal}"
-
-    print("\n[1/3] AGENT: Planning (requesting tool selection from LLM)...")
+
     response = None
-    supports_tools = PROVIDER in {"openai", "azure"}  # naive capability flag
-    if supports_tools:
+    if _supports_tools():
         try:
-            response = _call_llm([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ], tools=tools_definitions, tool_choice="auto")
+            response = _call_llm(_planning_messages(user_goal), tools=tools_definitions, tool_choice="auto")
+        except CircuitOpenError as e:
+            log(f"AGENT: {e} Using heuristic fallback.")
+            response = None
         except Exception as e:
-            print(f"ERROR: LLM planning call failed (tools). Falling back. Details: {e}")
+            log(f"ERROR: LLM planning call failed (tools). Falling back. Details: {e}")
             response = None
     else:
-        print("INFO: Provider lacks tool calling; using heuristic fallback.")
+        log("INFO: Provider lacks tool calling; using heuristic fallback.")
+    return _parse_plan(response)
 
+
+def _parse_plan(response):
+    """Pull tool calls out of a planning response. Returns (tool_calls, planning_message)."""
     tool_calls = []
     planning_message = None
     if response:
@@ -156,74 +820,641 @@ def run_agent(user_goal: str):
             tool_calls = planning_message.tool_calls
         elif getattr(planning_message, 'function_call', None):
             tool_calls = [planning_message.function_call]
+    return tool_calls, planning_message
 
-    # If LLM declined tools, perform heuristic fallback
-    if not tool_calls:
-        print("AGENT: No tool calls returned by model. Using heuristic fallback.")
-        file_name = _extract_file_name(user_goal)
-        if file_name:
-            planned = [
-                {"id": "fallback_1", "function": {"name": n, "arguments": json.dumps({"file_name": file_name})}}
-                for n in available_tools.keys()
-            ]
-            tool_calls = planned
-        else:
-            print("AGENT: No file detected; nothing to validate.")
-            return
-
-    print(f"AGENT: Plan created. Will execute {len(tool_calls)} tool(s).")
-
-    print("\n[2/3] AGENT: Executing the plan...")
-    tool_outputs = []
-    for call in tool_calls:
-        # Normalizing structure (Ollama/OpenAI compatibility)
-        call_id = getattr(call, 'id', None) or getattr(call, 'name', None) or f"call_{hash(str(call))}"
-        # Structured attributes may differ; handle dict fallback
-        fn_meta = getattr(call, 'function', None) or getattr(call, 'name', None)
-        if isinstance(call, dict):
-            fn_meta = call.get('function', call)
-        tool_name = getattr(fn_meta, 'name', None) if not isinstance(fn_meta, dict) else fn_meta.get('name')
-        if tool_name not in available_tools:
-            print(f"WARN: Unknown tool '{tool_name}' returned by model; skipping.")
-            continue
-        raw_args = getattr(fn_meta, 'arguments', '{}') if not isinstance(fn_meta, dict) else fn_meta.get('arguments', '{}')
-        args = _safe_json_loads(raw_args)
-        # Align parameter key
-        if 'file_name' not in args:
-            extracted = _extract_file_name(user_goal)
-            if extracted:
-                args['file_name'] = extracted
-        try:
-            output = available_tools[tool_name](**args)
-        except TypeError as e:
-            print(f"ERROR executing {tool_name}: {e}. Args: {args}")
-            output = json.dumps({"error": str(e), "args": args})
-        tool_outputs.append({
-            "tool_call_id": call_id,
-            "role": "tool",
-            "name": tool_name,
-            "content": output
-        })
-    print("AGENT: All tool invocations completed.")
 
-    print("\n[3/3] AGENT: Summarizing results...")
+def _heuristic_tool_calls(file_name: str, tool_names) -> List[Dict[str, Any]]:
+    """Build dict-style tool calls running every named tool against file_name."""
+    return [
+        {"id": f"fallback_{i}", "function": {"name": n, "arguments": json.dumps({"file_name": file_name})}}
+        for i, n in enumerate(tool_names, start=1)
+    ]
+
+
+def _function_meta(call):
+    # Structured attributes may differ; handle dict fallback
+    fn_meta = getattr(call, 'function', None) or getattr(call, 'name', None)
+    if isinstance(call, dict):
+        fn_meta = call.get('function', call)
+    return fn_meta
+
+
+def _tool_call_name(call) -> str | None:
+    fn_meta = _function_meta(call)
+    return getattr(fn_meta, 'name', None) if not isinstance(fn_meta, dict) else fn_meta.get('name')
+
+
+def _fallback_plan(tool_calls, user_goal: str, available_tools: Dict[str, Any]):
+    """Return tool_calls, or the heuristic plan if the LLM declined tools. None when nothing to validate."""
+    if tool_calls:
+        return tool_calls
+    log("AGENT: No tool calls returned by model. Using heuristic fallback.")
+    file_name = _extract_file_name(user_goal)
+    if not file_name:
+        log("AGENT: No file detected; nothing to validate.")
+        return None
+    return _heuristic_tool_calls(file_name, available_tools.keys())
+
+
+def _prepare_call(call, user_goal: str, available_tools: Dict[str, Any]):
+    """Normalize one planned call to (call_id, tool_name, args); None for unknown tools."""
+    # Normalizing structure (Ollama/OpenAI compatibility)
+    call_id = getattr(call, 'id', None) or getattr(call, 'name', None) or f"call_{hash(str(call))}"
+    if isinstance(call, dict):
+        call_id = call.get('id') or call_id
+    fn_meta = _function_meta(call)
+    tool_name = _tool_call_name(call)
+    if tool_name not in available_tools:
+        log(f"WARN: Unknown tool '{tool_name}' returned by model; skipping.")
+        return None
+    raw_args = getattr(fn_meta, 'arguments', '{}') if not isinstance(fn_meta, dict) else fn_meta.get('arguments', '{}')
+    args = _safe_json_loads(raw_args)
+    # Align parameter key
+    if 'file_name' not in args:
+        extracted = _extract_file_name(user_goal)
+        if extracted:
+            args['file_name'] = extracted
+    return call_id, tool_name, args
+
+
+def _tool_context(args: Dict[str, Any], contexts: Dict[str, PackageContext] | None) -> PackageContext | None:
+    """The shared PackageContext for a call that only names a package, built on first use."""
+    file_name = args.get("file_name")
+    if not isinstance(file_name, str) or set(args) != {"file_name"}:
+        return None
+    ctx = contexts.get(file_name) if contexts is not None else None
+    if ctx is None:
+        ctx = _context(file_name)
+        if contexts is not None:
+            contexts[file_name] = ctx
+    return ctx
+
+
+def _call_tool(tool_name: str, tool, args: Dict[str, Any], ctx: PackageContext | None) -> str:
+    try:
+        return tool(**args, **({"ctx": ctx} if ctx is not None else {}))
+    except TypeError as e:
+        log(f"ERROR executing {tool_name}: {e}. Args: {args}")
+        return json.dumps({"error": str(e), "args": args})
+
+
+def _call_tool_in_process(tool_name: str, args: Dict[str, Any], package_dir: str) -> str:
+    """Worker-process entry point: the PackageContext is rebuilt here, without the parent's cache connection."""
+    ctx = PackageContext(args["file_name"], package_dir, artifacts=PACKAGE_ARTIFACTS) if set(args) == {"file_name"} else None
+    return _call_tool(tool_name, AVAILABLE_TOOLS[tool_name], args, ctx)
+
+
+def _tool_executor() -> ToolExecutor:
+    return ToolExecutor(TOOL_TIMEOUTS, process_tools=PROCESS_TOOLS)
+
+
+def _blocks(output: str) -> bool:
+    """Whether a tool output already decides REJECT for its package, so its other checks cannot change it."""
+    return _check_passed(_safe_json_loads(output)) is not True
+
+
+def _fail_fast_rank(tool_name: str) -> float:
+    """Expected seconds spent per rejection found; checks that are cheap and often reject run first."""
+    tool_stats = _store("tool_stats")
+    if tool_stats is None:
+        return 0.0
+    return tool_stats.get(tool_name)["seconds"] / tool_stats.rejection_rate(tool_name)
+
+
+def _skipped_result(blocker: str) -> str:
+    return json.dumps({"skipped": True, "skipped_because": blocker,
+                       "reason": f"Not run: {blocker} did not pass for this package (fail-fast). "
+                                 "Run with --full-report to run every check."})
+
+
+def _invoke_tools(prepared, available_tools: Dict[str, Any],
+                  contexts: Dict[str, PackageContext] | None = None,
+                  full_report: bool = FULL_REPORT) -> List[str]:
+    """Run prepared (call_id, tool_name, args) calls concurrently; outputs keep the order of ``prepared``.
+
+    Calls naming the same package share one PackageContext via ``contexts``,
+    and repeats are served from the tool cache. The package artifacts listed
+    in TOOL_INPUTS are computed as separate steps, each once and as soon as
+    its own inputs are ready, and a tool starts when its inputs are. A call
+    that exceeds its TOOL_TIMEOUTS entry is cancelled and recorded as a
+    timeout result.
+
+    Unless ``full_report`` is set, a package's calls are started in fail-fast
+    order (see _fail_fast_rank), checks measured to take longer than
+    FAIL_FAST_GATE_SECONDS wait for those ranked before them, and once one
+    check fails the package's calls not started yet are skipped.
+    """
+    contexts = {} if contexts is None else contexts
+    tool_cache, tool_stats = _store("tool_cache"), _store("tool_stats")
+    outputs: List[str | None] = [None] * len(prepared)
+    keys: Dict[int, str | None] = {}
+    pending: List[Tuple[int, PackageContext | None]] = []
+    for i, (_, tool_name, args) in enumerate(prepared):
+        ctx = _tool_context(args, contexts)
+        key = None
+        version = _tool_version(tool_name) if tool_cache is not None and ctx is not None else None
+        if version is not None:
+            key = tool_cache_key(tool_name, version, ctx.identity)
+            cached = tool_cache.get(key)
+            if cached is not None and not _outlived(cached):
+                log(f"--- TOOL LOG: {tool_name} for '{args['file_name']}' served from cache.")
+                outputs[i] = cached
+                continue
+        keys[i] = key
+        pending.append((i, ctx))
+
+    def package(i: int) -> Any:
+        return prepared[i][2].get("file_name")
+
+    # package -> the check that failed first, after which the package's other checks are skipped
+    blockers: Dict[Any, str] = {}
+    if not full_report:
+        for i, output in enumerate(outputs):
+            if output is not None and _blocks(output):
+                blockers.setdefault(package(i), prepared[i][1])
+        pending.sort(key=lambda p: _fail_fast_rank(prepared[p[0]][1]))
+
+    with _tool_executor() as executor:
+        scheduled = set()
+        ranked: Dict[Any, List[int]] = {}
+        closures: Dict[int, List[str]] = {}  # artifacts computed for each call, counted in its cost
+        for i, ctx in pending:
+            _, tool_name, args = prepared[i]
+            if package(i) in blockers:
+                continue
+            gate = []  # expensive checks wait for the package's checks ranked before them
+            if not full_report and tool_stats is not None \
+                    and tool_stats.get(tool_name)["seconds"] > FAIL_FAST_GATE_SECONDS:
+                gate = list(ranked.get(package(i), ()))
+            ranked.setdefault(package(i), []).append(i)
+            tool = available_tools[tool_name]
+            # Only the registered tools can be looked up by name in a worker process
+            registered = tool is AVAILABLE_TOOLS.get(tool_name)
+            process_call = (_call_tool_in_process, (tool_name, args, PACKAGE_DIR)) if registered else None
+            if ctx is not None and ctx.path is None:
+                process_call = None  # no package on disk: too little work to start a worker process for
+            inputs = TOOL_INPUTS.get(tool_name, ()) if ctx is not None else ()
+            if process_call is not None and tool_name in executor.process_tools:
+                inputs = ()  # a worker process builds its own context
+            closures[i] = artifact_closure(inputs, ctx.artifacts) if inputs else []
+            for name in closures[i]:
+                node = (ctx.file_name, name)
+                if node not in scheduled:
+                    scheduled.add(node)
+                    executor.submit(node, f"artifact '{name}'", partial(ctx.prefetch, name),
+                                    after=[(ctx.file_name, d) for d in ctx.artifacts[name][0]] + gate,
+                                    timeout=executor.timeout(tool_name))
+            executor.submit(i, tool_name, partial(_call_tool, tool_name, tool, args, ctx), process_call,
+                            after=[(ctx.file_name, name) for name in inputs] + gate)
+        for i, output, completed in executor.as_completed():
+            if not isinstance(i, int):
+                continue  # an artifact; the tools reading it report its failures
+            outputs[i] = output
+            tool_name = prepared[i][1]
+            rejected = _blocks(output)
+            if tool_stats is not None:
+                # A tool's cost includes computing its inputs, whichever call happened to compute them
+                seconds = executor.durations[i] + sum(executor.durations.get((package(i), name), 0.0)
+                                                      for name in closures[i])
+                tool_stats.record(tool_name, seconds, rejected)
+            # Timeouts and crashes are not cached, so the next run tries again
+            if completed and keys[i] is not None:
+                tool_cache.set(keys[i], output)
+            if rejected and not full_report and package(i) not in blockers:
+                blockers[package(i)] = tool_name
+                cancelled = executor.cancel(lambda k: (package(k) if isinstance(k, int) else k[0]) == package(i))
+                skipped = [k for k in cancelled if isinstance(k, int)]
+                if skipped:
+                    log(f"AGENT: {tool_name} failed for '{package(i)}'; skipping "
+                        f"{', '.join(prepared[k][1] for k in skipped)} (fail-fast).")
+    for i, _ in pending:
+        if outputs[i] is None:
+            outputs[i] = _skipped_result(blockers[package(i)])
+    return outputs
+
+
+def _tool_message(call_id: str, tool_name: str, output: str) -> Dict[str, Any]:
+    return {
+        "tool_call_id": call_id,
+        "role": "tool",
+        "name": tool_name,
+        "content": output
+    }
+
+
+def _execute(tool_calls, user_goal: str, available_tools: Dict[str, Any],
+             full_report: bool = FULL_REPORT) -> List[Dict[str, Any]]:
+    """Step 2: run the planned tool calls concurrently and collect tool messages in plan order."""
+    prepared = [p for p in (_prepare_call(c, user_goal, available_tools) for c in tool_calls) if p is not None]
+    outputs = _invoke_tools(prepared, available_tools, full_report=full_report)
+    return [_tool_message(call_id, tool_name, output) for (call_id, tool_name, _), output in zip(prepared, outputs)]
+
+
+def _summary_messages(user_goal: str, planning_message, tool_outputs: List[Dict[str, Any]]) -> List[Any]:
     summary_messages = [
-        {"role": "system", "content": "Summarize the validation results concisely with pass/fail per check and an overall decision."},
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
         {"role": "user", "content": user_goal},
     ]
     if planning_message:
         summary_messages.append(planning_message)
     summary_messages.extend(tool_outputs)
+    return summary_messages
+
+
+def _summary_failed(user_goal: str, error: Exception, tool_outputs: List[Dict[str, Any]]) -> str:
+    """The template report, for when the LLM could not write one."""
+    return (f"LLM summary failed: {error}\nTemplate report follows.\n\n"
+            f"{_render_template_report(user_goal, _parsed_outputs(tool_outputs))}")
+
+
+def _parsed_outputs(tool_outputs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Map tool name -> parsed JSON result."""
+    return {o["name"]: _safe_json_loads(o["content"]) for o in tool_outputs}
+
+
+def _check_passed(result: Dict[str, Any]) -> bool | None:
+    """The tool's pass/fail verdict, or None if it reported none (e.g. an execution error)."""
+    for field in VERDICT_FIELDS:
+        if isinstance(result.get(field), bool):
+            return result[field]
+    return None
+
+
+def _decision(checks: Dict[str, Dict[str, Any]]) -> str:
+    """APPROVE only if at least one check ran and every check passed."""
+    if checks and all(_check_passed(r) is True for r in checks.values()):
+        return "APPROVE"
+    return "REJECT"
+
+
+def _render_template_report(user_goal: str, checks: Dict[str, Dict[str, Any]]) -> str:
+    """Render the pass/fail report locally from the tools' verdict fields."""
+    file_name = _extract_file_name(user_goal) or user_goal
+    lines = [f"Pre-check results for '{file_name}':"]
+    for name, result in checks.items():
+        passed = _check_passed(result)
+        status = "SKIPPED" if result.get("skipped") else "PASS" if passed else "FAIL" if passed is False else "ERROR"
+        lines.append(f"- {name}: {status} - {result.get('reason') or result.get('error') or 'no details'}")
+    skipped = sum(1 for r in checks.values() if r.get("skipped"))
+    failed = sum(1 for r in checks.values() if _check_passed(r) is not True) - skipped
+    decision = _decision(checks)
+    notes = [f"{failed} of {len(checks)} checks did not pass"] if failed else []
+    notes += [f"{skipped} skipped"] if skipped else []
+    lines.append(f"Overall decision: {decision}" + (f" ({', '.join(notes)})" if notes else ""))
+    return "\n".join(lines)
+
+
+def _local_summary(user_goal: str, tool_outputs: List[Dict[str, Any]], summary_mode: str) -> str | None:
+    """The template report when summary_mode does not need the LLM for this result, else None."""
+    if summary_mode not in SUMMARY_MODES:
+        raise ValueError(f"Unsupported summary_mode={summary_mode!r}; expected one of {SUMMARY_MODES}")
+    checks = _parsed_outputs(tool_outputs)
+    if summary_mode == "template" or (summary_mode == "hybrid" and _decision(checks) == "APPROVE"):
+        return _render_template_report(user_goal, checks)
+    return None
+
+
+def _summarize(user_goal: str, planning_message, tool_outputs: List[Dict[str, Any]], summary_mode: str = "llm") -> str:
+    """Step 3: render the report locally or ask the LLM for a human-readable one."""
+    local = _local_summary(user_goal, tool_outputs, summary_mode)
+    if local is not None:
+        return local
+    try:
+        summary_response = _call_llm(_summary_messages(user_goal, planning_message, tool_outputs))
+
+        return summary_response.choices[0].message.content
+    except Exception as e:
+        return _summary_failed(user_goal, e, tool_outputs)
+
+
+def run_agent(user_goal: str, plan_strategy: str = PLAN_STRATEGY,
+              summary_mode: str = SUMMARY_MODE, full_report: bool = FULL_REPORT) -> Dict[str, Any] | None:
+    """Plan -> Execute -> Summarize for one goal.
+
+    Checks of a package that has already failed one are skipped and reported
+    as such, unless ``full_report`` is set.
+    """
+    log(f"\n==================================================")
+    log(f"AGENT: Received New Goal: '{user_goal}'")
+    log(f"MODEL: {MODEL_NAME}  |  PROVIDER: {PROVIDER}")
+    log(f"==================================================")
+
+    available_tools = AVAILABLE_TOOLS
+
+    log(f"\n[1/3] AGENT: Planning (strategy: {plan_strategy})...")
+    tool_calls, planning_message = _plan(user_goal, available_tools, plan_strategy)
 
+    # If LLM declined tools, perform heuristic fallback
+    tool_calls = _fallback_plan(tool_calls, user_goal, available_tools)
+    if tool_calls is None:
+        return None
+
+    log(f"AGENT: Plan created. Will execute {len(tool_calls)} tool(s).")
+
+    log("\n[2/3] AGENT: Executing the plan...")
+    tool_outputs = _execute(tool_calls, user_goal, available_tools, full_report)
+    log("AGENT: All tool invocations completed.")
+
+    log(f"\n[3/3] AGENT: Summarizing results (mode: {summary_mode})...")
+    final_summary = _summarize(user_goal, planning_message, tool_outputs, summary_mode)
+
+    log(f"\n--- ✅ FINAL REPORT ---\n{final_summary}\n----------------------\n")
+    return _result(user_goal, tool_outputs, final_summary)
+
+
+# --- 4. ASYNC EXECUTION ENGINE ---
+async def _aplan(user_goal: str, available_tools: Dict[str, Any], plan_strategy: str = "llm"):
+    """Async counterpart of _plan."""
+    tool_calls = _rules_first(user_goal, available_tools, plan_strategy)
+    if tool_calls is not None:
+        return tool_calls, None
+    response = None
+    if _supports_tools():
+        try:
+            response = await _acall_llm(_planning_messages(user_goal),
+                                        tools=_build_tools_schema(available_tools), tool_choice="auto")
+        except CircuitOpenError as e:
+            log(f"AGENT: {e} Using heuristic fallback.")
+        except Exception as e:
+            log(f"ERROR: LLM planning call failed (tools). Falling back. Details: {e}")
+    return _parse_plan(response)
+
+
+async def _aexecute(tool_calls, user_goal: str, available_tools: Dict[str, Any],
+                    full_report: bool = FULL_REPORT) -> List[Dict[str, Any]]:
+    """Async counterpart of _execute: the tool executor runs in a worker thread, off the event loop."""
+    return await asyncio.to_thread(_execute, tool_calls, user_goal, available_tools, full_report)
+
+
+async def _asummarize(user_goal: str, planning_message, tool_outputs: List[Dict[str, Any]],
+                      summary_mode: str = "llm") -> str:
+    """Async counterpart of _summarize."""
+    local = _local_summary(user_goal, tool_outputs, summary_mode)
+    if local is not None:
+        return local
     try:
-        summary_response = _call_llm(summary_messages)
-        
-        final_summary = summary_response.choices[0].message.content
+        summary_response = await _acall_llm(_summary_messages(user_goal, planning_message, tool_outputs))
+        return summary_response.choices[0].message.content
     except Exception as e:
-        final_summary = f"LLM summary failed: {e}\nRaw tool outputs: {json.dumps(tool_outputs, indent=2)}"
+        return _summary_failed(user_goal, e, tool_outputs)
+
+
+async def _acheck(user_goal: str, plan_strategy: str, full_report: bool):
+    """Plan and execute one goal: (planning message, tool messages), or None when there is nothing to validate."""
+    available_tools = AVAILABLE_TOOLS
+    tool_calls, planning_message = await _aplan(user_goal, available_tools, plan_strategy)
+    tool_calls = _fallback_plan(tool_calls, user_goal, available_tools)
+    if tool_calls is None:
+        return None
+    return planning_message, await _aexecute(tool_calls, user_goal, available_tools, full_report)
+
+
+async def async_run_agent(user_goal: str, limiter: asyncio.Semaphore | None = None,
+                          plan_strategy: str = PLAN_STRATEGY,
+                          summary_mode: str = SUMMARY_MODE,
+                          full_report: bool = FULL_REPORT) -> Dict[str, Any] | None:
+    """Plan -> Execute -> Summarize for one goal without blocking the event loop.
+
+    ``limiter`` bounds how many goals are in flight at once when many
+    coroutines share it; see ``async_run_many``.
+    """
+    if limiter is None:
+        limiter = asyncio.Semaphore(1)
+    async with limiter:
+        checked = await _acheck(user_goal, plan_strategy, full_report)
+        if checked is None:
+            return None
+        planning_message, tool_outputs = checked
+        final_summary = await _asummarize(user_goal, planning_message, tool_outputs, summary_mode)
+
+    log(f"\n--- ✅ FINAL REPORT: {user_goal} ---\n{final_summary}\n----------------------\n")
+    return _result(user_goal, tool_outputs, final_summary)
+
+
+async def async_run_many(goals: List[str], max_in_flight: int = ASYNC_MAX_IN_FLIGHT,
+                         plan_strategy: str = PLAN_STRATEGY,
+                         summary_mode: str = SUMMARY_MODE,
+                         full_report: bool = FULL_REPORT) -> List[Dict[str, Any] | None]:
+    """Run many goals concurrently with at most ``max_in_flight`` pipelines active. Results keep input order."""
+    limiter = asyncio.Semaphore(max_in_flight)
+    warm_up = asyncio.create_task(_apreconnect_llm()) if _uses_llm(plan_strategy, summary_mode) else None
+    results = await asyncio.gather(*(async_run_agent(g, limiter, plan_strategy, summary_mode, full_report)
+                                     for g in goals))
+    if warm_up is not None:
+        await warm_up
+    return results
+
+
+async def async_run_batch(goals: List[str], summary_chunk_size: int = SUMMARY_BATCH_SIZE,
+                          max_in_flight: int = ASYNC_MAX_IN_FLIGHT, plan_strategy: str = PLAN_STRATEGY,
+                          summary_mode: str = SUMMARY_MODE, full_report: bool = FULL_REPORT) -> List[Dict[str, Any]]:
+    """Async counterpart of run_batch: goals are checked concurrently, then summarized in batches.
+
+    Returns one result record per goal, in input order, including goals that name no package.
+    """
+    limiter = asyncio.Semaphore(max_in_flight)
+    warm_up = asyncio.create_task(_apreconnect_llm()) if _uses_llm(plan_strategy, summary_mode) else None
+
+    async def check(user_goal: str) -> Dict[str, Any]:
+        async with limiter:
+            checked = await _acheck(user_goal, plan_strategy, full_report)
+        if checked is None:
+            return _result(user_goal, [], NO_FILE_SUMMARY)
+        return _result(user_goal, checked[1], None)
+
+    results = await asyncio.gather(*(check(g) for g in goals))
+    if warm_up is not None:
+        await warm_up
+    log("\n[3/3] AGENT: Summarizing results in batches...")
+    await asyncio.to_thread(_summarize_batch, [r for r in results if r["summary"] is None],
+                            summary_chunk_size, summary_mode)
+    return results
+
+
+# --- 5. BATCH MODE ---
+def _result(user_goal: str, tool_outputs: List[Dict[str, Any]], summary: str | None) -> Dict[str, Any]:
+    """JSON-serializable per-package result record."""
+    checks = _parsed_outputs(tool_outputs)
+    return {
+        "goal": user_goal,
+        "file_name": _extract_file_name(user_goal),
+        "tool_outputs": checks,
+        "decision": _decision(checks),
+        "summary": summary,
+    }
+
+
+def _goal_template(user_goal: str) -> str:
+    """Goal text with the package name blanked out; goals sharing a template share a plan."""
+    file_name = _extract_file_name(user_goal)
+    return user_goal.replace(file_name, "<package>") if file_name else user_goal
+
+
+def _summarize_batch(results: List[Dict[str, Any]], chunk_size: int = SUMMARY_BATCH_SIZE,
+                     summary_mode: str = "llm") -> None:
+    """Fill in result["summary"] with one LLM call per chunk of packages instead of one per package."""
+    if summary_mode not in SUMMARY_MODES:
+        raise ValueError(f"Unsupported summary_mode={summary_mode!r}; expected one of {SUMMARY_MODES}")
+    pending = []
+    for r in results:
+        if summary_mode == "template" or (summary_mode == "hybrid" and r["decision"] == "APPROVE"):
+            r["summary"] = _render_template_report(r["goal"], r["tool_outputs"])
+        else:
+            pending.append(r)
+    results = pending
+
+    for start in range(0, len(results), chunk_size):
+        chunk = results[start:start + chunk_size]
+        payload = {
+            str(start + i): {"goal": r["goal"], "results": r["tool_outputs"]}
+            for i, r in enumerate(chunk)
+        }
+        summaries: Dict[str, Any] = {}
+        try:
+            response = _call_llm([
+                {"role": "system", "content": BATCH_SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(payload)},
+            ], kind="batch_summary")
+            content = response.choices[0].message.content or ""
+            # Models sometimes wrap JSON in prose or code fences; keep the outermost object
+            match = re.search(r"\{.*\}", content, re.DOTALL)
+            summaries = _safe_json_loads(match.group(0) if match else content)
+        except Exception as e:
+            log(f"ERROR: LLM batch summary failed for packages {start}-{start + len(chunk) - 1}: {e}")
+        for i, r in enumerate(chunk):
+            summary = summaries.get(str(start + i)) if isinstance(summaries, dict) else None
+            if not isinstance(summary, str):
+                summary = ("LLM summary unavailable.\nTemplate report follows.\n\n"
+                           f"{_render_template_report(r['goal'], r['tool_outputs'])}")
+            r["summary"] = summary
+
+
+def run_batch(goals: List[str], summary_chunk_size: int = SUMMARY_BATCH_SIZE,
+              plan_strategy: str = PLAN_STRATEGY, summary_mode: str = SUMMARY_MODE,
+              full_report: bool = FULL_REPORT) -> List[Dict[str, Any]]:
+    """Pre-check many packages at once.
+
+    Goals that differ only in the package name share one planning call, and
+    summaries are requested for ``summary_chunk_size`` packages per LLM call.
+    Returns one result record per goal, in input order.
+    """
+    available_tools = AVAILABLE_TOOLS
+    log(f"\nAGENT: Batch of {len(goals)} goal(s)  |  MODEL: {MODEL_NAME}  |  PROVIDER: {PROVIDER}")
+
+    log("\n[1/3] + [2/3] AGENT: Planning (one request per distinct goal template) and executing...")
+    plans: Dict[str, List[str]] = {}
+    results: List[Dict[str, Any]] = []
+    for user_goal in goals:
+        file_name = _extract_file_name(user_goal)
+        if file_name:
+            template = _goal_template(user_goal)
+            if template not in plans:
+                tool_calls, _ = _plan(user_goal, available_tools, plan_strategy)
+                names = [n for n in (_tool_call_name(c) for c in tool_calls) if n in available_tools]
+                plans[template] = list(dict.fromkeys(names)) or list(available_tools.keys())
+            tool_calls = _heuristic_tool_calls(file_name, plans[template])
+        else:
+            tool_calls, _ = _plan(user_goal, available_tools, plan_strategy)
+            if not tool_calls:
+                log(f"AGENT: No file detected in '{user_goal}'; nothing to validate.")
+                results.append(_result(user_goal, [], NO_FILE_SUMMARY))
+                continue
+
+        results.append(_result(user_goal, _execute(tool_calls, user_goal, available_tools, full_report), None))
+    log(f"AGENT: {len(plans)} shared plan(s) for {len(goals)} goal(s).")
+
+    log("\n[3/3] AGENT: Summarizing results in batches...")
+    _summarize_batch([r for r in results if r["summary"] is None], summary_chunk_size, summary_mode)
+    return results
+
+
+def _read_goals(path: str) -> List[str]:
+    """Read goals from JSONL: a JSON string, or an object with a "goal" or "file_name" key per line."""
+    goals = []
+    with open(path, encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = line  # tolerate bare file names
+            if isinstance(item, dict):
+                item = item.get("goal") or item.get("file_name")
+            if not isinstance(item, str) or not item:
+                log(f"WARN: {path}:{line_no}: expected a goal string or a 'goal'/'file_name' field; skipping.")
+                continue
+            goals.append(item)
+    return goals
+
+
+def _write_results(results: List[Dict[str, Any]], path: str | None, stream=None) -> None:
+    """Write JSONL records to ``path``, or to ``stream`` (default stdout) when no path is given."""
+    out = open(path, "w", encoding="utf-8") if path else stream or sys.stdout
+    try:
+        for r in results:
+            out.write(json.dumps(r) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main(argv: List[str] | None = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="VNF package pre-check agent.")
+    parser.add_argument("--batch", metavar="GOALS.jsonl", help="Read goals or file names from a JSONL file.")
+    parser.add_argument("--output", metavar="RESULTS.jsonl", help="Write one JSONL result per package (default: stdout).")
+    parser.add_argument("--summary-batch-size", type=int, default=SUMMARY_BATCH_SIZE,
+                        help="Packages summarized per LLM call in batch mode.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run goals concurrently on the asyncio engine.")
+    parser.add_argument("--max-in-flight", type=int, default=ASYNC_MAX_IN_FLIGHT,
+                        help="Maximum goals processed concurrently with --async.")
+    parser.add_argument("--plan-strategy", choices=PLAN_STRATEGIES, default=PLAN_STRATEGY,
+                        help="Plan with local rules, the LLM, or rules with LLM escalation for ambiguous goals.")
+    parser.add_argument("--summary-mode", choices=SUMMARY_MODES, default=SUMMARY_MODE,
+                        help="Summarize with the LLM, a local template, or the LLM only for REJECT verdicts.")
+    parser.add_argument("--full-report", action="store_true", default=FULL_REPORT,
+                        help="Run every check even after one has failed (default: skip the rest of the package's checks).")
+    parser.add_argument("goal", nargs="*", help="Free-form goal(s) to pre-check.")
+    args = parser.parse_args(argv)
+
+    results_stream = None
+    if args.batch and not args.output:
+        # Results go to stdout, so progress (ours and the worker processes') goes to stderr
+        sys.stdout.flush()
+        results_stream = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    goals = _read_goals(args.batch) if args.batch else args.goal or [
+        "Please perform a pre-check on the VNF package named 'cisco_firewall_v2.1.zip'",
+        "I need to validate a new package from a new vendor. The file is 'newvendor_router_highcpu.rar'",
+    ]
+
+    if _uses_llm(args.plan_strategy, args.summary_mode) and not args.use_async:
+        _preconnect_llm()
+    if args.use_async and args.batch:
+        results = asyncio.run(async_run_batch(goals, args.summary_batch_size, args.max_in_flight, args.plan_strategy,
+                                              args.summary_mode, args.full_report))
+    elif args.use_async:
+        results = asyncio.run(async_run_many(goals, args.max_in_flight, args.plan_strategy, args.summary_mode,
+                                             args.full_report))
+    elif args.batch:
+        results = run_batch(goals, summary_chunk_size=args.summary_batch_size, plan_strategy=args.plan_strategy,
+                            summary_mode=args.summary_mode, full_report=args.full_report)
+    else:
+        results = [run_agent(g, plan_strategy=args.plan_strategy, summary_mode=args.summary_mode,
+                             full_report=args.full_report) for g in goals]
+
+    if args.batch:
+        _write_results(results, args.output, results_stream)
+    for name, label in (("llm_cache", "LLM CACHE"), ("tool_cache", "TOOL CACHE")):
+        if _stores.get(name) is not None:
+            print(f"{label}: {_stores[name].stats()}", file=sys.stderr)
+    print(f"LLM CALLS: {llm_guard.stats()}", file=sys.stderr)
 
-    print(f"\n--- ✅ FINAL REPORT ---\n{final_summary}\n----------------------\n")
 
 if __name__ == "__main__":
-    run_agent("Please perform a pre-check on the VNF package named 'cisco_firewall_v2.1.zip'")
-    run_agent("I need to validate a new package from a new vendor. The file is 'newvendor_router_highcpu.rar'")
\ No newline at end of file
+    main()
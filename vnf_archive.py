@@ -0,0 +1,354 @@
+"""Archive readers and ETSI SOL004 package layout inspection.
+
+Every supported package format (.zip/.csar, .tar/.tar.gz/.tgz, .rar) is
+exposed through an ``ArchiveReader`` with one lazily built member index
+(name, size, data offset, compression) that all tools share. Readers are
+cached per package file, so an archive is opened and indexed once per
+pre-check, not once per tool.
+
+For zip-based packages only the central directory is read (zipfile seeks to
+the end-of-central-directory record and parses the index), plus the small
+TOSCA.meta member. Payload members such as VM images are never
+decompressed, so a 20 GB package is inspected in milliseconds. Tarballs
+carry no central index, so building their index scans the stream once.
+"""
+import mmap
+import os
+import posixpath
+import struct
+import tarfile
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import IO, Any, Dict, Iterator, List, NamedTuple
+
+TOSCA_META = "TOSCA-Metadata/TOSCA.meta"
+DEFINITIONS_DIR = "Definitions/"
+# TOSCA.meta is a handful of "Key: Value" lines; refuse to read anything larger
+MAX_META_BYTES = 64 * 1024
+
+REQUIRED_META_KEYS = ("TOSCA-Meta-File-Version", "CSAR-Version", "Created-By", "Entry-Definitions")
+
+# Compressions whose member bytes sit verbatim in the archive file and can be read through mmap
+UNCOMPRESSED = ("stored", "none")
+
+_ZIP_COMPRESSION = {
+    zipfile.ZIP_STORED: "stored",
+    zipfile.ZIP_DEFLATED: "deflate",
+    zipfile.ZIP_BZIP2: "bzip2",
+    zipfile.ZIP_LZMA: "lzma",
+}
+_TAR_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ", "xz"))
+_LOCAL_HEADER = struct.Struct("<4s22xHH")  # signature, ..., file name length, extra field length
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+class ArchiveError(Exception):
+    """The package cannot be opened or read as an archive."""
+
+
+class Member(NamedTuple):
+    name: str
+    size: int             # uncompressed size
+    compressed_size: int
+    offset: int           # start of the member's data in the archive file (tar.gz: in the decompressed stream)
+    compression: str      # "stored", "deflate", ..., "none" (plain tar), "gzip"/"bz2"/"xz" (compressed tar), "rar"
+
+
+class ArchiveReader:
+    """Base class: a read-only view of one package archive with a cached member index."""
+
+    format = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._members: Dict[str, Member] | None = None
+        self._lock = threading.RLock()
+
+    @property
+    def members(self) -> Dict[str, Member]:
+        """File members (directories excluded) by name, indexed on first access."""
+        if self._members is None:
+            with self._lock:
+                if self._members is None:
+                    self._members = self._build_index()
+        return self._members
+
+    def _build_index(self) -> Dict[str, Member]:
+        raise NotImplementedError
+
+    def open(self, name: str) -> IO[bytes]:
+        """Binary stream over a member's uncompressed content."""
+        raise NotImplementedError
+
+    def read(self, name: str, max_bytes: int | None = None) -> bytes:
+        """Whole content of a small member; ArchiveError if it exceeds max_bytes."""
+        member = self.members.get(name)
+        if member is None:
+            raise ArchiveError(f"'{name}' not found in archive.")
+        if max_bytes is not None and member.size > max_bytes:
+            raise ArchiveError(f"'{name}' is unexpectedly large ({member.size} bytes).")
+        with self._lock, self.open(name) as fh:
+            return fh.read()
+
+    def iter_chunks(self, name: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        """Stream a member's uncompressed content; holds the reader lock so shared streams are not interleaved."""
+        with self._lock, self.open(name) as fh:
+            for chunk in iter(lambda: fh.read(chunk_size), b""):
+                yield chunk
+
+    def close(self) -> None:
+        pass
+
+
+class ZipReader(ArchiveReader):
+    """.zip and .csar packages (a CSAR is a zip archive)."""
+
+    format = "zip"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            self._zf = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise ArchiveError(f"Not a readable zip archive: {e}") from e
+
+    def _build_index(self) -> Dict[str, Member]:
+        infos = [i for i in self._zf.infolist() if not i.is_dir()]
+        members = {}
+        with open(self.path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for info in infos:
+                # The data follows the local header, whose name/extra lengths may differ from the central directory
+                signature, name_len, extra_len = _LOCAL_HEADER.unpack_from(mm, info.header_offset)
+                if signature != _LOCAL_HEADER_SIGNATURE:
+                    raise ArchiveError(f"Bad local header for '{info.filename}'.")
+                offset = info.header_offset + _LOCAL_HEADER.size + name_len + extra_len
+                compression = _ZIP_COMPRESSION.get(info.compress_type, str(info.compress_type))
+                if info.flag_bits & 0x1:
+                    compression = "encrypted"
+                members[info.filename] = Member(info.filename, info.file_size, info.compress_size, offset, compression)
+        return members
+
+    def open(self, name: str) -> IO[bytes]:
+        return self._zf.open(name)
+
+    def close(self) -> None:
+        self._zf.close()
+
+
+class TarReader(ArchiveReader):
+    """.tar, .tar.gz and .tgz packages."""
+
+    format = "tar"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            self._tf = tarfile.open(path, "r:*")
+        except (tarfile.TarError, OSError) as e:
+            raise ArchiveError(f"Not a readable tar archive: {e}") from e
+        with open(path, "rb") as fh:
+            magic = fh.read(6)
+        self._compression = next((name for prefix, name in _TAR_MAGIC if magic.startswith(prefix)), "none")
+
+    def _build_index(self) -> Dict[str, Member]:
+        try:
+            infos = self._tf.getmembers()
+        except (tarfile.TarError, OSError, EOFError) as e:
+            raise ArchiveError(f"Corrupt tar archive: {e}") from e
+        return {
+            ti.name: Member(ti.name, ti.size, ti.size, ti.offset_data, self._compression)
+            for ti in infos if ti.isfile()
+        }
+
+    def open(self, name: str) -> IO[bytes]:
+        self.members  # tarfile needs the index before extracting by name
+        with self._lock:
+            fh = self._tf.extractfile(name)
+        if fh is None:
+            raise ArchiveError(f"'{name}' is not a regular file.")
+        return fh
+
+    def close(self) -> None:
+        self._tf.close()
+
+
+class RarReader(ArchiveReader):
+    """.rar packages; needs the optional ``rarfile`` package (and an unrar backend)."""
+
+    format = "rar"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            import rarfile
+        except ImportError as e:
+            raise ArchiveError("RAR packages need the optional 'rarfile' package (pip install rarfile).") from e
+        try:
+            self._rf = rarfile.RarFile(path)
+        except (rarfile.Error, OSError) as e:
+            raise ArchiveError(f"Not a readable rar archive: {e}") from e
+        self._stored = rarfile.RAR_M0
+
+    def _build_index(self) -> Dict[str, Member]:
+        members = {}
+        for info in self._rf.infolist():
+            if info.is_dir():
+                continue
+            compression = "rar-stored" if info.compress_type == self._stored else "rar"
+            if info.needs_password():
+                compression = "encrypted"
+            offset = getattr(info, "data_offset", None) or 0
+            members[info.filename] = Member(info.filename, info.file_size, info.compress_size, offset, compression)
+        return members
+
+    def open(self, name: str) -> IO[bytes]:
+        return self._rf.open(name)
+
+    def close(self) -> None:
+        self._rf.close()
+
+
+# Longest suffixes first so ".tar.gz" wins over ".gz"-style partial matches
+ARCHIVE_READERS = {
+    ".tar.gz": TarReader,
+    ".tgz": TarReader,
+    ".tar": TarReader,
+    ".csar": ZipReader,
+    ".zip": ZipReader,
+    ".rar": RarReader,
+}
+
+
+def archive_suffix(file_name: str) -> str | None:
+    """The supported archive suffix of file_name, or None."""
+    lower = file_name.lower()
+    return next((suffix for suffix in ARCHIVE_READERS if lower.endswith(suffix)), None)
+
+
+_readers: "OrderedDict[tuple, ArchiveReader]" = OrderedDict()
+_readers_lock = threading.Lock()
+MAX_OPEN_ARCHIVES = int(os.getenv("VNF_AGENT_MAX_OPEN_ARCHIVES", "32"))
+
+
+def open_archive(path: str) -> ArchiveReader:
+    """Shared reader for a package file, reused until the file changes. Raises ArchiveError."""
+    suffix = archive_suffix(path)
+    if suffix is None:
+        raise ArchiveError(f"Unsupported package format: '{os.path.basename(path)}'.")
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is not None:
+            _readers.move_to_end(key)
+            return reader
+    reader = ARCHIVE_READERS[suffix](path)
+    with _readers_lock:
+        if key in _readers:  # another thread won the race
+            reader.close()
+            return _readers[key]
+        _readers[key] = reader
+        while len(_readers) > MAX_OPEN_ARCHIVES:
+            _, evicted = _readers.popitem(last=False)
+            evicted.close()
+    return reader
+
+
+def parse_tosca_meta(text: str) -> Dict[str, str]:
+    """Parse TOSCA.meta "Key: Value" lines; later blocks do not override the first occurrence."""
+    meta: Dict[str, str] = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(":")
+        if sep and key.strip() and key.strip() not in meta:
+            meta[key.strip()] = value.strip()
+    return meta
+
+
+def _unsafe_member(name: str) -> bool:
+    return name.startswith("/") or "\\" in name or ".." in name.split("/")
+
+
+def _root_files(names: List[str], suffixes) -> List[str]:
+    return [n for n in names if "/" not in n and n.lower().endswith(suffixes)]
+
+
+def inspect_sol004_layout(reader: ArchiveReader) -> Dict[str, Any]:
+    """Check a package against the SOL004 layout using only its member index and TOSCA.meta.
+
+    Returns a dict with the detected ``layout``, the ``entry_definitions``,
+    ``manifest`` and ``certificate`` members, the member count, and a list of
+    ``problems`` (empty when the layout is valid).
+    """
+    report: Dict[str, Any] = {
+        "format": reader.format, "layout": None, "entry_definitions": None, "manifest": None,
+        "certificate": None, "members": 0, "problems": [],
+    }
+    problems: List[str] = report["problems"]
+    try:
+        members = reader.members
+    except ArchiveError as e:
+        problems.append(str(e))
+        return report
+    names = list(members)
+    report["members"] = len(names)
+
+    unsafe = [n for n in names if _unsafe_member(n)]
+    if unsafe:
+        problems.append(f"Unsafe member paths: {', '.join(unsafe[:5])}")
+
+    if TOSCA_META in members:
+        report["layout"] = "tosca-metadata"
+        try:
+            meta = parse_tosca_meta(reader.read(TOSCA_META, MAX_META_BYTES).decode("utf-8", errors="replace"))
+        except ArchiveError as e:
+            problems.append(str(e))
+            return report
+        missing = [k for k in REQUIRED_META_KEYS if k not in meta]
+        if missing:
+            problems.append(f"{TOSCA_META} is missing keys: {', '.join(missing)}")
+
+        entry = meta.get("Entry-Definitions")
+        if entry:
+            report["entry_definitions"] = entry
+            if entry not in members:
+                problems.append(f"Entry-Definitions '{entry}' not found in archive.")
+        if not any(n.startswith(DEFINITIONS_DIR) for n in names):
+            problems.append(f"No {DEFINITIONS_DIR} directory in archive.")
+
+        manifest = meta.get("ETSI-Entry-Manifest")
+        if manifest is None:
+            # Older CSARs: a root .mf named after the entry definitions
+            base = posixpath.splitext(posixpath.basename(entry or ""))[0]
+            candidates = _root_files(names, (".mf",))
+            manifest = next((m for m in candidates if posixpath.splitext(m)[0] == base), None) or \
+                (candidates[0] if len(candidates) == 1 else None)
+        certificate = meta.get("ETSI-Entry-Certificate")
+    else:
+        report["layout"] = "single-yaml"
+        yamls = _root_files(names, (".yaml", ".yml"))
+        if len(yamls) != 1:
+            problems.append(f"Without {TOSCA_META} the archive root must hold exactly one YAML file; found {len(yamls)}.")
+            return report
+        entry = yamls[0]
+        report["entry_definitions"] = entry
+        base = posixpath.splitext(entry)[0]
+        manifest = base + ".mf"
+        certificate = None
+
+    if not manifest or manifest not in members:
+        shown = f"'{manifest}'" if manifest else "(.mf)"
+        problems.append(f"Manifest file {shown} not found in archive.")
+    else:
+        report["manifest"] = manifest
+
+    if certificate is None:
+        # Default certificate location: a .cert next to the manifest
+        base = posixpath.splitext(manifest or report["entry_definitions"] or "")[0]
+        certificate = base + ".cert" if base else None
+    if not certificate or certificate not in members:
+        problems.append("Signing certificate (.cert) not found in archive.")
+    else:
+        report["certificate"] = certificate
+
+    return report
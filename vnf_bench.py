@@ -0,0 +1,196 @@
+"""Cold-start benchmark for the pre-check agent.
+
+Every scenario runs in a fresh interpreter, the way a CI job or a batch
+worker starts, and is timed from process start to exit:
+
+- ``import``: ``import vnf_agent`` and nothing else.
+- ``template``: a pre-check planned by the rules and reported with the
+  template, which never talks to an LLM.
+- ``cached``: the same pre-check with every tool result already cached.
+- ``llm-cached``: a pre-check planned and reported by the LLM, run like the
+  command line (connections pre-opened) with every LLM answer already in the
+  LLM cache, as a CI retry is. A stub endpoint started by the benchmark
+  answers the run that fills the cache. A timed run that does not get both
+  answers from the cache, or falls back to the heuristic plan or the
+  template report, fails the benchmark.
+
+``--importtime`` adds the slowest imports of ``vnf_agent`` as reported by
+``python -X importtime``. ``--agent-dir`` points at another checkout, so two
+versions can be compared on the same machine::
+
+    python vnf_bench.py --runs 10 --importtime
+    python vnf_bench.py --runs 10 --agent-dir ../vnf-agent-old
+
+A checkout whose ``run_agent`` predates the ``plan_strategy`` and
+``summary_mode`` options runs ``run_agent(goal)``, its only pipeline, in
+every scenario but ``import``. Those timings include its LLM calls, so only
+the ``import`` scenario compares like with like, and ``llm-cached`` is not
+checked for cache use.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+SCENARIOS = ("import", "template", "cached", "llm-cached")
+
+# Checkouts from before the plan/summary options (and their command-line flags) only have run_agent(goal)
+_CHILD = """
+import inspect, json, sys
+sys.path.insert(0, {agent_dir!r})
+import vnf_agent
+options = {{"plan_strategy", "summary_mode"}} <= set(inspect.signature(vnf_agent.run_agent).parameters)
+if {goal!r} and options:
+    vnf_agent.main(["--plan-strategy", {strategy!r}, "--summary-mode", {summary!r}, {goal!r}])
+elif {goal!r}:
+    vnf_agent.run_agent({goal!r})
+cache = getattr(vnf_agent, "_stores", {{}}).get("llm_cache")
+sys.stdout.write("\\n" + json.dumps({{"openai": "openai" in sys.modules, "options": options,
+                                      "llm_cache": cache.stats() if cache is not None else None}}) + "\\n")
+"""
+
+
+class _StubLLM(BaseHTTPRequestHandler):
+    """OpenAI-compatible endpoint answering every chat completion with the same text."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply({})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply({"id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+                     "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                     "choices": [{"index": 0, "finish_reason": "stop",
+                                  "message": {"role": "assistant", "content": "Benchmark summary."}}]})
+
+
+def _run_child(agent_dir: str, goal: str, env: Dict[str, str], llm: bool = False) -> Tuple[float, Dict[str, Any], str]:
+    """Seconds one fresh interpreter takes, what it reports about itself, and its output."""
+    strategy, summary = ("llm", "llm") if llm else ("rules", "template")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _CHILD.format(agent_dir=agent_dir, goal=goal, strategy=strategy,
+                                                               summary=summary)],
+                          env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark run failed:\n{proc.stderr}")
+    return seconds, json.loads(proc.stdout.strip().splitlines()[-1]), proc.stdout
+
+
+def _check_llm_cached(report: Dict[str, Any], output: str) -> None:
+    """Raise unless a run got its plan and its report from the warm LLM cache."""
+    stats = report.get("llm_cache") or {}
+    fallbacks = [line for line in output.splitlines()
+                 if line.startswith("ERROR: LLM planning call failed") or line.startswith("LLM summary failed")]
+    if stats.get("misses") or stats.get("hits") != 2 or fallbacks:
+        raise RuntimeError(f"warm LLM cache not used: {stats}\n" + "\n".join(fallbacks))
+
+
+def run_scenario(name: str, agent_dir: str, runs: int, goal: str, package_dir: str) -> Dict[str, Any]:
+    """Time ``runs`` cold starts of one scenario."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, VNF_PACKAGE_DIR=package_dir, VNF_AGENT_LLM_CACHE="off",
+                   VNF_AGENT_TOOL_STATS="memory", VNF_AGENT_TOOL_CACHE="off")
+        llm = name == "llm-cached"
+        if name == "cached":
+            env["VNF_AGENT_TOOL_CACHE"] = os.path.join(tmp, "tools.sqlite")
+            _run_child(agent_dir, goal, env)  # fills the cache
+        stub = None
+        if llm:
+            stub = ThreadingHTTPServer(("127.0.0.1", 0), _StubLLM)
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+            # An OpenAI endpoint, so the plan is asked of the LLM too (Ollama is assumed not to call tools)
+            env.update(VNF_AGENT_LLM_CACHE=os.path.join(tmp, "llm.sqlite"), PROVIDER="openai",
+                       OPENAI_API_KEY="bench", OPENAI_BASE_URL=f"http://127.0.0.1:{stub.server_address[1]}/v1")
+        try:
+            if llm:
+                _run_child(agent_dir, goal, env, llm)  # fills the cache
+            times, report = [], {}
+            for _ in range(runs):
+                seconds, report, output = _run_child(agent_dir, goal if name != "import" else "", env, llm)
+                times.append(seconds)
+                if llm and report.get("options", True):
+                    _check_llm_cached(report, output)
+        finally:
+            if stub is not None:
+                stub.shutdown()
+                stub.server_close()
+    return {"scenario": name, "runs": runs, "min_seconds": min(times),
+            "median_seconds": statistics.median(times), "openai_imported": report.get("openai"),
+            "default_pipeline": name != "import" and not report.get("options", True)}
+
+
+def slowest_imports(agent_dir: str, limit: int = 15) -> List[Tuple[str, float]]:
+    """(module, cumulative seconds) of the modules ``vnf_agent`` imports directly, slowest first."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           f"import sys; sys.path.insert(0, {agent_dir!r}); import vnf_agent"],
+                          capture_output=True, text=True, check=True)
+    # Children are listed before their parent, one indentation level deeper
+    entries = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                entries.append((name[1:].rstrip(), int(cumulative) / 1e6))
+    end = next(i for i, (name, _) in enumerate(entries) if name.strip() == "vnf_agent" and not name.startswith(" "))
+    start = end
+    while start > 0 and entries[start - 1][0].startswith(" "):
+        start -= 1
+    direct = [(name.strip(), seconds) for name, seconds in entries[start:end] if not name.startswith("   ")]
+    return [("vnf_agent", entries[end][1])] + sorted(direct, key=lambda e: -e[1])[:limit]
+
+
+def main(argv: List[str] | None = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for vnf_agent.")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per scenario.")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="Scenario to run (default: all).")
+    parser.add_argument("--agent-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Checkout whose vnf_agent is benchmarked (default: this one).")
+    parser.add_argument("--package", default="acme_firewall_v1.zip",
+                        help="Package pre-checked by the template and cached scenarios; it need not exist.")
+    parser.add_argument("--package-dir", default=".", help="Directory the package is looked up in.")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args(argv)
+
+    goal = f"Please perform a pre-check on the VNF package named '{args.package}'"
+    results = [run_scenario(name, os.path.abspath(args.agent_dir), args.runs, goal, args.package_dir)
+               for name in args.scenario or SCENARIOS]
+    imports = slowest_imports(os.path.abspath(args.agent_dir)) if args.importtime else []
+    if args.json:
+        print(json.dumps({"scenarios": results, "imports": imports}, indent=2))
+        return
+    print(f"{'scenario':<12} {'runs':>5} {'min':>9} {'median':>9}  openai imported")
+    for r in results:
+        print(f"{r['scenario']:<12} {r['runs']:>5} {r['min_seconds']:>8.3f}s {r['median_seconds']:>8.3f}s  "
+              f"{'yes' if r['openai_imported'] else 'no'}{'  (run_agent(goal))' if r['default_pipeline'] else ''}")
+    if any(r["default_pipeline"] for r in results):
+        print("\n(run_agent(goal)): the checkout predates plan_strategy/summary_mode; timings include its LLM calls.")
+    if imports:
+        print("\nslowest imports (cumulative):")
+        for name, seconds in imports:
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
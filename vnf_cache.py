@@ -0,0 +1,276 @@
+"""Persistent caches for the VNF pre-check agent.
+
+Values are stored as strings in SQLite so several agent processes (CI jobs,
+batch workers) can share one cache file.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+
+class SqliteCache:
+    """On-disk key/value store with TTL expiry, LRU size eviction and hit/miss counters."""
+
+    def __init__(self, path: str, table: str = "entries", ttl_seconds: float | None = None,
+                 max_entries: int | None = None):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        # WAL lets readers in other processes proceed during writes; NORMAL skips the fsync per commit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.max_entries is not None:
+                (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+                if count > self.max_entries:
+                    self._conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN "
+                        f"(SELECT key FROM {self.table} ORDER BY accessed ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (size,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": size, "path": self.path}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- LLM RESPONSE CACHE ---
+def _jsonable(obj: Any) -> Any:
+    """Fallback encoder for SDK objects (e.g. the planning message echoed into the summary prompt)."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_none=True)
+    return str(obj)
+
+
+def llm_cache_key(model: str, provider: str, messages: List[Any], tools: Any = None,
+                  tool_choice: Any = None) -> str:
+    """Stable content hash of everything that determines an LLM response."""
+    payload = json.dumps(
+        {"model": model, "provider": provider, "messages": messages, "tools": tools, "tool_choice": tool_choice},
+        sort_keys=True, separators=(",", ":"), default=_jsonable,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def open_llm_cache() -> SqliteCache | None:
+    """LLM response cache configured from the environment; None when disabled.
+
+    VNF_AGENT_LLM_CACHE: database path, or "off" to disable (default .vnf_agent_cache/llm.sqlite)
+    VNF_AGENT_LLM_CACHE_TTL: seconds before an entry expires (default 86400)
+    VNF_AGENT_LLM_CACHE_MAX_ENTRIES: least recently used entries beyond this are evicted (default 10000)
+    """
+    path = os.getenv("VNF_AGENT_LLM_CACHE", os.path.join(".vnf_agent_cache", "llm.sqlite"))
+    if path.lower() in {"", "0", "off", "false", "no"}:
+        return None
+    return SqliteCache(
+        path,
+        table="llm_responses",
+        ttl_seconds=float(os.getenv("VNF_AGENT_LLM_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("VNF_AGENT_LLM_CACHE_MAX_ENTRIES", "10000")),
+    )
+
+
+# --- TOOL RESULT CACHE ---
+class ToolResultCache:
+    """Tool JSON outputs in an in-memory LRU tier in front of an optional SqliteCache tier."""
+
+    def __init__(self, disk: SqliteCache | None = None, memory_entries: int = 4096):
+        self.disk = disk
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, value: str) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+        value = self.disk.get(key) if self.disk is not None else None
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+_digest_memo: Dict[tuple, str] = {}
+_digest_lock = threading.Lock()
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, memoized per (path, size, mtime) so unchanged packages are hashed once per process."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_memo.get(memo_key)
+    if digest is not None:
+        return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def tool_cache_key(tool_name: str, tool_version: str, package_id: str) -> str:
+    return f"{tool_name}:{tool_version}:{package_id}"
+
+
+def open_tool_cache() -> ToolResultCache | None:
+    """Tool result cache configured from the environment; None when disabled.
+
+    VNF_AGENT_TOOL_CACHE: database path, "memory" for the in-memory tier only, or "off" to disable
+                          (default .vnf_agent_cache/tools.sqlite)
+    VNF_AGENT_TOOL_CACHE_TTL: seconds before a disk entry expires (default 604800)
+    VNF_AGENT_TOOL_CACHE_MAX_ENTRIES: disk entries kept, least recently used evicted first (default 100000)
+    VNF_AGENT_TOOL_CACHE_MEMORY_ENTRIES: in-memory LRU size (default 4096)
+    """
+    path = os.getenv("VNF_AGENT_TOOL_CACHE", os.path.join(".vnf_agent_cache", "tools.sqlite"))
+    if path.lower() in {"", "0", "off", "false", "no"}:
+        return None
+    disk = None
+    if path.lower() != "memory":
+        disk = SqliteCache(
+            path,
+            table="tool_results",
+            ttl_seconds=float(os.getenv("VNF_AGENT_TOOL_CACHE_TTL", "604800")),
+            max_entries=int(os.getenv("VNF_AGENT_TOOL_CACHE_MAX_ENTRIES", "100000")),
+        )
+    return ToolResultCache(disk, memory_entries=int(os.getenv("VNF_AGENT_TOOL_CACHE_MEMORY_ENTRIES", "4096")))
+
+
+# --- TOOL STATISTICS ---
+class ToolStats:
+    """Per-tool run count, rejection count and moving-average duration, optionally shared through a SqliteCache."""
+
+    def __init__(self, disk: SqliteCache | None = None, smoothing: float = 0.2):
+        self.disk = disk
+        self.smoothing = smoothing
+        self._memory: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, tool_name: str) -> Dict[str, float]:
+        # Other processes sharing the database update it too, so it wins over the memory copy
+        raw = self.disk.get(tool_name) if self.disk is not None else None
+        if raw is not None:
+            try:
+                self._memory[tool_name] = json.loads(raw)
+            except ValueError:
+                pass
+        return self._memory.get(tool_name) or {"runs": 0, "rejections": 0, "seconds": 0.0}
+
+    def get(self, tool_name: str) -> Dict[str, float]:
+        """{"runs", "rejections", "seconds"} for a tool; seconds is the smoothed duration of a run."""
+        with self._lock:
+            if tool_name not in self._memory:
+                return dict(self._load(tool_name))
+            return dict(self._memory[tool_name])
+
+    def record(self, tool_name: str, seconds: float, rejected: bool) -> None:
+        with self._lock:
+            stats = dict(self._load(tool_name))
+            stats["seconds"] = seconds if not stats["runs"] else \
+                stats["seconds"] + self.smoothing * (seconds - stats["seconds"])
+            stats["runs"] += 1
+            stats["rejections"] += int(rejected)
+            self._memory[tool_name] = stats
+        if self.disk is not None:
+            self.disk.set(tool_name, json.dumps(stats))
+
+    def rejection_rate(self, tool_name: str) -> float:
+        """Share of runs that rejected the package, smoothed so unseen tools start at 1/2."""
+        stats = self.get(tool_name)
+        return (stats["rejections"] + 1) / (stats["runs"] + 2)
+
+
+def open_tool_stats() -> ToolStats | None:
+    """Tool statistics configured from the environment; None when disabled.
+
+    VNF_AGENT_TOOL_STATS: database path, "memory" to keep them for this process only, or "off" to disable
+                          (default .vnf_agent_cache/tools.sqlite, next to the tool cache)
+    """
+    path = os.getenv("VNF_AGENT_TOOL_STATS", os.path.join(".vnf_agent_cache", "tools.sqlite"))
+    if path.lower() in {"", "0", "off", "false", "no"}:
+        return None
+    return ToolStats(SqliteCache(path, table="tool_stats") if path.lower() != "memory" else None)
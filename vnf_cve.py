@@ -0,0 +1,350 @@
+"""Local vulnerability database: a memory-mapped index over OSV records.
+
+``build_index`` turns OSV advisories (one JSON record per line) into one
+binary file of flat NumPy arrays:
+
+- a sorted table of 64-bit (ecosystem, package name) hashes, each pointing
+  at a contiguous run of affected-version intervals;
+- the interval bounds, with every version encoded as a fixed-width integer
+  key in its ecosystem's ordering (dpkg, apk, PEP 440, SemVer) so ranges
+  compare as plain integer vectors;
+- advisory ids and severities.
+
+``CveIndex`` maps that file read-only and views the arrays in place. Opening
+it costs no parsing, and every worker process that opens the same index
+shares the same page-cache pages. ``CveIndex.match`` looks up all
+components of a package with one ``searchsorted`` and tests every candidate
+interval in one vectorized comparison, so matching thousands of components
+takes milliseconds.
+
+Build an index with ``python vnf_cve.py build osv.jsonl cve.idx``.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"VNFCVE01"
+# Version key layout, stored in the index header: an index built with another layout must be rebuilt
+KEY_LAYOUT = 2
+# Version keys: epoch, then (text, number) segments of the upstream version and of the package revision
+UPSTREAM_SEGMENTS = 6
+REVISION_SEGMENTS = 3
+KEY_WIDTH = 1 + 2 * (UPSTREAM_SEGMENTS + REVISION_SEGMENTS)
+_MAX = np.iinfo(np.int64).max
+_MIN = np.iinfo(np.int64).min
+SEVERITIES = ("unknown", "low", "moderate", "high", "critical")
+_SEVERITY_ALIASES = {"medium": "moderate", "important": "high"}
+
+# Text segments are packed 6 bits per character, dpkg order: "~" before the end of the text, before letters,
+# before other characters. The first SEGMENT_CHARS characters count.
+SEGMENT_CHARS = 10
+_CHAR_ORDER = {"~": 1, **{c: 3 + i for i, c in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")},
+               **{c: 55 + i for i, c in enumerate("+-.:_")}}
+_END_OF_TEXT, _OTHER_CHAR = 2, 60
+DPKG_ECOSYSTEMS = ("debian", "ubuntu", "rpm", "red hat", "rocky linux", "almalinux", "opensuse", "suse", "mageia")
+# apk suffixes: the first ones sort before the release, the others after it
+_APK_SUFFIXES = {"alpha": "~a", "beta": "~b", "pre": "~c", "rc": "~d",
+                 "cvs": "+a", "svn": "+b", "git": "+c", "hg": "+d", "p": "+e"}
+_PEP440 = re.compile(
+    r"v?(?:(?P<epoch>\d+)!)?(?P<release>\d+(?:\.\d+)*)"
+    r"(?:[-_.]?(?P<pre>alpha|beta|preview|pre|rc|a|b|c)[-_.]?(?P<pre_n>\d+)?)?"
+    r"(?:-(?P<post_implicit>\d+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post>\d+)?)?"
+    r"(?:[-_.]?(?P<dev>dev)[-_.]?(?P<dev_n>\d+)?)?"
+    r"(?:\+[a-z0-9]+(?:[-_.][a-z0-9]+)*)?", re.IGNORECASE)
+_PEP440_PRE = {"a": -3, "alpha": -3, "b": -2, "beta": -2, "c": -1, "rc": -1, "pre": -1, "preview": -1}
+
+
+def _ecosystem(ecosystem: str) -> str:
+    """OSV ecosystem name without its release ("Debian:12" -> "debian")."""
+    return ecosystem.split(":", 1)[0].strip().lower()
+
+
+def package_key(ecosystem: str, name: str) -> int:
+    """64-bit hash of the normalized (ecosystem, name) pair."""
+    ecosystem = _ecosystem(ecosystem)
+    name = name.strip().lower()
+    if ecosystem == "pypi":
+        name = re.sub(r"[-_.]+", "-", name)
+    digest = hashlib.blake2b(f"{ecosystem}\0{name}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _segments(text: str, count: int) -> List[int]:
+    """dpkg-ordered key of a version part: count (text, number) segments, each text packed into one integer."""
+    key = []
+    for letters, digits in re.findall(r"(\D*)(\d*)", text):
+        if letters or digits:
+            packed = 0
+            for c in letters[:SEGMENT_CHARS].ljust(SEGMENT_CHARS, "\0"):
+                packed = packed * 64 + (_CHAR_ORDER.get(c, _OTHER_CHAR) if c != "\0" else _END_OF_TEXT)
+            key += [packed, int(digits[:18] or 0)]
+    empty = sum(_END_OF_TEXT * 64 ** i for i in range(SEGMENT_CHARS))
+    key += [empty, 0] * count  # a part that ends compares like empty segments, as in dpkg
+    return key[:2 * count]
+
+
+def _dpkg_key(epoch: int, upstream: str, revision: str = "") -> List[int]:
+    return [epoch, *_segments(upstream, UPSTREAM_SEGMENTS), *_segments(revision, REVISION_SEGMENTS)]
+
+
+def _pep440_key(match: "re.Match[str]") -> List[int]:
+    release = [int(n[:18]) for n in match["release"].split(".")][:KEY_WIDTH - 5]
+    release += [0] * (KEY_WIDTH - 5 - len(release))
+    post = match["post_implicit"] or match["post"] or ("0" if match["post_l"] else None)
+    if match["pre"]:
+        pre = [_PEP440_PRE[match["pre"].lower()], int(match["pre_n"] or 0)]
+    else:
+        # A bare dev release (1.0.dev1) comes before the pre-releases of its version
+        pre = [-4 if match["dev"] and post is None else 0, 0]
+    return [int(match["epoch"] or 0), *release, *pre, -1 if post is None else int(post),
+            int(match["dev_n"] or 0) if match["dev"] else _MAX]
+
+
+def version_key(version: str, ecosystem: str = "") -> List[int]:
+    """Fixed-width integer key ordering the versions of one package the way its ecosystem does.
+
+    PyPI versions follow PEP 440 (3.0.0rc1 < 3.0.0 < 3.0.0.post1). Debian,
+    Ubuntu and RPM versions follow dpkg: epoch, upstream version, then the
+    revision after the last "-", with "~" sorting before anything (so
+    3.0.11-1~deb12u1 < 3.0.11-1~deb12u2 < 3.0.11-1) and letters after the
+    end (1.1.1a > 1.1.1). Alpine apk versions map onto the same ordering:
+    _alpha, _beta, _pre and _rc suffixes sort before the release, _p and
+    friends after it, and -rN is the revision. Other ecosystems are read as
+    SemVer: a "-" suffix is a pre-release and "+" build metadata is ignored.
+    Only the first UPSTREAM_SEGMENTS and REVISION_SEGMENTS segments count.
+    """
+    version = version.strip()
+    ecosystem = _ecosystem(ecosystem)
+    if ecosystem == "pypi":
+        match = _PEP440.fullmatch(version)
+        if match is not None:
+            return _pep440_key(match)
+    epoch = 0
+    if re.match(r"^\d+:", version):
+        epoch_text, version = version.split(":", 1)
+        epoch = int(epoch_text)
+    if ecosystem in DPKG_ECOSYSTEMS:
+        upstream, _, revision = version.rpartition("-") if "-" in version else (version, "", "")
+        return _dpkg_key(epoch, upstream, revision)
+    if ecosystem == "alpine":
+        upstream, revision = re.match(r"(.*?)(?:-r(\d+))?$", version).groups()
+        upstream = re.sub(r"_([a-z]+)", lambda m: _APK_SUFFIXES.get(m[1], "+" + m[1]), upstream)
+        return _dpkg_key(epoch, upstream, revision or "")
+    release, _, pre_release = version.lstrip("vV").split("+", 1)[0].partition("-")
+    return _dpkg_key(epoch, f"{release}~{pre_release}" if pre_release else release)
+
+
+def _severity(record: Dict[str, Any]) -> int:
+    sources = [record.get("database_specific") or {}]
+    sources += [a.get("database_specific") or {} for a in record.get("affected") or []]
+    for source in sources:
+        value = str(source.get("severity") or "").lower()
+        value = _SEVERITY_ALIASES.get(value, value)
+        if value in SEVERITIES:
+            return SEVERITIES.index(value)
+    return 0
+
+
+def _display_id(record: Dict[str, Any]) -> str:
+    cve = next((a for a in record.get("aliases") or [] if a.startswith("CVE-")), None)
+    return f"{record['id']} ({cve})" if cve and cve != record["id"] else record["id"]
+
+
+def _intervals(affected: Dict[str, Any]) -> Iterator[Tuple[List[int], List[int], bool]]:
+    """(low, high, high inclusive) version keys for each affected range of one package."""
+    ecosystem = affected["package"]["ecosystem"]
+    for rng in affected.get("ranges") or []:
+        if rng.get("type") not in ("SEMVER", "ECOSYSTEM"):
+            continue
+        low = None
+        for event in rng.get("events") or []:
+            if "introduced" in event:
+                low = [_MIN] * KEY_WIDTH if event["introduced"] in ("0", "") \
+                    else version_key(event["introduced"], ecosystem)
+            elif low is not None and "fixed" in event:
+                yield low, version_key(event["fixed"], ecosystem), False
+                low = None
+            elif low is not None and "last_affected" in event:
+                yield low, version_key(event["last_affected"], ecosystem), True
+                low = None
+        if low is not None:
+            yield low, [_MAX] * KEY_WIDTH, True
+    for version in affected.get("versions") or []:
+        key = version_key(version, ecosystem)
+        yield key, key, True
+
+
+def build_index(records: Iterator[Dict[str, Any]], path: str) -> Dict[str, int]:
+    """Write an index file for OSV records. Returns packages/intervals/advisories counts."""
+    rows: List[Tuple[int, List[int], List[int], bool, int]] = []
+    advisories: List[str] = []
+    severities: List[int] = []
+    for record in records:
+        if not record.get("id") or record.get("withdrawn"):
+            continue
+        advisory = len(advisories)
+        advisories.append(_display_id(record))
+        severities.append(_severity(record))
+        for affected in record.get("affected") or []:
+            package = affected.get("package") or {}
+            if not package.get("ecosystem") or not package.get("name"):
+                continue
+            key = package_key(package["ecosystem"], package["name"])
+            for low, high, inclusive in _intervals(affected):
+                rows.append((key, low, high, inclusive, advisory))
+
+    rows.sort(key=lambda r: r[0])
+    row_keys = np.array([r[0] for r in rows], dtype=np.uint64)
+    keys, starts, counts = np.unique(row_keys, return_index=True, return_counts=True)
+    ids_blob = "\n".join(advisories).encode("utf-8")
+    arrays = {
+        "keys": keys,
+        "starts": starts.astype(np.int64),
+        "counts": counts.astype(np.int64),
+        "low": np.array([r[1] for r in rows], dtype=np.int64).reshape(-1, KEY_WIDTH),
+        "high": np.array([r[2] for r in rows], dtype=np.int64).reshape(-1, KEY_WIDTH),
+        "inclusive": np.array([r[3] for r in rows], dtype=np.bool_),
+        "advisory": np.array([r[4] for r in rows], dtype=np.int32),
+        "severity": np.array(severities, dtype=np.int8),
+        "ids": np.frombuffer(ids_blob, dtype=np.uint8),
+    }
+    header: Dict[str, Any] = {"arrays": {}, "key_layout": KEY_LAYOUT}
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // 64) * 64  # keep every array 64-byte aligned
+    header["digest"] = hashlib.sha256(b"".join(a.tobytes() for a in arrays.values())).hexdigest()
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // 64) * 64
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC + len(header_bytes).to_bytes(8, "little") + header_bytes)
+        for name, array in arrays.items():
+            fh.seek(data_start + header["arrays"][name]["offset"])
+            fh.write(array.tobytes())
+        fh.truncate(data_start + offset)
+    os.replace(tmp, path)  # readers never see a half-written index
+    return {"packages": len(keys), "intervals": len(rows), "advisories": len(advisories)}
+
+
+def _lex_compare(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise lexicographic comparison of two key matrices: -1, 0 or 1 per row."""
+    diff = (a > b).astype(np.int8) - (a < b).astype(np.int8)  # no subtraction: keys use the int64 extremes
+    first = np.argmax(diff != 0, axis=1)
+    return diff[np.arange(len(diff)), first]
+
+
+class CveIndex:
+    """Read-only, memory-mapped view of an index file written by build_index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a CVE index file.")
+        header_len = int.from_bytes(self._mm[len(MAGIC):len(MAGIC) + 8], "little")
+        header = json.loads(self._mm[len(MAGIC) + 8:len(MAGIC) + 8 + header_len])
+        if header.get("key_layout") != KEY_LAYOUT:
+            raise ValueError(f"'{path}' was built with a different version key layout; rebuild it.")
+        data_start = -(-(len(MAGIC) + 8 + header_len) // 64) * 64
+        self.fingerprint = header["digest"]
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+            arrays[name] = np.frombuffer(self._mm, dtype=dtype, count=count,
+                                         offset=data_start + spec["offset"]).reshape(spec["shape"])
+        self._keys, self._starts, self._counts = arrays["keys"], arrays["starts"], arrays["counts"]
+        self._low, self._high, self._inclusive = arrays["low"], arrays["high"], arrays["inclusive"]
+        self._advisory, self._severity = arrays["advisory"], arrays["severity"]
+        self._ids_blob = arrays["ids"]
+        self._ids: List[str] | None = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _advisory_id(self, i: int) -> str:
+        if self._ids is None:
+            self._ids = self._ids_blob.tobytes().decode("utf-8").split("\n")
+        return self._ids[i]
+
+    def match(self, components: Sequence[Sequence[str]]) -> List[Dict[str, Any]]:
+        """Advisories affecting (ecosystem, name, version, ...) components, one entry per component and advisory."""
+        if not components or not len(self._keys):
+            return []
+        keys = np.array([package_key(c[0], c[1]) for c in components], dtype=np.uint64)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        hit = np.flatnonzero(self._keys[pos] == keys)
+        if not len(hit):
+            return []
+        # One candidate row per (component, interval of its package)
+        counts = self._counts[pos[hit]]
+        owner = np.repeat(hit, counts)
+        first = np.cumsum(counts) - counts
+        rows = np.repeat(self._starts[pos[hit]], counts) + np.arange(counts.sum()) - np.repeat(first, counts)
+        versions = np.array([version_key(components[i][2], components[i][0]) for i in hit], dtype=np.int64)
+        version_rows = versions[np.repeat(np.arange(len(hit)), counts)]
+
+        above_low = _lex_compare(version_rows, self._low[rows]) >= 0
+        below_high = _lex_compare(version_rows, self._high[rows])
+        affected = above_low & ((below_high < 0) | ((below_high == 0) & self._inclusive[rows]))
+
+        findings: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for i, row in zip(owner[affected], rows[affected]):
+            advisory = int(self._advisory[row])
+            if (i, advisory) not in findings:
+                ecosystem, name, version = components[i][:3]
+                findings[(i, advisory)] = {"ecosystem": ecosystem, "name": name, "version": version,
+                                           "advisory": self._advisory_id(advisory),
+                                           "severity": SEVERITIES[int(self._severity[advisory])]}
+        return list(findings.values())
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+_loaded: Dict[str, Any] = {}
+_load_lock = threading.Lock()
+
+
+def load_cve_index(path: str | None = None) -> CveIndex | None:
+    """Index named in VNF_AGENT_CVE_INDEX, reopened when the file is replaced; None when not configured."""
+    path = path or os.getenv("VNF_AGENT_CVE_INDEX")
+    if not path:
+        return None
+    st = os.stat(path)
+    stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+    with _load_lock:
+        if _loaded.get("stamp") != stamp:
+            _loaded.update(stamp=stamp, index=CveIndex(path))
+        return _loaded["index"]
+
+
+def _read_records(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """OSV records from JSON-lines files, single-record .json files or directories of them."""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from _read_records(sorted(os.path.join(path, n) for n in os.listdir(path)))
+        elif path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as fh:
+                yield json.load(fh)
+        else:
+            with open(path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] != "build":
+        sys.exit("usage: python vnf_cve.py build <osv.jsonl|dir>... <index file>")
+    print(build_index(_read_records(sys.argv[2:-1]), sys.argv[-1]))
@@ -0,0 +1,245 @@
+"""Load balancing of LLM requests over a pool of endpoints of one provider.
+
+A provider can be given several endpoints: Azure OpenAI resources that
+host the same deployment, or Ollama hosts serving the same model. Each
+endpoint gets its own ``ProviderLimiter``. Each endpoint's quota and
+concurrency are therefore its own, and throughput adds up as endpoints
+are added.
+
+With more than one endpoint, requests wait at the pool until some
+endpoint's limiter has a free slot (not paused by a Retry-After, under its
+concurrency limit), and are then bound to the free endpoint with the lowest score: its
+smoothed latency times (requests outstanding + 1). So a fast host with a
+short queue wins (least outstanding requests, weighted by latency), and
+no request is stuck behind a slow host while another one is idle. Recent
+failures raise an endpoint's score.
+
+An endpoint that fails ``eject_failures`` requests in a row is ejected
+from the pool. The ejection lasts ``eject_seconds``, doubled for each
+ejection since its last success, up to MAX_EJECT_SECONDS. When the time
+is up, a health check (``vnf_http.health_check``) decides whether it
+rejoins or stays out for another round. If every endpoint is ejected,
+requests still go to the least bad one; whether to stop calling the
+provider altogether is the circuit breaker's job (vnf_resilience).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List
+
+from vnf_http import health_check
+from vnf_log import log
+from vnf_ratelimit import ProviderLimiter, provider_fault
+
+MAX_EJECT_SECONDS = 300.0
+# Weight of the newest latency in an endpoint's smoothed latency
+LATENCY_SMOOTHING = 0.2
+# Seconds a waiting request sleeps before looking for a free endpoint again, when no slot was released
+# meanwhile (a paused endpoint resumes, a concurrency limit grows)
+READY_POLL = 0.1
+
+
+class Endpoint:
+    """One base URL of the pool and what the balancer knows about it."""
+
+    def __init__(self, url: str, limiter: ProviderLimiter):
+        self.url = url
+        self.limiter = limiter
+        self.outstanding = 0
+        self.latency: float | None = None
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0  # in a row
+        self.ejections = 0  # since the last success
+        self.ejected_until = 0.0  # 0 while in the pool
+        self.checking = False
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (self.outstanding + 1) * (1 + self.failures)
+
+
+class EndpointPool:
+    """Least-outstanding, latency-weighted routing with ejection over the endpoints of one provider."""
+
+    def __init__(self, provider: str, urls: Callable[[], List[str]], eject_failures: int = 3,
+                 eject_seconds: float = 30.0, check: Callable[[str], bool] = health_check):
+        self.provider = provider
+        # Resolved on first use, so runs that never call the LLM need no endpoint configuration
+        self._urls = urls
+        self._endpoints: List[Endpoint] | None = None
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self._check = check
+        # Wake-up callbacks of requests waiting for a free endpoint, oldest first
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, provider: str, urls: Callable[[], List[str]]) -> "EndpointPool":
+        """Settings from the environment:
+
+        VNF_AGENT_LLM_EJECT_FAILURES: failed requests in a row that eject an endpoint (default 3, 0 never)
+        VNF_AGENT_LLM_EJECT_SECONDS: seconds of a first ejection (default 30)
+        """
+        return cls(provider, urls, int(os.getenv("VNF_AGENT_LLM_EJECT_FAILURES", "3")),
+                   float(os.getenv("VNF_AGENT_LLM_EJECT_SECONDS", "30")))
+
+    def endpoints(self) -> List[Endpoint]:
+        """The pool's endpoints. Raises RuntimeError when the provider is not configured."""
+        if self._endpoints is None:
+            urls = self._urls()
+            with self._lock:
+                if self._endpoints is None:
+                    self._endpoints = [
+                        Endpoint(url, ProviderLimiter.from_env(
+                            self.provider, name=self.provider if len(urls) == 1 else f"{self.provider} {url}"))
+                        for url in urls]
+                    for endpoint in self._endpoints:
+                        endpoint.limiter.concurrency.on_release = self._wake_one
+        return self._endpoints
+
+    def _wake_one(self) -> None:
+        """An endpoint has a free slot: let the longest-waiting request look again."""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft()()
+
+    def _eject(self, endpoint: Endpoint, why: str) -> None:
+        endpoint.ejections += 1
+        seconds = min(MAX_EJECT_SECONDS, self.eject_seconds * 2 ** (endpoint.ejections - 1))
+        endpoint.ejected_until = time.monotonic() + seconds
+        log(f"WARN: LLM endpoint {endpoint.url} {why}; ejected from the pool for {seconds:g}s.")
+
+    def _health_check(self, endpoint: Endpoint) -> None:
+        healthy = self._check(endpoint.url)
+        with self._lock:
+            endpoint.checking = False
+            if healthy:
+                endpoint.ejected_until, endpoint.failures = 0.0, 0
+                log(f"AGENT: LLM endpoint {endpoint.url} passed its health check; back in the pool.")
+            else:
+                self._eject(endpoint, "failed its health check")
+
+    def _try_select(self, wake: Callable[[], None] | None = None) -> Endpoint | None:
+        """Bind a request to the best endpoint with a free slot. When none has one, queue ``wake`` and return None."""
+        endpoints = self.endpoints()
+        if not endpoints:
+            raise RuntimeError(f"No LLM endpoints configured for provider={self.provider}")
+        now = time.monotonic()
+        with self._lock:
+            for endpoint in endpoints:
+                if endpoint.ejected_until and now >= endpoint.ejected_until and not endpoint.checking:
+                    endpoint.checking = True
+                    threading.Thread(target=self._health_check, args=(endpoint,), daemon=True).start()
+            candidates = [e for e in endpoints if not e.ejected_until] or endpoints
+            ready = [e for e in candidates if e.limiter.has_capacity()]
+            # A lone endpoint queues requests in its own limiter; there is nowhere else to send them
+            if not ready and wake is not None and len(endpoints) > 1:
+                self._waiters.append(wake)
+                return None
+            candidates = ready or candidates
+            known = [e.latency for e in endpoints if e.latency is not None]
+            default_latency = min(known) if known else 1.0
+            best = min(e.score(default_latency) for e in candidates)
+            endpoint = random.choice([e for e in candidates if e.score(default_latency) == best])
+            endpoint.outstanding += 1
+        return endpoint
+
+    def _forget(self, wake: Callable[[], None]) -> None:
+        with self._lock:
+            if wake in self._waiters:
+                self._waiters.remove(wake)
+
+    def _select(self) -> Endpoint:
+        while True:
+            event = threading.Event()
+            endpoint = self._try_select(event.set)
+            if endpoint is not None:
+                return endpoint
+            event.wait(READY_POLL)
+            self._forget(event.set)
+
+    async def _aselect(self) -> Endpoint:
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.create_future()
+
+            def wake(future=future):
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+            endpoint = self._try_select(wake)
+            if endpoint is not None:
+                return endpoint
+            try:
+                await asyncio.wait({future}, timeout=READY_POLL)
+            finally:
+                self._forget(wake)
+
+    def _done(self, endpoint: Endpoint, started: float, error: BaseException | None = None,
+              finished: bool = True) -> None:
+        """Account for a request to ``endpoint``; ``finished`` is False when it was abandoned (cancelled)."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if not finished:
+                return
+            endpoint.requests += 1
+            if error is None:
+                latency = time.monotonic() - started
+                endpoint.latency = latency if endpoint.latency is None else \
+                    endpoint.latency + LATENCY_SMOOTHING * (latency - endpoint.latency)
+                endpoint.failures = endpoint.ejections = 0
+            elif provider_fault(error):
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if (0 < self.eject_failures <= endpoint.failures and not endpoint.ejected_until
+                        and len(self._endpoints) > 1):
+                    self._eject(endpoint, f"failed {endpoint.failures} request(s) in a row "
+                                          f"({type(error).__name__})")
+
+    def call(self, fn: Callable[[str], Any], prompt_tokens: int = 0, kind: str = "default") -> Any:
+        """Run ``fn(base_url)``, a call of ``kind``, on the best endpoint, within that endpoint's limits."""
+        endpoint = self._select()
+        started = time.monotonic()
+        try:
+            response = endpoint.limiter.call(lambda: fn(endpoint.url), prompt_tokens, kind)
+        except Exception as e:
+            self._done(endpoint, started, e)
+            raise
+        except BaseException:
+            self._done(endpoint, started, finished=False)
+            raise
+        self._done(endpoint, started)
+        return response
+
+    async def acall(self, fn: Callable[[str], Awaitable[Any]], prompt_tokens: int = 0, kind: str = "default") -> Any:
+        """Async counterpart of call: ``fn(base_url)`` returns the awaitable request."""
+        endpoint = await self._aselect()
+        started = time.monotonic()
+        try:
+            response = await endpoint.limiter.acall(lambda: fn(endpoint.url), prompt_tokens, kind)
+        except Exception as e:
+            self._done(endpoint, started, e)
+            raise
+        except BaseException:
+            self._done(endpoint, started, finished=False)
+            raise
+        self._done(endpoint, started)
+        return response
+
+    def has_capacity(self) -> bool:
+        """Whether some endpoint in the pool would start a request at once."""
+        return any(not e.ejected_until and e.limiter.has_capacity() for e in self._endpoints or [])
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = []
+        for e in self._endpoints or []:
+            limiter = e.limiter.stats()
+            del limiter["provider"]
+            endpoints.append(dict(url=e.url, requests=e.requests, errors=e.errors, outstanding=e.outstanding,
+                                  latency=None if e.latency is None else round(e.latency, 3),
+                                  ejected=bool(e.ejected_until), **limiter))
+        return {"provider": self.provider, "endpoints": endpoints}
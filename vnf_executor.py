@@ -0,0 +1,257 @@
+"""Concurrent execution of tool calls with per-tool timeouts.
+
+Calls may name other calls they must wait for (``after``), so a
+dependency graph (package artifacts, then the tools reading them) runs
+with as much parallelism as it allows: each call starts as soon as the
+calls it depends on have finished. Calls not started yet can be cancelled,
+e.g. once an earlier result has made them pointless.
+
+Calls run on up to ``max_threads`` threads. Tools named in
+``process_tools`` (pure-Python work that holds the GIL) run on a pool of
+``max_processes`` worker processes instead, shared by all executors and
+started from a forkserver. An executor only starts a call when one of its
+threads or process slots is free, so a timeout counts from when the call
+is started, not from when it was queued.
+
+A call that outlives its timeout is abandoned and reported with a
+structured timeout result. A thread cannot be interrupted, so a timed-out
+thread finishes in the background. It is a daemon thread and never blocks
+interpreter exit. A timed-out process is stopped by terminating the pool's
+workers. Other process calls running at that moment are retried once on a
+fresh pool.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+from vnf_log import log
+
+MAX_THREADS = int(os.getenv("VNF_AGENT_TOOL_THREADS", "8"))
+MAX_PROCESSES = int(os.getenv("VNF_AGENT_TOOL_PROCESSES", "0")) or os.cpu_count() or 1
+# Seconds a tool may run when it has no timeout of its own
+DEFAULT_TIMEOUT = float(os.getenv("VNF_AGENT_TOOL_TIMEOUT", "300"))
+
+
+def load_timeouts(defaults: Dict[str, float]) -> Dict[str, float]:
+    """Per-tool timeouts: ``defaults`` overridden by VNF_AGENT_TOOL_TIMEOUTS ("tool=seconds,...")."""
+    timeouts = dict(defaults)
+    for item in os.getenv("VNF_AGENT_TOOL_TIMEOUTS", "").split(","):
+        name, sep, seconds = item.partition("=")
+        if sep:
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+def timeout_result(tool_name: str, seconds: float) -> str:
+    """Tool output recorded for a call that was cancelled at its timeout."""
+    return json.dumps({"error": "timeout", "timed_out": True, "timeout_seconds": seconds,
+                       "reason": f"{tool_name} did not finish within {seconds:g}s and was cancelled."})
+
+
+def _thread_future(call: Callable[[], str]) -> Future:
+    future: Future = Future()
+
+    def target():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(call())
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
+def process_context(fn: Callable) -> multiprocessing.context.BaseContext:
+    """Workers are forked from a single-threaded server process, never from this one.
+
+    Forking a process whose other threads hold locks (stdout, the cache
+    database, an archive reader) leaves those locks held forever in the
+    child. The forkserver imports the module of ``fn`` once, so starting a
+    worker stays cheap.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([fn.__module__])
+    return context
+
+
+# One worker pool for all executors, so workers are started (and import the tools) once per process
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool(fn: Callable, max_processes: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_processes, mp_context=process_context(fn))
+        return _pool
+
+
+def _restart_pool(pool: ProcessPoolExecutor) -> None:
+    """Terminate the workers of ``pool``, hung ones included; the next call starts a fresh pool.
+
+    Calls other executors had running on it fail with BrokenProcessPool, and
+    are retried once.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    # ProcessPoolExecutor has no public way to stop a running call
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Job:
+    __slots__ = ("key", "tool_name", "call", "process_call", "after", "timeout", "started", "deadline", "pool",
+                 "retried")
+
+    def __init__(self, key, tool_name, call, process_call, after, timeout):
+        self.key = key
+        self.tool_name = tool_name
+        self.call = call
+        self.process_call = process_call
+        self.after = after
+        self.timeout = timeout
+        self.started = 0.0
+        self.deadline = 0.0
+        self.pool = None
+        self.retried = False
+
+
+class ToolExecutor:
+    """Runs submitted tool calls concurrently and yields their outputs as they complete."""
+
+    def __init__(self, timeouts: Dict[str, float] | None = None, process_tools=(),
+                 max_threads: int = MAX_THREADS, max_processes: int = MAX_PROCESSES,
+                 default_timeout: float = DEFAULT_TIMEOUT):
+        self.timeouts = timeouts or {}
+        self.process_tools = frozenset(process_tools)
+        self.max_threads = max(1, max_threads)
+        self.max_processes = max(1, max_processes)
+        self.default_timeout = default_timeout
+        self._queued: Deque[_Job] = deque()
+        self._running: Dict[Future, _Job] = {}
+        self._finished = set()
+        # key -> seconds from start to completion (or to the timeout) of every finished call
+        self.durations: Dict[Any, float] = {}
+
+    def timeout(self, tool_name: str) -> float:
+        return self.timeouts.get(tool_name, self.default_timeout)
+
+    def submit(self, key: Any, tool_name: str, call: Callable[[], str],
+               process_call: Tuple[Callable[..., str], tuple] | None = None,
+               after: Iterable[Any] = (), timeout: float | None = None) -> None:
+        """Queue a call that starts once the calls keyed in ``after`` have finished, whatever their outcome.
+
+        ``process_call`` (a picklable function and its arguments) is used for
+        process tools. ``timeout`` overrides the tool's timeout.
+        """
+        if tool_name not in self.process_tools:
+            process_call = None
+        timeout = self.timeout(tool_name) if timeout is None else timeout
+        self._queued.append(_Job(key, tool_name, call, process_call, tuple(after), timeout))
+
+    def _count(self, in_process: bool) -> int:
+        return sum(1 for job in self._running.values() if (job.process_call is not None) == in_process)
+
+    def _dispatch(self) -> None:
+        threads, processes = self._count(False), self._count(True)
+        for job in list(self._queued):
+            in_process = job.process_call is not None
+            if (processes if in_process else threads) >= (self.max_processes if in_process else self.max_threads):
+                continue
+            if not all(key in self._finished for key in job.after):
+                continue
+            self._queued.remove(job)
+            if in_process:
+                fn, args = job.process_call
+                job.pool = _process_pool(fn, self.max_processes)
+                try:
+                    future = job.pool.submit(fn, *args)
+                except BrokenProcessPool:  # restarted by another executor since it was looked up
+                    _restart_pool(job.pool)
+                    job.pool = _process_pool(fn, self.max_processes)
+                    future = job.pool.submit(fn, *args)
+                processes += 1
+            else:
+                future = _thread_future(job.call)
+                threads += 1
+            job.started = time.monotonic()
+            job.deadline = job.started + job.timeout
+            self._running[future] = job
+
+    def cancel(self, predicate: Callable[[Any], bool]) -> List[Any]:
+        """Drop the queued calls whose key matches ``predicate`` and return their keys. Running calls go on."""
+        cancelled = [job for job in self._queued if predicate(job.key)]
+        for job in cancelled:
+            self._queued.remove(job)
+        return [job.key for job in cancelled]
+
+    def _finish(self, job: _Job) -> None:
+        self._finished.add(job.key)
+        self.durations[job.key] = time.monotonic() - job.started
+
+    def as_completed(self) -> Iterator[Tuple[Any, str, bool]]:
+        """Run everything submitted. Yields (key, output, completed); completed is False for timeouts and crashes."""
+        while self._queued or self._running:
+            self._dispatch()
+            if not self._running:
+                blocked = ", ".join(str(job.key) for job in self._queued)
+                raise ValueError(f"Calls wait on unknown or cyclic dependencies: {blocked}")
+            next_deadline = min(job.deadline for job in self._running.values())
+            done, _ = wait(list(self._running), timeout=max(0.0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                job = self._running.pop(future)
+                try:
+                    output = future.result()
+                except BrokenProcessPool as e:
+                    if job.retried:
+                        self._finish(job)
+                        yield job.key, json.dumps({"error": f"BrokenProcessPool: {e}"}), False
+                    else:
+                        log(f"WARN: Worker pool restarted while {job.tool_name} was running; retrying.")
+                        job.retried = True
+                        self._queued.appendleft(job)
+                except Exception as e:
+                    log(f"ERROR executing {job.tool_name}: {type(e).__name__}: {e}")
+                    self._finish(job)
+                    yield job.key, json.dumps({"error": f"{type(e).__name__}: {e}"}), False
+                else:
+                    self._finish(job)
+                    yield job.key, output, True
+            now = time.monotonic()
+            expired = [(f, job) for f, job in self._running.items() if job.deadline <= now]
+            for future, job in expired:
+                del self._running[future]
+                self._finish(job)
+                future.cancel()
+                log(f"WARN: {job.tool_name} timed out after {job.timeout:g}s; cancelled.")
+            for pool in {job.pool for _, job in expired if job.pool is not None}:
+                _restart_pool(pool)
+            for _, job in expired:
+                yield job.key, timeout_result(job.tool_name, job.timeout), False
+
+    def close(self) -> None:
+        """Abandon whatever has not completed. Process calls still running are stopped."""
+        for pool in {job.pool for job in self._running.values() if job.pool is not None}:
+            _restart_pool(pool)
+        self._queued.clear()
+        self._running.clear()
+
+    def __enter__(self) -> "ToolExecutor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,161 @@
+"""Pooled HTTP transport shared by all LLM calls.
+
+Every LLM endpoint gets one httpx client. Every thread uses it, so the
+TLS handshake and TCP setup are paid once per connection, not once per
+request. Asyncio code gets one client per event loop, because a
+connection belongs to the loop that opened it. The pool is bounded
+(``VNF_AGENT_HTTP_MAX_CONNECTIONS``), and idle connections are kept
+open for reuse (``VNF_AGENT_HTTP_MAX_KEEPALIVE``,
+``VNF_AGENT_HTTP_KEEPALIVE_EXPIRY``). Refused connections are retried
+a few times with backoff before a request fails
+(``VNF_AGENT_HTTP_CONNECT_RETRIES``). HTTP/2 is used over TLS when the
+optional ``h2`` package is installed (``VNF_AGENT_HTTP2``).
+
+``preconnect`` / ``apreconnect`` open connections ahead of the first
+request. ``health_check`` tells whether an endpoint answers at all.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from vnf_log import log
+
+MAX_CONNECTIONS = int(os.getenv("VNF_AGENT_HTTP_MAX_CONNECTIONS", "64"))
+MAX_KEEPALIVE = int(os.getenv("VNF_AGENT_HTTP_MAX_KEEPALIVE", "32"))
+# Seconds an idle connection stays in the pool
+KEEPALIVE_EXPIRY = float(os.getenv("VNF_AGENT_HTTP_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("VNF_AGENT_HTTP_CONNECT_TIMEOUT", "5"))
+# Seconds without a byte from the server; generation on a local model can be slow
+READ_TIMEOUT = float(os.getenv("VNF_AGENT_HTTP_READ_TIMEOUT", "300"))
+WRITE_TIMEOUT = float(os.getenv("VNF_AGENT_HTTP_WRITE_TIMEOUT", "30"))
+# Seconds a request waits for a free connection when all MAX_CONNECTIONS are busy
+POOL_TIMEOUT = float(os.getenv("VNF_AGENT_HTTP_POOL_TIMEOUT", "60"))
+CONNECT_RETRIES = int(os.getenv("VNF_AGENT_HTTP_CONNECT_RETRIES", "2"))
+# 'auto' uses HTTP/2 for https endpoints when h2 is installed, 'on' warns when it is not, 'off' never
+HTTP2 = os.getenv("VNF_AGENT_HTTP2", "auto").lower()
+# Connections opened per endpoint by preconnect
+PRECONNECT = int(os.getenv("VNF_AGENT_HTTP_PRECONNECT", "2"))
+
+# ("sync" or "async", base URL, event loop or None) -> httpx client
+_clients: Dict[Tuple[str, str, Any], Any] = {}
+_lock = threading.Lock()
+
+
+def http2_enabled(base_url: str) -> bool:
+    """Whether requests to ``base_url`` use HTTP/2: only over TLS, and only with the optional h2 package."""
+    if HTTP2 in {"0", "off", "false", "no"} or not base_url.startswith("https://"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if HTTP2 in {"1", "on", "true", "yes"}:
+            log("WARN: VNF_AGENT_HTTP2 is on but the h2 package is not installed; using HTTP/1.1.")
+        return False
+    return True
+
+
+def _settings(base_url: str) -> Dict[str, Any]:
+    import httpx
+    return {
+        "limits": httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                               keepalive_expiry=KEEPALIVE_EXPIRY),
+        "http2": http2_enabled(base_url),
+        "retries": CONNECT_RETRIES,
+    }
+
+
+def _timeout():
+    import httpx
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, write=WRITE_TIMEOUT, pool=POOL_TIMEOUT)
+
+
+def http_client(base_url: str):
+    """The pooled ``httpx.Client`` for ``base_url``, shared by every thread."""
+    key = ("sync", base_url, None)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                import httpx
+                import openai
+                # The SDK's client class keeps its defaults (e.g. following redirects)
+                client = openai.DefaultHttpxClient(transport=httpx.HTTPTransport(**_settings(base_url)),
+                                                   timeout=_timeout())
+                _clients[key] = client
+    return client
+
+
+def async_http_client(base_url: str):
+    """The pooled ``httpx.AsyncClient`` for ``base_url`` on the running event loop (one per loop)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    key = ("async", base_url, loop)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                import httpx
+                import openai
+                # Clients of closed loops cannot be used again
+                for stale in [k for k in _clients if k[2] is not None and k[2].is_closed()]:
+                    del _clients[stale]
+                client = openai.DefaultAsyncHttpxClient(transport=httpx.AsyncHTTPTransport(**_settings(base_url)),
+                                                        timeout=_timeout())
+                _clients[key] = client
+    return client
+
+
+def preconnect(base_url: str, connections: int = PRECONNECT) -> int:
+    """Open up to ``connections`` pooled connections to ``base_url`` in parallel. Returns how many were opened.
+
+    Any HTTP response, even an error status, leaves its connection in the
+    pool; only failures to connect count against the result.
+    """
+    import httpx
+    client = http_client(base_url)
+    opened = []
+
+    def touch():
+        try:
+            client.get(base_url, timeout=httpx.Timeout(CONNECT_TIMEOUT + WRITE_TIMEOUT))
+            opened.append(1)
+        except httpx.HTTPError as e:
+            log(f"WARN: Could not pre-connect to {base_url}: {type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=touch, daemon=True) for _ in range(max(0, connections))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(opened)
+
+
+def health_check(base_url: str) -> bool:
+    """Whether ``base_url`` answers HTTP without a server error. Any status below 500 counts, 401/404 included."""
+    import httpx
+    try:
+        response = http_client(base_url).get(base_url, timeout=httpx.Timeout(CONNECT_TIMEOUT + WRITE_TIMEOUT))
+    except httpx.HTTPError:
+        return False
+    return response.status_code < 500
+
+
+async def apreconnect(base_url: str, connections: int = PRECONNECT) -> int:
+    """Async counterpart of preconnect, for the running event loop's client."""
+    import httpx
+    client = async_http_client(base_url)
+
+    async def touch():
+        try:
+            await client.get(base_url, timeout=httpx.Timeout(CONNECT_TIMEOUT + WRITE_TIMEOUT))
+            return True
+        except httpx.HTTPError as e:
+            log(f"WARN: Could not pre-connect to {base_url}: {type(e).__name__}: {e}")
+            return False
+
+    return sum(await asyncio.gather(*(touch() for _ in range(max(0, connections)))))
@@ -0,0 +1,18 @@
+"""Progress lines from concurrently running tools and LLM calls.
+
+Tools run on several threads and in worker processes that share the
+agent's stdout. ``print`` writes a message and its newline separately, and
+a worker process writes out its buffer whenever it fills, so lines from
+different workers could run together ("ok--- TOOL LOG: ..."). ``log``
+prints each line whole under a lock and flushes it, so it reaches the
+shared stream in one write.
+"""
+import threading
+
+_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    """Print ``message`` as one whole line and flush it."""
+    with _lock:
+        print(message, flush=True)
@@ -0,0 +1,185 @@
+"""SOL004 manifest (.mf) parsing and per-member digest verification.
+
+Uncompressed members (stored zip members, which is how VM images are
+normally packed, and plain tar members) are hashed straight out of a
+read-only mmap of the archive at the offset recorded in the member index:
+no read() copies and no temporary files. Compressed members are streamed
+in fixed-size chunks. Members are spread across a process pool, and results
+are yielded as each member finishes so callers can report progress.
+"""
+import hashlib
+import mmap
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List
+
+from vnf_archive import UNCOMPRESSED, ArchiveReader
+from vnf_executor import process_context
+
+CHUNK_SIZE = 8 * 1024 * 1024
+# Below this many bytes a process pool costs more than it saves
+PARALLEL_THRESHOLD = 64 * 1024 * 1024
+HASH_WORKERS = int(os.getenv("VNF_AGENT_HASH_WORKERS", "0")) or os.cpu_count() or 1
+
+# Manifest "Algorithm:" values -> hashlib names
+ALGORITHMS = {"SHA-256": "sha256", "SHA-384": "sha384", "SHA-512": "sha512"}
+
+
+def parse_manifest(text: str) -> Dict[str, Any]:
+    """Parse a SOL004 manifest into its ``metadata`` block and ``entries`` (Source/Algorithm/Hash).
+
+    A trailing CMS signature block, if present, is returned verbatim as ``signature``.
+    """
+    manifest: Dict[str, Any] = {"metadata": {}, "entries": [], "signature": None}
+    cms_start = text.find("-----BEGIN CMS-----")
+    if cms_start != -1:
+        cms_end = text.find("-----END CMS-----", cms_start)
+        manifest["signature"] = text[cms_start:cms_end + len("-----END CMS-----")] if cms_end != -1 else text[cms_start:]
+        text = text[:cms_start]
+
+    section = None
+    entry: Dict[str, str] = {}
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        key, sep, value = line.partition(":")
+        key, value = key.strip(), value.strip()
+        if not sep:
+            continue
+        if key == "metadata" and not value:
+            section = "metadata"
+            continue
+        if key == "Source":
+            section = "entries"
+            if entry:
+                manifest["entries"].append(entry)
+            entry = {"source": value}
+        elif section == "entries" and key in ("Algorithm", "Hash"):
+            entry[key.lower()] = value
+        elif section == "metadata":
+            manifest["metadata"][key] = value
+    if entry:
+        manifest["entries"].append(entry)
+    return manifest
+
+
+def _hash_member(path: str, member: str, algorithm: str, offset: int, size: int, mode: str):
+    """Worker: digest one archive member. Returns (member, hexdigest, bytes hashed).
+
+    mode "mmap" hashes uncompressed bytes in place; "zip" streams a compressed zip member.
+    """
+    h = hashlib.new(algorithm)
+    if mode == "mmap":
+        if size:
+            with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for start in range(offset, offset + size, CHUNK_SIZE):
+                        # hashlib releases the GIL and reads the mapped pages directly
+                        h.update(view[start:min(start + CHUNK_SIZE, offset + size)])
+                finally:
+                    view.release()
+    else:
+        with zipfile.ZipFile(path) as zf, zf.open(member) as fh:
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+    return member, h.hexdigest(), size
+
+
+def _hash_streamed(reader: ArchiveReader, member: str, algorithm: str):
+    """Digest a member that can only be read sequentially (compressed tar, rar)."""
+    h = hashlib.new(algorithm)
+    size = 0
+    for chunk in reader.iter_chunks(member, CHUNK_SIZE):
+        h.update(chunk)
+        size += len(chunk)
+    return member, h.hexdigest(), size
+
+
+def iter_manifest_verification(reader: ArchiveReader, entries: List[Dict[str, str]],
+                               workers: int = HASH_WORKERS) -> Iterator[Dict[str, Any]]:
+    """Verify manifest entries against the archive, yielding one result per entry as it completes.
+
+    Each result has ``source`` and ``status`` ("ok", "mismatch", "missing",
+    "external", "unsupported" or "error") plus ``bytes`` for hashed members.
+    """
+    members = reader.members
+    jobs, streamed = [], []
+    expected: Dict[str, str] = {}
+    for entry in entries:
+        source = entry.get("source", "")
+        if "://" in source:
+            yield {"source": source, "status": "external"}
+            continue
+        algorithm = ALGORITHMS.get(entry.get("algorithm", "").upper())
+        if algorithm is None or not entry.get("hash"):
+            yield {"source": source, "status": "unsupported", "detail": entry.get("algorithm")}
+            continue
+        member = members.get(source)
+        if member is None:
+            yield {"source": source, "status": "missing"}
+            continue
+        if member.compression == "encrypted":
+            yield {"source": source, "status": "unsupported", "detail": "encrypted member"}
+            continue
+        expected[source] = entry["hash"].lower()
+        if member.compression in UNCOMPRESSED:
+            jobs.append((source, algorithm, member.offset, member.size, "mmap"))
+        elif reader.format == "zip":
+            jobs.append((source, algorithm, 0, member.size, "zip"))
+        else:
+            streamed.append((source, algorithm))
+
+    def result(member, digest, size):
+        status = "ok" if digest == expected[member] else "mismatch"
+        return {"source": member, "status": status, "bytes": size}
+
+    for source, algorithm in streamed:
+        try:
+            yield result(*_hash_streamed(reader, source, algorithm))
+        except Exception as e:
+            yield {"source": source, "status": "error", "detail": str(e)}
+
+    total = sum(job[3] for job in jobs)
+    if workers <= 1 or len(jobs) <= 1 or total < PARALLEL_THRESHOLD:
+        for job in jobs:
+            try:
+                yield result(*_hash_member(reader.path, *job))
+            except Exception as e:
+                yield {"source": job[0], "status": "error", "detail": str(e)}
+        return
+
+    # Called from tool threads: fork-started workers could inherit locks held by the other threads
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=process_context(_hash_member)) as pool:
+        # Largest members first so the pool is not left waiting on one big image at the end
+        futures = {
+            pool.submit(_hash_member, reader.path, *job): job[0]
+            for job in sorted(jobs, key=lambda j: -j[3])
+        }
+        for future in as_completed(futures):
+            try:
+                yield result(*future.result())
+            except Exception as e:
+                yield {"source": futures[future], "status": "error", "detail": str(e)}
+
+
+def verify_manifest(reader: ArchiveReader, manifest: Dict[str, Any], workers: int = HASH_WORKERS,
+                    progress: Callable[[int, int, Dict[str, Any]], None] | None = None) -> Dict[str, Any]:
+    """Check every digest listed in a parsed manifest (see parse_manifest) against the archive.
+
+    ``progress(done, total, result)`` is called after each entry. Returns
+    ``verified`` and ``bytes`` counts and the list of ``failures``.
+    """
+    entries = manifest["entries"]
+    summary: Dict[str, Any] = {"entries": len(entries), "verified": 0, "bytes": 0, "failures": []}
+    for done, res in enumerate(iter_manifest_verification(reader, entries, workers), start=1):
+        if res["status"] == "ok":
+            summary["verified"] += 1
+            summary["bytes"] += res["bytes"]
+        elif res["status"] != "external":
+            summary["failures"].append(res)
+        if progress is not None:
+            progress(done, len(entries), res)
+    return summary
@@ -0,0 +1,232 @@
+"""Per-package context shared by all pre-check tools.
+
+A ``PackageContext`` is built once per package per pre-check and handed to
+every tool, so the file name is parsed, the archive opened and indexed, the
+layout inspected, the manifest and VNFD parsed and the package hashed at
+most once, no matter how many tools run. Every attribute is computed lazily
+on first access, so a tool that only needs the vendor never touches the
+archive.
+
+Each artifact is declared in ``ARTIFACTS`` with the artifacts it is computed
+from, and has its own lock: artifacts that do not depend on each other (the
+manifest and the VNFD, say) can be computed concurrently by different
+threads, which is what the tool scheduler does.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+from vnf_archive import ArchiveError, ArchiveReader, archive_suffix, inspect_sol004_layout, open_archive
+from vnf_cache import file_sha256
+from vnf_manifest import parse_manifest
+from vnf_sbom import extract_components
+from vnf_vnfd import VnfdError, extract_resources, load_vnfd
+
+_UNSET = object()
+# Failures remembered like results, so every access re-raises them without redoing the work
+ARTIFACT_ERRORS = (ArchiveError, VnfdError)
+
+
+def resolve_package_path(file_name: str, package_dir: str = ".") -> str | None:
+    """Locate a package on disk, as given or under package_dir."""
+    for candidate in (file_name, os.path.join(package_dir, file_name)):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _archive(ctx: "PackageContext") -> ArchiveReader | None:
+    return open_archive(ctx.path) if ctx.path is not None else None
+
+
+def _layout(ctx: "PackageContext") -> Dict[str, Any] | None:
+    archive = ctx.archive
+    return inspect_sol004_layout(archive) if archive is not None else None
+
+
+def _manifest(ctx: "PackageContext") -> Dict[str, Any] | None:
+    member = (ctx.layout or {}).get("manifest")
+    return parse_manifest(ctx.archive.read(member).decode("utf-8", errors="replace")) if member else None
+
+
+def _vnfd(ctx: "PackageContext") -> Dict[str, Any] | None:
+    member = (ctx.layout or {}).get("entry_definitions")
+    return load_vnfd(ctx.archive, member) if member and member in ctx.archive.members else None
+
+
+def _resources(ctx: "PackageContext") -> Dict[str, Dict[str, Any]] | None:
+    vnfd = ctx.vnfd
+    return extract_resources(vnfd) if vnfd is not None else None
+
+
+def _components(ctx: "PackageContext") -> Tuple[List[Any], List[str]] | None:
+    archive = ctx.archive
+    return extract_components(archive) if archive is not None else None
+
+
+def _sha256(ctx: "PackageContext") -> str | None:
+    if ctx.path is None:
+        return None
+    st = os.stat(ctx.path)
+    stat_key = f"digest:{os.path.abspath(ctx.path)}:{st.st_size}:{st.st_mtime_ns}"
+    digest = ctx.digest_store.get(stat_key) if ctx.digest_store is not None else None
+    if digest is None:
+        digest = file_sha256(ctx.path)
+        if ctx.digest_store is not None:
+            ctx.digest_store.set(stat_key, digest)
+    return digest
+
+
+# name -> (artifacts it is computed from, function computing it from the context)
+ARTIFACTS: Dict[str, Tuple[Tuple[str, ...], Callable[["PackageContext"], Any]]] = {
+    "path": ((), lambda ctx: resolve_package_path(ctx.file_name, ctx.package_dir)),
+    "archive": (("path",), _archive),
+    "layout": (("archive",), _layout),
+    "manifest": (("layout",), _manifest),
+    "vnfd": (("layout",), _vnfd),
+    "resources": (("vnfd",), _resources),
+    "components": (("archive",), _components),
+    "sha256": (("path",), _sha256),
+}
+
+
+def artifact_closure(names, artifacts: Dict[str, Tuple[Tuple[str, ...], Any]] = ARTIFACTS) -> List[str]:
+    """The named artifacts and everything they are computed from, dependencies first."""
+    order: List[str] = []
+    visiting = set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"Artifact '{name}' depends on itself")
+        if name not in artifacts:
+            raise KeyError(f"Unknown package artifact '{name}'")
+        visiting.add(name)
+        for dependency in artifacts[name][0]:
+            visit(dependency)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+class _Failed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class PackageContext:
+    """Lazily computed facts about one VNF package. Safe to share between concurrently running tools."""
+
+    __slots__ = ("file_name", "package_dir", "digest_store", "artifacts", "_values", "_locks")
+
+    def __init__(self, file_name: str, package_dir: str = ".", digest_store=None,
+                 artifacts: Dict[str, Tuple[Tuple[str, ...], Any]] | None = None):
+        """``digest_store`` (any object with get/set, e.g. the tool cache) remembers digests across processes.
+
+        ``artifacts`` replaces ARTIFACTS, e.g. to add producers defined by the caller.
+        """
+        self.file_name = file_name
+        self.package_dir = package_dir
+        self.digest_store = digest_store
+        self.artifacts = artifacts or ARTIFACTS
+        self._values: Dict[str, Any] = {}
+        self._locks = {name: threading.RLock() for name in self.artifacts}
+
+    def artifact(self, name: str) -> Any:
+        """Compute an artifact on first use; later calls return it (or re-raise its failure)."""
+        value = self._values.get(name, _UNSET)
+        if value is _UNSET:
+            with self._locks[name]:
+                value = self._values.get(name, _UNSET)
+                if value is _UNSET:
+                    try:
+                        value = self.artifacts[name][1](self)
+                    except ARTIFACT_ERRORS as e:
+                        value = _Failed(e)
+                    self._values[name] = value
+        if isinstance(value, _Failed):
+            raise value.error
+        return value
+
+    def prefetch(self, name: str) -> None:
+        """Compute an artifact ahead of the tools that read it. Failures are kept for them to report."""
+        try:
+            self.artifact(name)
+        except ARTIFACT_ERRORS:
+            pass
+
+    # --- name ---
+    @property
+    def suffix(self) -> str | None:
+        return archive_suffix(self.file_name)
+
+    @property
+    def name_parts(self) -> List[str]:
+        """vendor_name_version parts of the file name, without the archive suffix."""
+        suffix = self.suffix
+        stem = self.file_name[:-len(suffix)] if suffix else self.file_name
+        return os.path.basename(stem).split('_')
+
+    @property
+    def vendor(self) -> str:
+        return self.name_parts[0]
+
+    @property
+    def product(self) -> str | None:
+        parts = self.name_parts
+        return parts[1] if len(parts) > 2 else None
+
+    # --- archive ---
+    @property
+    def path(self) -> str | None:
+        return self.artifact("path")
+
+    @property
+    def archive(self) -> ArchiveReader | None:
+        """Shared, indexed reader, or None if the package is not on disk. Raises ArchiveError."""
+        return self.artifact("archive")
+
+    @property
+    def layout(self) -> Dict[str, Any] | None:
+        """SOL004 layout report (see inspect_sol004_layout), or None if the package is not on disk."""
+        return self.artifact("layout")
+
+    @property
+    def manifest(self) -> Dict[str, Any] | None:
+        """Parsed SOL004 manifest, or None if the package has none."""
+        return self.artifact("manifest")
+
+    @property
+    def vnfd(self) -> Dict[str, Any] | None:
+        """Entry definitions (the VNFD) with their imports parsed (see load_vnfd), or None if absent."""
+        return self.artifact("vnfd")
+
+    @property
+    def resources(self) -> Dict[str, Dict[str, Any]] | None:
+        """Per-flavour resource needs from the VNFD (see extract_resources), or None without a VNFD."""
+        return self.artifact("resources")
+
+    @property
+    def components(self) -> Tuple[List[Any], List[str]] | None:
+        """(components, unreadable members) from the package's SBOMs (see extract_components), or None."""
+        return self.artifact("components")
+
+    # --- hashes ---
+    @property
+    def sha256(self) -> str | None:
+        """SHA-256 of the package file, or None if it is not on disk."""
+        return self.artifact("sha256")
+
+    @property
+    def identity(self) -> str:
+        """Content hash and base name of the package when it is on disk, otherwise its name.
+
+        The name is part of it because tools judge it too (vendor, naming rules): a renamed copy is another package.
+        """
+        digest = self.sha256
+        return f"sha256:{digest}:{os.path.basename(self.file_name)}" if digest else f"name:{self.file_name}"
@@ -0,0 +1,361 @@
+"""Provider-aware rate limiting and adaptive concurrency for LLM calls.
+
+A ``ProviderLimiter`` sits in front of every request to one provider and
+combines two controls:
+
+- Token buckets cap requests and tokens per minute, for providers that
+  publish a quota (Azure deployments, OpenAI tiers). A request's tokens
+  are estimated up front (its prompt, plus the average completion so far)
+  and corrected from the usage it reports.
+- AIMD adaptive concurrency bounds the requests in flight. The limit grows
+  by about one for each window of successful requests. It is halved when
+  the provider signals overload: HTTP 429 or 503, a timeout, or a
+  completion far slower than the fastest recent ones of its kind (a
+  summary writes far more than a plan). That last signal is what a local
+  Ollama server gives when it is queueing requests behind its model.
+
+A request rejected for overload is queued again, after the provider's
+Retry-After when it sends one; the pause applies to every request to that
+provider. The limit therefore settles at what the provider actually
+sustains. Synchronous callers block; asyncio callers await without
+blocking their event loop. Both can share one limiter.
+"""
+import asyncio
+import email.utils
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+from vnf_log import log
+
+# provider -> (initial concurrency, maximum concurrency, latency tolerance); 0 tolerance ignores latency
+PROVIDER_DEFAULTS: Dict[str, Tuple[int, int, float]] = {
+    "openai": (8, 64, 0.0),
+    "azure": (8, 64, 0.0),
+    "ollama": (1, 8, 3.0),  # one model instance; queueing shows up as latency, not errors
+}
+OVERLOAD_STATUSES = (429, 503)
+# Seconds to back off after an overload without Retry-After, doubled per attempt
+OVERLOAD_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+def retry_after(headers: Any) -> float | None:
+    """Seconds from Retry-After (seconds or HTTP date) or retry-after-ms headers, if present."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def overload_signal(error: BaseException) -> Tuple[bool, float | None]:
+    """(whether ``error`` means the provider is overloaded, its Retry-After in seconds)."""
+    status = getattr(error, "status_code", None)
+    if status in OVERLOAD_STATUSES:
+        response = getattr(error, "response", None)
+        return True, retry_after(getattr(response, "headers", None))
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return True, None
+    return False, None
+
+
+def provider_fault(error: BaseException) -> bool:
+    """Whether a failure says the provider is unhealthy, not that this one request was bad (HTTP 400, 404...)."""
+    status = getattr(error, "status_code", None)
+    return not isinstance(status, int) or status >= 500 or status in (401, 403, 408, 429)
+
+
+def estimate_tokens(prompt: Any) -> int:
+    """Rough token count of a prompt: about 4 characters per token."""
+    return len(json.dumps(prompt, default=str)) // 4
+
+
+class TokenBucket:
+    """``per_minute`` units per minute, with bursts up to ``capacity``.
+
+    The default capacity is ten seconds' worth, because providers enforce
+    per-minute quotas over shorter windows. A full minute's burst would be
+    rejected.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, per_minute / 6)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available; a request larger than the bucket waits for a full one."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        with self._lock:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        """Give back ``amount`` (negative to charge more), e.g. once a request's real token count is known."""
+        with self._lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    __slots__ = ("wake", "handed")
+
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+        self.handed = False
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on requests in flight, shared by threads and event loops, granted in FIFO order."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, latency_tolerance: float = 0.0,
+                 latency_window: int = 50):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+        self.latency_window = latency_window
+        self.in_flight = 0
+        # kind of call -> its recent latencies; each kind is compared with its own fastest
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._decreased = 0.0
+        self._waiters: Deque[_Waiter] = deque()
+        # Called after every release, e.g. to tell an endpoint pool a slot is free
+        self.on_release: Callable[[], None] | None = None
+        self._lock = threading.Lock()
+
+    def _grant(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.handed = True
+            self.in_flight += 1
+            waiter.wake()
+
+    def _enter(self, make_wake: Callable[[], Callable[[], None]]) -> _Waiter | None:
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return None
+            waiter = _Waiter(make_wake())
+            self._waiters.append(waiter)
+            return waiter
+
+    def acquire(self) -> float:
+        """Block until a slot is free. Returns the start time to pass to release."""
+        event = threading.Event()
+        if self._enter(lambda: event.set) is not None:
+            event.wait()
+        return time.monotonic()
+
+    async def aacquire(self) -> float:
+        """Async acquire: waits without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enter(lambda: wake)
+        if waiter is not None:
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter.handed:
+                        self.in_flight -= 1  # granted as we were cancelled; pass the slot on
+                        self._grant()
+                    else:
+                        self._waiters.remove(waiter)
+                raise
+        return time.monotonic()
+
+    def release(self, started: float, overloaded: bool = False, succeeded: bool = True,
+                kind: str = "default") -> None:
+        """Free a slot and adapt the limit to how the request, a call of ``kind``, went."""
+        latency = time.monotonic() - started
+        with self._lock:
+            self.in_flight -= 1
+            if succeeded and not overloaded and self.latency_tolerance > 0:
+                latencies = self._latencies.setdefault(kind, deque(maxlen=self.latency_window))
+                baseline = min(latencies) if latencies else latency
+                latencies.append(latency)
+                overloaded = len(latencies) > 1 and latency > self.latency_tolerance * baseline
+            if overloaded:
+                # One decrease per round of requests: those started before it saw the old limit
+                if started >= self._decreased:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._decreased = time.monotonic()
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._grant()
+        if self.on_release is not None:
+            self.on_release()
+
+
+class ProviderLimiter:
+    """Requests/tokens-per-minute buckets and adaptive concurrency for one provider."""
+
+    def __init__(self, provider: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 concurrency: AdaptiveConcurrency | None = None, overload_retries: int = 3, name: str | None = None):
+        self.provider = provider
+        # What log lines call it, e.g. one endpoint of the provider
+        self.name = name or provider
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        initial, maximum, tolerance = PROVIDER_DEFAULTS.get(provider, (4, 32, 0.0))
+        self.concurrency = concurrency or AdaptiveConcurrency(initial, maximum=maximum, latency_tolerance=tolerance)
+        self.overload_retries = overload_retries
+        # Expected completion size, learned from the usage responses report
+        self.completion_tokens = 256.0
+        self.paused_until = 0.0
+        self.overloads = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, provider: str, name: str | None = None) -> "ProviderLimiter":
+        """Limiter configured from the environment, with per-provider defaults.
+
+        VNF_AGENT_LLM_RPM / VNF_AGENT_LLM_TPM: requests / tokens per minute (default 0, unlimited)
+        VNF_AGENT_LLM_CONCURRENCY: initial requests in flight
+        VNF_AGENT_LLM_MAX_CONCURRENCY: upper bound on requests in flight
+        VNF_AGENT_LLM_LATENCY_TOLERANCE: completions this many times slower than the fastest recent one
+                                         of the same kind count as overload (0 disables)
+        VNF_AGENT_LLM_OVERLOAD_RETRIES: times a request rejected for overload is queued again (default 3)
+        """
+        initial, maximum, tolerance = PROVIDER_DEFAULTS.get(provider, (4, 32, 0.0))
+        concurrency = AdaptiveConcurrency(
+            int(os.getenv("VNF_AGENT_LLM_CONCURRENCY", initial)),
+            maximum=int(os.getenv("VNF_AGENT_LLM_MAX_CONCURRENCY", maximum)),
+            latency_tolerance=float(os.getenv("VNF_AGENT_LLM_LATENCY_TOLERANCE", tolerance)),
+        )
+        return cls(provider, float(os.getenv("VNF_AGENT_LLM_RPM", "0")), float(os.getenv("VNF_AGENT_LLM_TPM", "0")),
+                   concurrency, int(os.getenv("VNF_AGENT_LLM_OVERLOAD_RETRIES", "3")), name)
+
+    def _admit(self, tokens: float) -> float:
+        """Take one request and ``tokens`` from the buckets if both are available; else seconds to wait."""
+        with self._lock:
+            delay = self.paused_until - time.monotonic()
+            if self.requests is not None:
+                delay = max(delay, self.requests.wait_time(1))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.wait_time(tokens))
+            if delay <= 0:
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(tokens)
+            return max(0.0, delay)
+
+    def _settle(self, tokens: float, response: Any) -> None:
+        usage = getattr(response, "usage", None)
+        completion, total = getattr(usage, "completion_tokens", None), getattr(usage, "total_tokens", None)
+        with self._lock:
+            if isinstance(completion, int):
+                self.completion_tokens += 0.2 * (completion - self.completion_tokens)
+        if self.tokens is not None and isinstance(total, int):
+            self.tokens.refund(tokens - total)
+
+    def _overloaded(self, error: BaseException, attempt: int) -> float | None:
+        """Seconds to wait before queueing the request again, or None to give up and raise."""
+        overloaded, pause = overload_signal(error)
+        if not overloaded or attempt >= self.overload_retries:
+            return None
+        with self._lock:
+            self.overloads += 1
+            if pause is not None:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        log(f"WARN: {self.name} is overloaded ({type(error).__name__}); "
+            f"concurrency limit now {int(self.concurrency.limit)}, retrying.")
+        return pause if pause is not None else min(MAX_BACKOFF, OVERLOAD_BACKOFF * 2 ** attempt)
+
+    def call(self, fn: Callable[[], Any], prompt_tokens: int = 0, kind: str = "default") -> Any:
+        """Run ``fn``, one request with a prompt of about ``prompt_tokens`` tokens, within the limits.
+
+        ``kind`` (plan, summary...) groups requests whose latencies are comparable.
+        """
+        attempt = 0
+        while True:
+            tokens = prompt_tokens + self.completion_tokens
+            while (delay := self._admit(tokens)) > 0:
+                time.sleep(delay)
+            started = self.concurrency.acquire()
+            try:
+                response = fn()
+            except Exception as e:
+                self.concurrency.release(started, overloaded=overload_signal(e)[0], succeeded=False, kind=kind)
+                wait = self._overloaded(e, attempt)
+                if wait is None:
+                    raise
+                time.sleep(wait)
+                attempt += 1
+                continue
+            except BaseException:
+                self.concurrency.release(started, succeeded=False, kind=kind)
+                raise
+            self.concurrency.release(started, kind=kind)
+            self._settle(tokens, response)
+            return response
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], prompt_tokens: int = 0, kind: str = "default") -> Any:
+        """Async counterpart of call: ``fn`` returns the awaitable request."""
+        attempt = 0
+        while True:
+            tokens = prompt_tokens + self.completion_tokens
+            while (delay := self._admit(tokens)) > 0:
+                await asyncio.sleep(delay)
+            started = await self.concurrency.aacquire()
+            try:
+                response = await fn()
+            except Exception as e:
+                self.concurrency.release(started, overloaded=overload_signal(e)[0], succeeded=False, kind=kind)
+                wait = self._overloaded(e, attempt)
+                if wait is None:
+                    raise
+                await asyncio.sleep(wait)
+                attempt += 1
+                continue
+            except BaseException:
+                self.concurrency.release(started, succeeded=False, kind=kind)
+                raise
+            self.concurrency.release(started, kind=kind)
+            self._settle(tokens, response)
+            return response
+
+    def has_capacity(self) -> bool:
+        """Whether a request sent now would start at once: not paused, and a concurrency slot is free."""
+        with self._lock:
+            if self.paused_until > time.monotonic():
+                return False
+        return not self.concurrency._waiters and self.concurrency.in_flight < int(self.concurrency.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.provider, "concurrency_limit": round(self.concurrency.limit, 2),
+                "in_flight": self.concurrency.in_flight, "overloads": self.overloads}
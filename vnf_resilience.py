@@ -0,0 +1,320 @@
+"""Retries, hedged requests and a circuit breaker around LLM calls.
+
+An ``LLMGuard`` wraps the provider's ``EndpointPool`` (whose per-endpoint
+limiters already requeue requests rejected for overload) and adds three
+things:
+
+- Transient failures (HTTP 500/502/504, dropped or refused connections)
+  are retried with full-jitter exponential backoff: a random wait of up
+  to base * 2^attempt, so many clients failing together do not retry in
+  lockstep.
+- Hedging (optional, off by default): a request still unanswered after
+  the observed p95 latency for its kind of call gets a second, identical
+  request, and whichever answers first is used. The loser is cancelled
+  (asyncio) or left to finish in the background (threads). A hedge is
+  only sent when an endpoint has a free slot, so hedges never queue
+  behind real work, and they tend to go to another endpoint than the
+  straggler. At most about 5% of requests are hedged, which cuts
+  the tail caused by stragglers.
+- A circuit breaker opens after a run of consecutive failed calls. While
+  it is open, calls fail at once with ``CircuitOpenError``, and the agent
+  uses the rule-based plan and the template report instead of waiting on
+  an unhealthy provider. After a cool-down, one probe call is let through
+  and its outcome closes or re-opens the circuit.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict
+
+from vnf_endpoints import EndpointPool
+from vnf_log import log
+from vnf_ratelimit import overload_signal, provider_fault
+
+TRANSIENT_STATUSES = (500, 502, 504)
+# Seconds of the first retry's backoff bound, doubled per attempt up to MAX_RETRY_BACKOFF
+RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 20.0
+# Latencies needed before the p95 is trusted enough to hedge on
+MIN_HEDGE_SAMPLES = 20
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed request is worth retrying as is. Overload is left to the limiter, which already retried it."""
+    if overload_signal(error)[0]:
+        return False
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUSES
+    # openai.APIConnectionError, httpx.ConnectError / RemoteProtocolError, builtin ConnectionError
+    name = type(error).__name__
+    return isinstance(error, ConnectionError) or "Connect" in name or "Protocol" in name
+
+
+def backoff(attempt: int, base: float = RETRY_BACKOFF, cap: float = MAX_RETRY_BACKOFF) -> float:
+    """Full-jitter backoff: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class LatencyTracker:
+    """Recent latencies of one kind of call, for the hedging delay."""
+
+    def __init__(self, window: int = 200):
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        """The ``q`` quantile of recent latencies, or None until MIN_HEDGE_SAMPLES have been seen."""
+        with self._lock:
+            if len(self._latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failed calls; lets one probe through every ``reset_seconds`` while open."""
+
+    def __init__(self, name: str, failures: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now."""
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool | None) -> None:
+        """Outcome of an allowed call; None when it was abandoned (cancelled) without an answer."""
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            if ok is None:
+                self.probing = False
+            elif ok:
+                if self.opened_at is not None:
+                    log(f"AGENT: {self.name} answered again; circuit closed.")
+                self.failures, self.opened_at, self.probing = 0, None, False
+            else:
+                self.failures += 1
+                if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+                    log(f"WARN: {self.name} failed {self.failures} call(s) in a row; circuit open, "
+                        f"using local fallbacks for {self.reset_seconds:g}s.")
+                    self.opened_at, self.probing = time.monotonic(), False
+
+
+class LLMGuard:
+    """Retries, optional hedging and a circuit breaker in front of an EndpointPool."""
+
+    def __init__(self, pool: EndpointPool, retries: int = 2, hedge: bool = False,
+                 hedge_quantile: float = 0.95, breaker: CircuitBreaker | None = None):
+        self.pool = pool
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.breaker = breaker or CircuitBreaker(pool.provider)
+        self._latency: Dict[str, LatencyTracker] = {}
+        self.counts = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, pool: EndpointPool) -> "LLMGuard":
+        """Settings from the environment:
+
+        VNF_AGENT_LLM_RETRIES: retries of a transient failure (default 2)
+        VNF_AGENT_LLM_HEDGE: 'on' sends hedged requests (default 'off')
+        VNF_AGENT_LLM_HEDGE_QUANTILE: latency quantile after which to hedge (default 0.95)
+        VNF_AGENT_LLM_BREAKER_FAILURES: consecutive failed calls that open the circuit (default 5, 0 disables)
+        VNF_AGENT_LLM_BREAKER_RESET: seconds the circuit stays open before a probe (default 30)
+        """
+        breaker = CircuitBreaker(pool.provider, int(os.getenv("VNF_AGENT_LLM_BREAKER_FAILURES", "5")),
+                                 float(os.getenv("VNF_AGENT_LLM_BREAKER_RESET", "30")))
+        return cls(pool, int(os.getenv("VNF_AGENT_LLM_RETRIES", "2")),
+                   os.getenv("VNF_AGENT_LLM_HEDGE", "off").lower() in {"1", "on", "true", "yes"},
+                   float(os.getenv("VNF_AGENT_LLM_HEDGE_QUANTILE", "0.95")), breaker)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _tracker(self, kind: str) -> LatencyTracker:
+        with self._lock:
+            return self._latency.setdefault(kind, LatencyTracker())
+
+    def _hedge_delay(self, kind: str) -> float | None:
+        return self._tracker(kind).quantile(self.hedge_quantile) if self.hedge else None
+
+    def _enter(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"LLM circuit for {self.pool.provider} is open after repeated failures.")
+        self._count("calls")
+
+    def _retry_wait(self, error: Exception, attempt: int) -> float | None:
+        """Seconds to wait before retrying, or None to give up."""
+        if attempt >= self.retries or not is_transient(error):
+            return None
+        self._count("retries")
+        wait = backoff(attempt)
+        log(f"WARN: LLM call failed ({type(error).__name__}: {error}); retry {attempt + 1} of {self.retries} "
+            f"in {wait:.1f}s.")
+        return wait
+
+    def _hedged(self, fn: Callable[[str], Any], prompt_tokens: int, kind: str) -> Any:
+        # The latency recorded is the caller's, up to the first answer: a straggler that lost to its hedge
+        # counts with the time it had taken by then, the same for threads and asyncio
+        started = time.monotonic()
+        response = self._race(fn, prompt_tokens, kind, self._hedge_delay(kind))
+        self._tracker(kind).record(time.monotonic() - started)
+        return response
+
+    def _race(self, fn: Callable[[str], Any], prompt_tokens: int, kind: str, delay: float | None) -> Any:
+        if delay is None:
+            return self.pool.call(fn, prompt_tokens, kind)
+        results: "queue.Queue[tuple]" = queue.Queue()
+
+        def run(hedge: bool):
+            try:
+                results.put((hedge, True, self.pool.call(fn, prompt_tokens, kind)))
+            except BaseException as e:
+                results.put((hedge, False, e))
+
+        # Daemon threads: a straggler that lost the race finishes (or times out) in the background
+        threading.Thread(target=run, args=(False,), daemon=True).start()
+        try:
+            hedge, ok, value = results.get(timeout=delay)
+        except queue.Empty:
+            if not self.pool.has_capacity():
+                hedge, ok, value = results.get()
+            else:
+                self._count("hedges")
+                log(f"AGENT: LLM call slower than p{self.hedge_quantile * 100:g} ({delay:.1f}s); "
+                    f"sending a hedged request.")
+                threading.Thread(target=run, args=(True,), daemon=True).start()
+                hedge, ok, value = results.get()
+                if not ok:  # the other request may still succeed
+                    hedge, ok, value = results.get()
+        if not ok:
+            raise value
+        if hedge:
+            self._count("hedge_wins")
+        return value
+
+    def call(self, fn: Callable[[str], Any], prompt_tokens: int = 0, kind: str = "default") -> Any:
+        """Run ``fn(base_url)``, one request with a prompt of about ``prompt_tokens`` tokens; ``kind`` groups latencies."""
+        self._enter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = self._hedged(fn, prompt_tokens, kind)
+                except Exception as e:
+                    wait = self._retry_wait(e, attempt)
+                    if wait is None:
+                        raise
+                    time.sleep(wait)
+                    attempt += 1
+                    continue
+                self.breaker.record(True)
+                return response
+        except Exception as e:
+            self.breaker.record(not provider_fault(e))
+            raise
+        except BaseException:
+            self.breaker.record(None)
+            raise
+
+    async def _ahedged(self, fn: Callable[[str], Awaitable[Any]], prompt_tokens: int, kind: str) -> Any:
+        started = time.monotonic()
+        response = await self._arace(fn, prompt_tokens, kind, self._hedge_delay(kind))
+        self._tracker(kind).record(time.monotonic() - started)
+        return response
+
+    async def _arace(self, fn: Callable[[str], Awaitable[Any]], prompt_tokens: int, kind: str,
+                     delay: float | None) -> Any:
+        if delay is None:
+            return await self.pool.acall(fn, prompt_tokens, kind)
+        primary = asyncio.ensure_future(self.pool.acall(fn, prompt_tokens, kind))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self.pool.has_capacity():
+                return await primary
+            self._count("hedges")
+            log(f"AGENT: LLM call slower than p{self.hedge_quantile * 100:g} ({delay:.1f}s); "
+                f"sending a hedged request.")
+            pending.add(asyncio.ensure_future(self.pool.acall(fn, prompt_tokens, kind)))
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, fn: Callable[[str], Awaitable[Any]], prompt_tokens: int = 0, kind: str = "default") -> Any:
+        """Async counterpart of call: ``fn`` returns the awaitable request."""
+        self._enter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await self._ahedged(fn, prompt_tokens, kind)
+                except Exception as e:
+                    wait = self._retry_wait(e, attempt)
+                    if wait is None:
+                        raise
+                    await asyncio.sleep(wait)
+                    attempt += 1
+                    continue
+                self.breaker.record(True)
+                return response
+        except Exception as e:
+            self.breaker.record(not provider_fault(e))
+            raise
+        except BaseException:
+            self.breaker.record(None)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = {kind: round(q, 2) for kind, tracker in list(self._latency.items())
+               if (q := tracker.quantile(0.95)) is not None}
+        return dict(self.pool.stats(), **self.counts, circuit=self.breaker.state,
+                    circuit_rejected=self.breaker.rejected, p95_seconds=p95)
@@ -0,0 +1,114 @@
+"""Vectorized resource-limit evaluation for whole batches of packages.
+
+The per-VDU needs of every package in a batch (see vnf_vnfd.extract_resources)
+are packed into one NumPy matrix, one row per VDU and one column per
+resource, and compared against the limit vectors of every NFVI zone in a
+single broadcast. Flavour totals and per-package verdicts are segment
+reductions over that matrix, so a batch of thousands of packages costs a
+handful of array operations rather than a Python loop per VDU and zone.
+"""
+import json
+import os
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+RESOURCES = ("vcpu", "memory_mib", "storage_gib", "hugepages_mib", "nics")
+
+# Ceilings per VDU instance and per deployment flavour (all initial instances); unlisted resources are unlimited
+VDU_LIMITS = {"vcpu": 16, "memory_mib": 64 * 1024, "storage_gib": 500}
+FLAVOUR_LIMITS = {"vcpu": 128, "memory_mib": 512 * 1024, "storage_gib": 4000}
+DEFAULT_ZONE = "default"
+
+
+class VduBatch(NamedTuple):
+    """VDU needs of many packages, packed contiguously by package and then by flavour."""
+    packages: List[str]
+    flavours: List[Tuple[str, str]]  # (package, flavour id) per flavour row
+    vdus: List[Tuple[str, str, str]]  # (package, flavour id, vdu) per VDU row
+    needs: np.ndarray  # (vdus, RESOURCES) per instance
+    instances: np.ndarray  # (vdus,) initial instance count
+    flavour_start: np.ndarray  # (flavours,) first VDU row of each flavour
+    package_start: np.ndarray  # (packages,) first flavour row of each package
+
+
+class ZoneLimits(NamedTuple):
+    zones: List[str]
+    vdu: np.ndarray  # (zones, RESOURCES), inf where unlimited
+    flavour: np.ndarray  # (zones, RESOURCES)
+
+
+def pack_vdus(resources: Dict[str, Dict[str, Dict[str, Any]] | None]) -> VduBatch:
+    """Pack ``{package: extract_resources(...)}`` into arrays. Packages without VDUs are left out."""
+    packages, flavours, vdus, rows, instances = [], [], [], [], []
+    flavour_start, package_start = [], []
+    for package, package_flavours in resources.items():
+        if not package_flavours:
+            continue
+        packages.append(package)
+        package_start.append(len(flavours))
+        for flavour_id, flavour in package_flavours.items():
+            flavours.append((package, flavour_id))
+            flavour_start.append(len(vdus))
+            for vdu, needs in flavour["vdus"].items():
+                vdus.append((package, flavour_id, vdu))
+                rows.append([needs[r] for r in RESOURCES])
+                instances.append(needs["instances"])
+    return VduBatch(
+        packages, flavours, vdus,
+        np.array(rows, dtype=np.float64).reshape(-1, len(RESOURCES)),
+        np.array(instances, dtype=np.float64),
+        np.array(flavour_start, dtype=np.intp),
+        np.array(package_start, dtype=np.intp),
+    )
+
+
+def _limit_vector(limits: Dict[str, float]) -> List[float]:
+    return [float(limits.get(r, np.inf)) for r in RESOURCES]
+
+
+def zone_limits(zones: Dict[str, Dict[str, Dict[str, float]]] | None = None) -> ZoneLimits:
+    """Limit matrices from ``{zone: {"vdu": {resource: max}, "flavour": {resource: max}}}``.
+
+    Without zones, a single "default" zone with VDU_LIMITS and FLAVOUR_LIMITS is used.
+    """
+    zones = zones or {DEFAULT_ZONE: {"vdu": VDU_LIMITS, "flavour": FLAVOUR_LIMITS}}
+    names = list(zones)
+    return ZoneLimits(
+        names,
+        np.array([_limit_vector(zones[z].get("vdu") or {}) for z in names], dtype=np.float64),
+        np.array([_limit_vector(zones[z].get("flavour") or {}) for z in names], dtype=np.float64),
+    )
+
+
+def load_zone_limits(path: str | None = None) -> ZoneLimits:
+    """Zone limits from a JSON file (see zone_limits), by default the one named in VNF_AGENT_ZONE_LIMITS."""
+    path = path or os.getenv("VNF_AGENT_ZONE_LIMITS")
+    if not path:
+        return zone_limits()
+    with open(path, "r", encoding="utf-8") as fh:
+        return zone_limits(json.load(fh))
+
+
+def evaluate_batch(batch: VduBatch, limits: ZoneLimits) -> Dict[str, np.ndarray]:
+    """Compare every VDU and flavour in the batch against every zone at once.
+
+    Returns boolean masks ``vdu_over`` (vdus, zones, RESOURCES) and
+    ``flavour_over`` (flavours, zones, RESOURCES), the flavour ``totals``
+    (flavours, RESOURCES) and ``package_ok`` (packages, zones): a package fits
+    a zone when none of its VDUs or flavours exceeds a limit there.
+    """
+    n_zones = len(limits.zones)
+    if not batch.packages:
+        empty = np.zeros((0, n_zones, len(RESOURCES)), dtype=bool)
+        return {"vdu_over": empty, "flavour_over": empty,
+                "totals": np.zeros((0, len(RESOURCES))), "package_ok": np.zeros((0, n_zones), dtype=bool)}
+
+    vdu_over = batch.needs[:, None, :] > limits.vdu[None, :, :]
+    totals = np.add.reduceat(batch.needs * batch.instances[:, None], batch.flavour_start, axis=0)
+    flavour_over = totals[:, None, :] > limits.flavour[None, :, :]
+
+    # Every flavour and package has at least one row, so the segments are non-empty
+    flavour_bad = flavour_over.any(axis=2) | np.logical_or.reduceat(vdu_over.any(axis=2), batch.flavour_start, axis=0)
+    package_bad = np.logical_or.reduceat(flavour_bad, batch.package_start, axis=0)
+    return {"vdu_over": vdu_over, "flavour_over": flavour_over, "totals": totals, "package_ok": ~package_bad}
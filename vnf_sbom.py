@@ -0,0 +1,167 @@
+"""Component inventory (SBOM) extraction from package members.
+
+Components are read from CycloneDX and SPDX JSON documents shipped in the
+package and from package-manager metadata found among its members:
+requirements.txt, package-lock.json, Python ``*.dist-info/METADATA``, the
+dpkg status database and the apk installed database (e.g. of a root file
+system tree carried in the package). Each component is reported with its
+ecosystem (lowercase OSV ecosystem name), name and version.
+"""
+import json
+import posixpath
+import re
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple
+from urllib.parse import unquote
+
+from vnf_archive import ArchiveError, ArchiveReader
+
+MAX_SBOM_BYTES = 64 * 1024 * 1024
+
+# purl type -> ecosystem
+PURL_ECOSYSTEMS = {
+    "pypi": "pypi", "npm": "npm", "deb": "debian", "apk": "alpine", "golang": "go", "maven": "maven",
+    "gem": "rubygems", "cargo": "crates.io", "nuget": "nuget", "rpm": "rpm", "composer": "packagist",
+}
+
+
+class Component(NamedTuple):
+    ecosystem: str
+    name: str
+    version: str
+    source: str  # archive member it was found in
+
+
+def parse_purl(purl: str) -> Tuple[str, str, str] | None:
+    """(ecosystem, name, version) from a package URL such as ``pkg:pypi/requests@2.31.0``."""
+    if not purl.startswith("pkg:") or "@" not in purl:
+        return None
+    path, _, version = purl[4:].split("?", 1)[0].split("#", 1)[0].rpartition("@")
+    purl_type, _, rest = path.partition("/")
+    namespace, _, name = rest.rpartition("/")
+    ecosystem = PURL_ECOSYSTEMS.get(purl_type.lower())
+    if ecosystem is None or not name:
+        return None
+    namespace, name = unquote(namespace), unquote(name)
+    if ecosystem == "maven" and namespace:
+        name = f"{namespace}:{name}"
+    elif ecosystem in ("npm", "go") and namespace:
+        name = f"{namespace}/{name}"
+    return ecosystem, name, unquote(version)
+
+
+def _cyclonedx(doc: Dict[str, Any]) -> Iterator[Tuple[str, str, str]]:
+    pending = list(doc.get("components") or [])
+    while pending:
+        component = pending.pop()
+        if not isinstance(component, dict):
+            continue
+        pending.extend(component.get("components") or [])
+        parsed = parse_purl(component.get("purl") or "")
+        if parsed:
+            yield parsed
+
+
+def _spdx(doc: Dict[str, Any]) -> Iterator[Tuple[str, str, str]]:
+    for package in doc.get("packages") or []:
+        for ref in package.get("externalRefs") or []:
+            if ref.get("referenceType") == "purl":
+                parsed = parse_purl(ref.get("referenceLocator") or "")
+                if parsed:
+                    yield parsed
+                    break
+
+
+def _sbom_json(data: bytes) -> Iterator[Tuple[str, str, str]]:
+    doc = json.loads(data)
+    if isinstance(doc, dict) and doc.get("bomFormat") == "CycloneDX":
+        yield from _cyclonedx(doc)
+    elif isinstance(doc, dict) and "spdxVersion" in doc:
+        yield from _spdx(doc)
+
+
+_REQUIREMENT = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)(?:\[[^\]]*\])?\s*===?\s*([^\s;#]+)", re.MULTILINE)
+
+
+def _requirements(data: bytes) -> Iterator[Tuple[str, str, str]]:
+    for name, version in _REQUIREMENT.findall(data.decode("utf-8", errors="replace")):
+        yield "pypi", name, version
+
+
+def _package_lock(data: bytes) -> Iterator[Tuple[str, str, str]]:
+    doc = json.loads(data)
+    packages = doc.get("packages")
+    if isinstance(packages, dict):  # lockfile v2/v3
+        for path, info in packages.items():
+            if path and isinstance(info, dict) and info.get("version"):
+                yield "npm", path.rpartition("node_modules/")[2], info["version"]
+        return
+    pending = list((doc.get("dependencies") or {}).items())  # lockfile v1
+    while pending:
+        name, info = pending.pop()
+        if isinstance(info, dict) and info.get("version"):
+            yield "npm", name, info["version"]
+            pending.extend((info.get("dependencies") or {}).items())
+
+
+def _stanzas(data: bytes) -> Iterator[Dict[str, str]]:
+    """Blank-line separated "Key: Value" records (dpkg status, apk installed, METADATA headers)."""
+    for block in re.split(r"\n\s*\n", data.decode("utf-8", errors="replace")):
+        fields = {}
+        for line in block.splitlines():
+            key, sep, value = line.partition(":")
+            if sep and not line[:1].isspace():
+                fields.setdefault(key.strip(), value.strip())
+        if fields:
+            yield fields
+
+
+def _dist_info(data: bytes) -> Iterator[Tuple[str, str, str]]:
+    fields = next(_stanzas(data), {})
+    if fields.get("Name") and fields.get("Version"):
+        yield "pypi", fields["Name"], fields["Version"]
+
+
+def _dpkg_status(data: bytes) -> Iterator[Tuple[str, str, str]]:
+    for fields in _stanzas(data):
+        if fields.get("Package") and fields.get("Version") and "installed" in fields.get("Status", "installed"):
+            yield "debian", fields["Package"], fields["Version"]
+
+
+def _apk_installed(data: bytes) -> Iterator[Tuple[str, str, str]]:
+    for fields in _stanzas(data):
+        if fields.get("P") and fields.get("V"):
+            yield "alpine", fields["P"], fields["V"]
+
+
+def _parser(name: str) -> Callable[[bytes], Iterator[Tuple[str, str, str]]] | None:
+    lower = name.lower()
+    base = posixpath.basename(lower)
+    if base == "requirements.txt":
+        return _requirements
+    if base == "package-lock.json":
+        return _package_lock
+    if lower.endswith(".dist-info/metadata"):
+        return _dist_info
+    if lower.endswith("var/lib/dpkg/status"):
+        return _dpkg_status
+    if lower.endswith("lib/apk/db/installed"):
+        return _apk_installed
+    if base.endswith((".cdx.json", ".spdx.json")) or (base.endswith(".json") and "bom" in base):
+        return _sbom_json
+    return None
+
+
+def extract_components(reader: ArchiveReader) -> Tuple[List[Component], List[str]]:
+    """Components found in the package, deduplicated, and the members that could not be parsed."""
+    components: Dict[Tuple[str, str, str], Component] = {}
+    errors = []
+    for name in reader.members:
+        parser = _parser(name)
+        if parser is None:
+            continue
+        try:
+            for ecosystem, package, version in parser(reader.read(name, MAX_SBOM_BYTES)):
+                components.setdefault((ecosystem, package, version), Component(ecosystem, package, version, name))
+        except (ArchiveError, ValueError, AttributeError, TypeError) as e:
+            errors.append(f"{name}: {e}")
+    return list(components.values()), errors
@@ -0,0 +1,159 @@
+"""Streaming scan of package members for embedded secrets and credentials.
+
+The literal prefixes of all detectors are compiled into one alternation
+regex that makes a single pass over each chunk, whatever the number of
+detectors. Each candidate it finds is then confirmed by the full detector
+patterns, anchored at that position. Members are streamed in fixed-size
+chunks, and the last OVERLAP bytes of each chunk are carried into the next
+one, so a secret split across a chunk boundary is still found while memory
+stays at about one chunk per worker whatever the member size. Members are
+spread across a process pool for random-access archives (zip, plain tar).
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Tuple
+
+from vnf_archive import ArchiveReader, open_archive
+from vnf_executor import process_context
+
+CHUNK_SIZE = 1024 * 1024
+# Longer than any detector can match, so no match is lost at a chunk boundary
+OVERLAP = 1024
+MAX_FINDINGS_PER_MEMBER = 20
+# Below this many bytes a process pool costs more than it saves
+PARALLEL_THRESHOLD = 32 * 1024 * 1024
+SCAN_WORKERS = int(os.getenv("VNF_AGENT_SCAN_WORKERS", "0")) or os.cpu_count() or 1
+
+# Members with these suffixes are binary payloads and are not scanned
+BINARY_SUFFIXES = (
+    ".qcow2", ".img", ".vmdk", ".vhd", ".vhdx", ".iso", ".raw", ".ova",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".rar", ".jar", ".png", ".jpg", ".jpeg", ".gif", ".pdf", ".so", ".bin",
+)
+# A NUL byte in the first chunk marks any other member as binary
+_BINARY_SNIFF = b"\x00"
+
+# name -> (lowercase literal prefixes, pattern); every quantifier is bounded so matches stay shorter than OVERLAP
+DETECTORS = {
+    "private_key": (
+        ("-----begin ",),
+        rb"-----BEGIN (?:RSA |EC |DSA |OPENSSH |ENCRYPTED |PGP )?PRIVATE KEY(?: BLOCK)?-----",
+    ),
+    "aws_access_key": (("akia", "asia"), rb"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b"),
+    "aws_secret_key": (
+        ("aws_secret_access_key",),
+        rb"(?i:aws_secret_access_key)\s*[:=]\s*[\"']?[A-Za-z0-9/+]{40}\b",
+    ),
+    "github_token": (("ghp_", "gho_", "ghu_", "ghs_", "ghr_"), rb"\bgh[pousr]_[A-Za-z0-9]{36,255}\b"),
+    "slack_token": (("xox",), rb"\bxox[abprs]-[0-9A-Za-z-]{10,200}"),
+    "google_api_key": (("aiza",), rb"\bAIza[0-9A-Za-z_-]{35}\b"),
+    "azure_storage_key": (("accountkey=",), rb"AccountKey=[A-Za-z0-9+/]{86}=="),
+    # No word boundary before the keyword: prefixed keys such as db_password or rootPwd count too
+    "default_password": (
+        ("password", "passwd", "pwd", "admin_pass"),
+        rb"(?i:(?:password|passwd|pwd|admin_pass(?:word)?)\s*[:=]\s*[\"']?"
+        rb"(?:admin|password|changeme|default|root|toor|123456|12345678|secret|cisco|juniper)[\"']?(?=\s|$|[,;}]))",
+    ),
+    "generic_secret": (
+        ("api_key", "api-key", "apikey", "secret_key", "secret-key", "secretkey", "client_secret", "client-secret",
+         "clientsecret", "access_token", "access-token", "accesstoken", "auth_token", "auth-token", "authtoken"),
+        rb"(?i:\b(?:api[_-]?key|secret[_-]?key|client[_-]?secret|access[_-]?token|auth[_-]?token)\s*[:=]\s*)"
+        rb"[\"'][A-Za-z0-9/+_=-]{16,256}[\"']",
+    ),
+}
+# One pass over the lowercased text finds every candidate position. The alternation is made of plain
+# literals only, which lets the regex engine skip ahead on their first bytes.
+TRIGGER_PATTERN = re.compile(b"|".join(
+    re.escape(t.encode()) for t in sorted({t for triggers, _ in DETECTORS.values() for t in triggers}, key=len, reverse=True)
+))
+# Candidates are confirmed on the original bytes, anchored at the trigger position
+SECRET_PATTERN = re.compile(b"|".join(b"(?P<%s>%s)" % (name.encode(), p) for name, (_, p) in DETECTORS.items()),
+                            re.MULTILINE)
+
+
+def _redact(value: bytes) -> str:
+    text = value.decode("utf-8", errors="replace")
+    return text[:4] + "..." if len(text) > 8 else "..."
+
+
+def scan_stream(chunks: Iterator[bytes], limit: int = MAX_FINDINGS_PER_MEMBER) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """Scan a byte stream chunk by chunk. Returns (findings, bytes scanned, binary).
+
+    Matches starting in the carried-over tail are reported from the next
+    chunk, where they are complete; nothing is reported twice.
+    """
+    findings: List[Dict[str, Any]] = []
+    tail, base, lines, scanned, reported_end = b"", 0, 1, 0, 0
+    for chunk in chunks:
+        if not scanned and _BINARY_SNIFF in chunk[:8192]:
+            return [], 0, True
+        scanned += len(chunk)
+        buf = tail + chunk
+        for finding in _matches(buf, base, lines, len(buf) - OVERLAP, reported_end):
+            findings.append(finding)
+            reported_end = finding["end"]
+        if len(findings) >= limit:
+            return findings[:limit], scanned, False
+        tail = buf[-OVERLAP:]
+        lines += buf.count(b"\n", 0, len(buf) - len(tail))
+        base += len(buf) - len(tail)
+    findings.extend(_matches(tail, base, lines, len(tail), reported_end))
+    return findings[:limit], scanned, False
+
+
+def _matches(buf: bytes, base: int, lines: int, stop: int, reported_end: int) -> Iterator[Dict[str, Any]]:
+    """Matches in buf starting before stop and after the last reported match; base/lines locate buf[0]."""
+    skip_to = reported_end - base
+    for trigger in TRIGGER_PATTERN.finditer(buf.lower()):
+        start = trigger.start()
+        if start >= stop:
+            break
+        if start < skip_to:
+            continue
+        match = SECRET_PATTERN.match(buf, start)
+        if match is None:
+            continue
+        skip_to = match.end()
+        yield {"detector": match.lastgroup, "offset": base + start, "end": base + match.end(),
+               "line": lines + buf.count(b"\n", 0, start), "preview": _redact(match.group())}
+
+
+def _scan_member(path: str, member: str) -> Tuple[str, List[Dict[str, Any]], int, bool]:
+    """Worker: scan one member of the archive at path."""
+    findings, scanned, binary = scan_stream(open_archive(path).iter_chunks(member, CHUNK_SIZE))
+    return member, findings, scanned, binary
+
+
+def _scannable(name: str) -> bool:
+    return not name.lower().endswith(BINARY_SUFFIXES)
+
+
+def scan_archive(reader: ArchiveReader, workers: int = SCAN_WORKERS) -> Dict[str, Any]:
+    """Scan every text-like member of a package for secrets.
+
+    Returns ``findings`` (member, detector, byte offset, redacted preview),
+    and counts of ``scanned`` members, ``skipped`` binary members and ``bytes``.
+    """
+    members = [m for m in reader.members.values() if _scannable(m.name)]
+    report: Dict[str, Any] = {"findings": [], "scanned": 0, "skipped": len(reader.members) - len(members), "bytes": 0}
+
+    def add(member, findings, scanned, binary):
+        report["skipped" if binary else "scanned"] += 1
+        report["bytes"] += scanned
+        report["findings"].extend(dict(f, member=member) for f in findings)
+
+    total = sum(m.size for m in members)
+    random_access = reader.format == "zip" or all(m.compression == "none" for m in members)
+    if workers <= 1 or len(members) <= 1 or total < PARALLEL_THRESHOLD or not random_access:
+        for m in members:
+            add(m.name, *scan_stream(reader.iter_chunks(m.name, CHUNK_SIZE)))
+        return report
+
+    # Called from tool threads: fork-started workers could inherit locks held by the other threads
+    with ProcessPoolExecutor(max_workers=min(workers, len(members)), mp_context=process_context(_scan_member)) as pool:
+        # Largest members first so the pool is not left waiting on one big file at the end
+        futures = [pool.submit(_scan_member, reader.path, m.name) for m in sorted(members, key=lambda m: -m.size)]
+        for future in as_completed(futures):
+            add(*future.result())
+    report["findings"].sort(key=lambda f: (f["member"], f["offset"]))
+    return report
@@ -0,0 +1,269 @@
+"""SOL004 manifest signature (CMS) and X.509 chain verification.
+
+The CMS block at the end of the manifest is checked against the manifest
+content, and the signer's certificate chain is built from the certificates
+in the CMS block and the package's .cert file up to a trust anchor from the
+local PEM bundle named in VNF_AGENT_TRUST_ANCHORS.
+
+Chain validation is cached by certificate fingerprint (SHA-256 of the DER),
+both for the signer and for every intermediate: a signer certificate seen
+before costs one dictionary lookup, and a new signer under an already
+validated intermediate costs one signature check. Entries expire with the
+earliest ``not_valid_after`` in their chain, and the cache is dropped when
+the anchor bundle changes. Per-package work is therefore one digest and one
+signature verification.
+
+Needs the optional ``cryptography`` and ``asn1crypto`` packages; without
+them signatures are reported as ``unchecked``.
+"""
+import base64
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+try:
+    from asn1crypto import cms as asn1_cms
+    from cryptography import x509
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+except ImportError:  # optional dependencies
+    x509 = None
+
+MAX_CHAIN_DEPTH = 8
+CMS_BEGIN = b"-----BEGIN CMS-----"
+CMS_END = b"-----END CMS-----"
+
+
+class SignatureError(Exception):
+    """The manifest signature or the signer's certificate chain is not valid."""
+
+
+def _fingerprint(cert) -> bytes:
+    return cert.fingerprint(hashes.SHA256())
+
+
+def _load_pem_certificates(data: bytes) -> List[Any]:
+    return x509.load_pem_x509_certificates(data) if b"-----BEGIN CERTIFICATE-----" in data else []
+
+
+class ChainValidator:
+    """Validates certificate chains up to a set of trust anchors, caching results by fingerprint.
+
+    ``error`` says why the anchors could not be loaded; such a validator leaves signatures unchecked.
+    """
+
+    def __init__(self, anchors: List[Any], fingerprint: str = "", error: str | None = None):
+        self.fingerprint = fingerprint
+        self.error = error
+        self.anchors = {_fingerprint(c): c for c in anchors}
+        self._anchors_by_subject: Dict[bytes, List[Any]] = {}
+        for cert in anchors:
+            self._anchors_by_subject.setdefault(cert.subject.public_bytes(), []).append(cert)
+        # fingerprint -> (expiry of the validated chain, anchor subject) / fingerprint -> failure reason
+        self._valid: Dict[bytes, Tuple[datetime, str]] = {}
+        self._invalid: Dict[bytes, str] = {}
+        self.validations = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def validate(self, leaf, intermediates: List[Any]) -> Tuple[str, datetime]:
+        """(subject of the trust anchor the leaf chains up to, expiry of the chain). Raises SignatureError."""
+        now = datetime.now(timezone.utc)
+        pool: Dict[bytes, List[Any]] = {}
+        for cert in intermediates:
+            pool.setdefault(cert.subject.public_bytes(), []).append(cert)
+
+        chain, cert = [], leaf
+        with self._lock:
+            for _ in range(MAX_CHAIN_DEPTH):
+                fp = _fingerprint(cert)
+                cached = self._valid.get(fp)
+                if cached is not None and cached[0] >= now:
+                    self.cache_hits += 1
+                    return self._remember(chain, cached[0], cached[1])
+                if fp in self._invalid:
+                    self.cache_hits += 1
+                    raise SignatureError(self._invalid[fp])
+                self.validations += 1
+                if not cert.not_valid_before_utc <= now <= cert.not_valid_after_utc:
+                    raise SignatureError(f"certificate '{cert.subject.rfc4514_string()}' is expired or not yet valid")
+                chain.append(cert)
+                if fp in self.anchors:
+                    return self._remember(chain, cert.not_valid_after_utc, cert.subject.rfc4514_string())
+                issuer = self._issuer(cert, pool)
+                if issuer is None:
+                    # Not cached: another package may carry the missing intermediate
+                    raise SignatureError(f"no trusted issuer for '{cert.issuer.rfc4514_string()}'")
+                if _fingerprint(issuer) not in self.anchors and not _is_ca(issuer):
+                    raise self._reject(chain, f"issuer '{issuer.subject.rfc4514_string()}' is not a CA")
+                cert = issuer
+            raise self._reject(chain, "certificate chain is too long")
+
+    def _issuer(self, cert, pool: Dict[bytes, List[Any]]):
+        issuer_name = cert.issuer.public_bytes()
+        for candidate in self._anchors_by_subject.get(issuer_name, []) + pool.get(issuer_name, []):
+            try:
+                cert.verify_directly_issued_by(candidate)
+                return candidate
+            except (ValueError, TypeError, InvalidSignature):
+                continue
+        return None
+
+    def _remember(self, chain: List[Any], expiry: datetime, anchor: str) -> Tuple[str, datetime]:
+        # Walk down from the anchor side so each certificate expires with the earliest certificate above it
+        for cert in reversed(chain):
+            expiry = min(expiry, cert.not_valid_after_utc)
+            self._valid[_fingerprint(cert)] = (expiry, anchor)
+        return anchor, expiry
+
+    def _reject(self, chain: List[Any], reason: str) -> SignatureError:
+        # The chain runs from the leaf up to the failing certificate, and all of them depend on it
+        for cert in chain:
+            self._invalid[_fingerprint(cert)] = reason
+        return SignatureError(reason)
+
+
+def _is_ca(cert) -> bool:
+    try:
+        return cert.extensions.get_extension_for_class(x509.BasicConstraints).value.ca
+    except x509.ExtensionNotFound:
+        return False
+
+
+_validator: Dict[str, Any] = {}
+_validator_lock = threading.Lock()
+
+
+def chain_validator(path: str | None = None) -> ChainValidator | None:
+    """Validator for the PEM bundle named in VNF_AGENT_TRUST_ANCHORS, rebuilt when the file changes.
+
+    An unreadable bundle gives a validator with ``error`` set rather than raising.
+    """
+    path = path or os.getenv("VNF_AGENT_TRUST_ANCHORS")
+    if not path or x509 is None:
+        return None
+    try:
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with _validator_lock:
+            if _validator.get("stamp") != stamp:
+                with open(path, "rb") as fh:
+                    raw = fh.read()
+                _validator.update(stamp=stamp, validator=ChainValidator(_load_pem_certificates(raw),
+                                                                        hashlib.sha256(raw).hexdigest()))
+            return _validator["validator"]
+    except OSError as e:
+        return ChainValidator([], "unreadable", f"trust anchors '{path}' cannot be read ({e.strerror or e})")
+    except ValueError as e:
+        return ChainValidator([], "unreadable", f"trust anchors '{path}' are not valid PEM ({e})")
+
+
+def _signer_certificate(signer, certificates: List[Any]):
+    sid = signer["sid"]
+    if sid.name == "issuer_and_serial_number":
+        issuer, serial = sid.chosen["issuer"].dump(), sid.chosen["serial_number"].native
+        for cert in certificates:
+            if cert.serial_number == serial and cert.issuer.public_bytes() == issuer:
+                return cert
+    else:
+        key_id = sid.chosen.native
+        for cert in certificates:
+            try:
+                if cert.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value.digest == key_id:
+                    return cert
+            except x509.ExtensionNotFound:
+                continue
+    return None
+
+
+_HASHES = {"sha256": "SHA256", "sha384": "SHA384", "sha512": "SHA512", "sha1": "SHA1"}
+
+
+def _verify_signer(signer, cert, content: bytes) -> None:
+    digest_name = signer["digest_algorithm"]["algorithm"].native
+    if digest_name not in _HASHES:
+        raise SignatureError(f"unsupported digest algorithm '{digest_name}'")
+    algorithm = getattr(hashes, _HASHES[digest_name])()
+    signed_attrs = signer["signed_attrs"]
+    data = content
+    if signed_attrs.native:
+        expected = next((a["values"][0].native for a in signed_attrs if a["type"].native == "message_digest"), None)
+        if expected != hashlib.new(digest_name, content).digest():
+            raise SignatureError("manifest content does not match the signed digest")
+        # The signature covers the attributes re-encoded as a SET, not with their [0] IMPLICIT tag
+        data = b"\x31" + signed_attrs.dump()[1:]
+    signature = signer["signature"].native
+    key = cert.public_key()
+    try:
+        if isinstance(key, rsa.RSAPublicKey):
+            if signer["signature_algorithm"].signature_algo == "rsassa_pss":
+                pad = padding.PSS(mgf=padding.MGF1(algorithm), salt_length=padding.PSS.AUTO)
+            else:
+                pad = padding.PKCS1v15()
+            key.verify(signature, data, pad, algorithm)
+        elif isinstance(key, ec.EllipticCurvePublicKey):
+            key.verify(signature, data, ec.ECDSA(algorithm))
+        elif isinstance(key, ed25519.Ed25519PublicKey):
+            key.verify(signature, data)
+        else:
+            raise SignatureError(f"unsupported signer key type {type(key).__name__}")
+    except InvalidSignature:
+        raise SignatureError("signature does not match the manifest") from None
+
+
+def verify_manifest_signature(manifest_bytes: bytes, package_certificates: bytes = b"",
+                              validator: ChainValidator | None = None) -> Dict[str, Any]:
+    """Verify the CMS signature embedded in a SOL004 manifest.
+
+    Returns ``status`` "verified", "unsigned", "invalid" or "unchecked"
+    (missing libraries or trust anchors) with ``reason``, and for signed
+    manifests the ``signer`` subject and its ``organization``. A verified
+    signature also has ``valid_until``, the ISO time its chain expires.
+    """
+    start = manifest_bytes.find(CMS_BEGIN)
+    if start == -1:
+        return {"status": "unsigned", "reason": "Manifest has no CMS signature."}
+    if x509 is None:
+        return {"status": "unchecked", "reason": "Signature not checked: install cryptography and asn1crypto."}
+    end = manifest_bytes.find(CMS_END, start)
+    try:
+        body = manifest_bytes[start + len(CMS_BEGIN):end if end != -1 else None]
+        signed = asn1_cms.ContentInfo.load(base64.b64decode(b"".join(body.split())))["content"]
+        certificates = [x509.load_der_x509_certificate(c.chosen.dump())
+                        for c in signed["certificates"] or [] if c.name == "certificate"]
+        certificates += _load_pem_certificates(package_certificates)
+        signers = list(signed["signer_infos"])
+        if not signers:
+            raise SignatureError("CMS block has no signer")
+        content = manifest_bytes[:start]
+        results = []
+        for signer in signers:
+            cert = _signer_certificate(signer, certificates)
+            if cert is None:
+                raise SignatureError("signer certificate not found in the CMS block or the package")
+            _verify_signer(signer, cert, content)
+            results.append(cert)
+    except SignatureError as e:
+        return {"status": "invalid", "reason": f"Invalid manifest signature: {e}."}
+    except (ValueError, TypeError, KeyError) as e:
+        return {"status": "invalid", "reason": f"Malformed CMS signature: {e}."}
+
+    cert = results[0]
+    organization = cert.subject.get_attributes_for_oid(x509.NameOID.ORGANIZATION_NAME) or \
+        cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    report = {"signer": cert.subject.rfc4514_string(),
+              "organization": organization[0].value if organization else None}
+    if validator is None:
+        return dict(report, status="unchecked", reason="Signature matches, but no trust anchors are configured.")
+    if validator.error:
+        return dict(report, status="unchecked", reason=f"Signature matches, but {validator.error}.")
+    try:
+        chains = [validator.validate(signer_cert, certificates) for signer_cert in results]
+    except SignatureError as e:
+        return dict(report, status="invalid", reason=f"Untrusted signer certificate: {e}.")
+    anchor = chains[-1][0]
+    return dict(report, status="verified", valid_until=min(expiry for _, expiry in chains).isoformat(),
+                reason=f"Manifest signed by '{report['signer']}', chaining to '{anchor}'.")
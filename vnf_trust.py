@@ -0,0 +1,165 @@
+"""Vendor trust store for check_security_compliance.
+
+Trusted vendors, their aliases, per-product exceptions and revocations are
+loaded from a JSON file and compiled into lookup tables: an exact dict keyed
+by the normalized name, and a token trie that resolves longer provider
+strings ("Cisco Systems, Inc.") to the longest alias they start with. A
+compiled store is immutable. When the file changes, a new store is built
+and swapped in with a single assignment, so concurrent lookups see either
+the old store or the new one, never a mix.
+
+File format::
+
+    {"vendors": {"paloalto": {"aliases": ["Palo Alto Networks"],
+                              "revoked_products": ["pa200"]},
+                 "acme": {"trusted": false, "allowed_products": ["fw"]}},
+     "revoked": ["oldvendor"]}
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Tuple
+
+from vnf_log import log
+
+# Used when VNF_AGENT_TRUST_STORE is not set
+BUILTIN_VENDORS = {"vendors": {"cisco": {}, "juniper": {}, "paloalto": {}}}
+# Seconds between checks of the trust store file for changes
+CHECK_INTERVAL = float(os.getenv("VNF_AGENT_TRUST_STORE_CHECK_SECONDS", "1"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_END = None  # trie key marking the end of an alias
+
+
+def _tokens(name: str) -> Tuple[str, ...]:
+    return tuple(_TOKEN.findall(name.lower()))
+
+
+def normalize(name: str) -> str:
+    """Case, spacing and punctuation insensitive key: "Palo-Alto" -> "paloalto"."""
+    return "".join(_tokens(name))
+
+
+class TrustDecision(NamedTuple):
+    trusted: bool
+    vendor: str | None  # canonical vendor name, None if unknown
+    reason: str
+
+
+class _Vendor(NamedTuple):
+    name: str
+    trusted: bool
+    revoked_products: frozenset
+    allowed_products: frozenset
+
+
+class TrustStore:
+    """Compiled, read-only vendor trust tables."""
+
+    __slots__ = ("fingerprint", "_vendors", "_exact", "_trie")
+
+    def __init__(self, data: Dict[str, Any], fingerprint: str = ""):
+        self.fingerprint = fingerprint
+        self._vendors: Dict[str, _Vendor] = {}
+        self._exact: Dict[str, str] = {}
+        self._trie: Dict[Any, Any] = {}
+        revoked = {normalize(v) for v in data.get("revoked") or []}
+        for name, entry in (data.get("vendors") or {}).items():
+            entry = entry or {}
+            key = normalize(name)
+            self._vendors[key] = _Vendor(
+                name,
+                bool(entry.get("trusted", True)) and not entry.get("revoked") and key not in revoked,
+                frozenset(normalize(p) for p in entry.get("revoked_products") or []),
+                frozenset(normalize(p) for p in entry.get("allowed_products") or []),
+            )
+            for alias in [name, *(entry.get("aliases") or [])]:
+                self._exact[normalize(alias)] = key
+                node = self._trie
+                for token in _tokens(alias):
+                    node = node.setdefault(token, {})
+                node[_END] = key
+
+    def __len__(self) -> int:
+        return len(self._vendors)
+
+    def resolve(self, name: str, prefix: bool = False) -> str | None:
+        """Canonical vendor for a name or alias. With ``prefix``, also the longest alias the name starts with."""
+        key = self._exact.get(normalize(name))
+        if key is not None or not prefix:
+            return key
+        node = self._trie
+        for token in _tokens(name):
+            node = node.get(token)
+            if node is None:
+                break
+            key = node.get(_END, key)
+        return key
+
+    def check(self, vendor: str, product: str | None = None) -> TrustDecision:
+        """Whether packages of ``vendor`` (and ``product``) are trusted. Vendor names must match exactly."""
+        key = self.resolve(vendor)
+        if key is None:
+            return TrustDecision(False, None, f"Vendor '{vendor}' is not trusted.")
+        entry = self._vendors[key]
+        product_key = normalize(product or "")
+        if entry.trusted:
+            if product_key and product_key in entry.revoked_products:
+                return TrustDecision(False, key, f"Product '{product}' of vendor '{entry.name}' has been revoked.")
+            return TrustDecision(True, key, f"Vendor '{entry.name}' is trusted.")
+        if product_key and product_key in entry.allowed_products:
+            return TrustDecision(True, key, f"Product '{product}' of vendor '{entry.name}' is trusted by exception.")
+        return TrustDecision(False, key, f"Vendor '{entry.name}' has been revoked.")
+
+    def same_vendor(self, name: str, provider: str) -> bool:
+        """True if a manifest provider string names the same vendor (aliases and prefixes included)."""
+        a, b = self.resolve(name, prefix=True), self.resolve(provider, prefix=True)
+        return (a or normalize(name)) == (b or normalize(provider))
+
+
+# (path, (size, mtime), last checked, store), replaced as a whole on reload
+_state: Tuple[Any, Any, float, TrustStore | None] = (None, None, 0.0, None)
+_reload_lock = threading.Lock()
+
+
+def _read_store(path: str) -> TrustStore:
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    return TrustStore(json.loads(raw), fingerprint=hashlib.sha256(raw).hexdigest())
+
+
+def trust_store(path: str | None = None) -> TrustStore:
+    """Current trust store for VNF_AGENT_TRUST_STORE (built-in vendors when unset).
+
+    The file is checked for changes at most every CHECK_INTERVAL seconds and
+    reloaded when its size or modification time differs. If a reload fails,
+    the previous store stays in use.
+    """
+    global _state
+    path = path or os.getenv("VNF_AGENT_TRUST_STORE") or None
+    state_path, stamp, checked, store = _state
+    now = time.monotonic()
+    if store is not None and state_path == path and (path is None or now - checked < CHECK_INTERVAL):
+        return store
+    with _reload_lock:
+        state_path, stamp, checked, store = _state
+        if path is None:
+            if store is None or state_path is not None:
+                store = TrustStore(BUILTIN_VENDORS, fingerprint="builtin")
+            _state = (None, None, now, store)
+            return store
+        try:
+            st = os.stat(path)
+            new_stamp = (st.st_size, st.st_mtime_ns)
+            if store is None or state_path != path or new_stamp != stamp:
+                store, stamp = _read_store(path), new_stamp
+                log(f"--- TOOL LOG: Loaded trust store '{path}' ({len(store)} vendors).")
+        except (OSError, ValueError) as e:
+            if store is None or state_path != path:
+                raise
+            log(f"WARN: Keeping the current trust store, cannot reload '{path}': {e}")
+        _state = (path, stamp, now, store)
+        return store
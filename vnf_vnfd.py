@@ -0,0 +1,268 @@
+"""VNFD (ETSI SOL001 TOSCA YAML) loading and resource extraction.
+
+Descriptors are parsed with libyaml's C loader when PyYAML was built with it.
+Imports are resolved relative to the importing file, and each archive member
+is parsed once per package even when several files import it. Parsed
+documents are cached in-process by the SHA-256 of the member's bytes, so
+packages that share common type definitions (or the same package checked
+twice) skip the YAML parse entirely. Cached documents are shared: treat them
+as read-only.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from vnf_archive import ArchiveReader
+
+MAX_DESCRIPTOR_BYTES = 32 * 1024 * 1024
+PARSED_CACHE_ENTRIES = int(os.getenv("VNF_AGENT_VNFD_CACHE_ENTRIES", "512"))
+
+VNF_NODE = "tosca.nodes.nfv.VNF"
+VDU_COMPUTE = "tosca.nodes.nfv.Vdu.Compute"
+VDU_CP = "tosca.nodes.nfv.VduCp"
+VDU_INITIAL_DELTA = "tosca.policies.nfv.VduInitialDelta"
+VDU_INSTANTIATION_LEVELS = "tosca.policies.nfv.VduInstantiationLevels"
+INSTANTIATION_LEVELS = "tosca.policies.nfv.InstantiationLevels"
+ANTI_AFFINITY_RULE = "tosca.policies.nfv.AntiAffinityRule"
+
+
+class VnfdError(Exception):
+    """A descriptor in the package is not valid YAML."""
+
+
+_parsed: "OrderedDict[str, Any]" = OrderedDict()
+_parsed_lock = threading.Lock()
+
+
+def _parse_member(reader: ArchiveReader, member: str) -> Any:
+    data = reader.read(member, MAX_DESCRIPTOR_BYTES)
+    digest = hashlib.sha256(data).hexdigest()
+    with _parsed_lock:
+        if digest in _parsed:
+            _parsed.move_to_end(digest)
+            return _parsed[digest]
+    import yaml  # on first parse: importing the agent should not cost the YAML import
+    try:
+        # libyaml-backed loader is an order of magnitude faster on large descriptors
+        doc = yaml.load(data, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        raise VnfdError(f"Cannot parse '{member}': {e}") from e
+    with _parsed_lock:
+        _parsed[digest] = doc
+        while len(_parsed) > PARSED_CACHE_ENTRIES:
+            _parsed.popitem(last=False)
+    return doc
+
+
+def _imports(doc: Any) -> List[str]:
+    """Import file names from a TOSCA ``imports`` section (plain strings or file: definitions)."""
+    found = []
+    for item in (doc.get("imports") or []) if isinstance(doc, dict) else []:
+        if isinstance(item, str):
+            found.append(item)
+        elif isinstance(item, dict):
+            if isinstance(item.get("file"), str):
+                found.append(item["file"])
+            else:  # TOSCA 1.0 style: {name: file} or {name: {file: ...}}
+                for value in item.values():
+                    if isinstance(value, str):
+                        found.append(value)
+                    elif isinstance(value, dict) and isinstance(value.get("file"), str):
+                        found.append(value["file"])
+    return found
+
+
+def load_vnfd(reader: ArchiveReader, entry: str) -> Dict[str, Any]:
+    """Parse the entry definitions and every import found in the archive.
+
+    Returns ``{"entry": entry, "documents": {member: parsed document}}``.
+    Imports that are not archive members (e.g. URLs of the SOL001 type
+    definitions) are listed under ``"external"``. Raises VnfdError.
+    """
+    documents: Dict[str, Any] = {}
+    external: List[str] = []
+    pending = [entry]
+    while pending:
+        member = pending.pop()
+        if member in documents:
+            continue
+        doc = _parse_member(reader, member)
+        documents[member] = doc
+        for name in _imports(doc):
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(member), name))
+            if target in reader.members:
+                if target not in documents:
+                    pending.append(target)
+            elif name not in external:
+                external.append(name)
+    return {"entry": entry, "documents": documents, "external": external}
+
+
+# --- RESOURCE EXTRACTION ---
+_SIZE_UNITS = {
+    "b": 1, "kb": 10 ** 3, "kib": 2 ** 10, "mb": 10 ** 6, "mib": 2 ** 20,
+    "gb": 10 ** 9, "gib": 2 ** 30, "tb": 10 ** 12, "tib": 2 ** 40,
+}
+_SCALAR = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]+)?\s*$")
+
+
+def scalar_size_bytes(value: Any) -> int:
+    """Bytes in a TOSCA scalar-unit.size such as "8 GB" or "512 MiB"; bare numbers are bytes."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = _SCALAR.match(str(value or ""))
+    if not match:
+        return 0
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS.get((unit or "b").lower(), 1))
+
+
+def _node_type(node: Any) -> str:
+    return node.get("type", "") if isinstance(node, dict) else ""
+
+
+def _derivations(documents: Dict[str, Any]) -> Dict[str, str]:
+    """type name -> derived_from for every node/policy type defined in the package."""
+    parents = {}
+    for doc in documents.values():
+        if not isinstance(doc, dict):
+            continue
+        for section in ("node_types", "policy_types"):
+            for name, body in (doc.get(section) or {}).items():
+                if isinstance(body, dict) and isinstance(body.get("derived_from"), str):
+                    parents[name] = body["derived_from"]
+    return parents
+
+
+def _is_type(node: Any, tosca_type: str, parents: Dict[str, str]) -> bool:
+    """True if the node/policy is of tosca_type or of a vendor type derived from it."""
+    node_type, seen = _node_type(node), set()
+    while node_type and node_type not in seen:
+        if node_type == tosca_type:
+            return True
+        seen.add(node_type)
+        node_type = parents.get(node_type)
+    return False
+
+
+def _requirements(node: Dict[str, Any], name: str) -> List[str]:
+    targets = []
+    for req in node.get("requirements") or []:
+        if isinstance(req, dict) and name in req:
+            value = req[name]
+            targets.append(value.get("node") if isinstance(value, dict) else value)
+    return [t for t in targets if isinstance(t, str)]
+
+
+def _policies(topology: Dict[str, Any]) -> List[Dict[str, Any]]:
+    raw = topology.get("policies") or []
+    items = raw.items() if isinstance(raw, dict) else (kv for p in raw if isinstance(p, dict) for kv in p.items())
+    return [dict(body, name=name) for name, body in items if isinstance(body, dict)]
+
+
+def _flavour_id(topology: Dict[str, Any], nodes: Dict[str, Any], parents: Dict[str, str]) -> str:
+    mapping = topology.get("substitution_mappings") or {}
+    flavour = (mapping.get("properties") or {}).get("flavour_id") if isinstance(mapping, dict) else None
+    if not flavour:
+        for node in nodes.values():
+            props = node.get("properties") if isinstance(node, dict) else None
+            if isinstance(props, dict) and props.get("flavour_id") and _is_type(node, VNF_NODE, parents):
+                flavour = props["flavour_id"]
+                break
+    return str(flavour or "default")
+
+
+def _vdu_resources(node: Dict[str, Any], nodes: Dict[str, Any]) -> Dict[str, Any]:
+    caps = (node.get("capabilities") or {}).get("virtual_compute") or {}
+    props = caps.get("properties") or {}
+    cpu = props.get("virtual_cpu") or {}
+    memory = props.get("virtual_memory") or {}
+    memory_mib = scalar_size_bytes(memory.get("virtual_mem_size")) / 2 ** 20
+
+    mem_reqs = memory.get("vdu_mem_requirements") or {}
+    page_size = str(mem_reqs.get("memoryPageSize") or mem_reqs.get("hw:mem_page_size") or "").lower()
+    hugepages = page_size in {"large", "huge"} or scalar_size_bytes(page_size) >= 2 * 2 ** 20
+
+    storage = sum(scalar_size_bytes(s.get("size_of_storage")) for s in props.get("virtual_local_storage") or []
+                  if isinstance(s, dict))
+    for target in _requirements(node, "virtual_storage"):
+        block = nodes.get(target) or {}
+        data = (block.get("properties") or {}).get("virtual_block_storage_data") or {}
+        storage += scalar_size_bytes(data.get("size_of_storage"))
+
+    return {
+        "vcpu": int(cpu.get("num_virtual_cpu") or 0),
+        "memory_mib": memory_mib,
+        "hugepages_mib": memory_mib if hugepages else 0.0,
+        "storage_gib": storage / 2 ** 30,
+        "nics": 0,
+        "instances": 1,
+        "levels": {},
+        "anti_affinity": None,
+    }
+
+
+def extract_resources(vnfd: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Per-deployment-flavour compute, memory and storage needs from a loaded VNFD.
+
+    Returns ``{flavour_id: {"vdus": {vdu: needs}, "totals": needs, "default_level": level}}``
+    where needs are vcpu, memory_mib, hugepages_mib, storage_gib and nics per
+    instance (per VDU) and multiplied by the initial instance count (totals).
+    Each VDU also carries its ``instances``, per-instantiation-level
+    instance counts (``levels``) and the host ``anti_affinity`` rule it is
+    subject to, if any.
+    """
+    flavours: Dict[str, Dict[str, Any]] = {}
+    parents = _derivations(vnfd["documents"])
+    for doc in vnfd["documents"].values():
+        topology = doc.get("topology_template") if isinstance(doc, dict) else None
+        if not isinstance(topology, dict):
+            continue
+        nodes = topology.get("node_templates") or {}
+        vdus = {name: _vdu_resources(node, nodes) for name, node in nodes.items() if _is_type(node, VDU_COMPUTE, parents)}
+        if not vdus:
+            continue
+
+        for node in nodes.values():
+            if _is_type(node, VDU_CP, parents):
+                for target in _requirements(node, "virtual_binding"):
+                    if target in vdus:
+                        vdus[target]["nics"] += 1
+
+        groups = topology.get("groups") or {}
+        default_level = None
+        for policy in _policies(topology):
+            props = policy.get("properties") or {}
+            targets = []
+            for target in policy.get("targets") or []:
+                group = groups.get(target) if isinstance(groups, dict) else None
+                members = group.get("members") if isinstance(group, dict) else None
+                targets.extend(t for t in (members or [target]) if t in vdus)
+            if _is_type(policy, VDU_INITIAL_DELTA, parents):
+                count = (props.get("initial_delta") or {}).get("number_of_instances")
+                for t in targets:
+                    vdus[t]["instances"] = int(count or 1)
+            elif _is_type(policy, VDU_INSTANTIATION_LEVELS, parents):
+                levels = {str(k): int((v or {}).get("number_of_instances") or 0)
+                          for k, v in (props.get("levels") or {}).items()}
+                for t in targets:
+                    vdus[t]["levels"] = levels
+            elif _is_type(policy, INSTANTIATION_LEVELS, parents):
+                default_level = props.get("default_level")
+            elif _is_type(policy, ANTI_AFFINITY_RULE, parents) and props.get("scope", "nfvi_node") == "nfvi_node":
+                # Instances of all targeted VDUs must land on distinct hosts
+                for t in targets:
+                    vdus[t]["anti_affinity"] = policy["name"]
+        if default_level is not None:
+            for needs in vdus.values():
+                if str(default_level) in needs["levels"]:
+                    needs["instances"] = needs["levels"][str(default_level)]
+
+        totals = {key: sum(v[key] * v["instances"] for v in vdus.values())
+                  for key in ("vcpu", "memory_mib", "hugepages_mib", "storage_gib", "nics")}
+        flavours[_flavour_id(topology, nodes, parents)] = {"vdus": vdus, "totals": totals, "default_level": default_level}
+    return flavours